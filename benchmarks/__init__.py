@@ -0,0 +1,25 @@
+"""
+Benchmarks for the API, see docs/PERFORMANCE.md.
+
+    $ python -m benchmarks run --planets 5000 --output before.json    # every route, Flask test client
+    $ python -m benchmarks run --http --concurrency 16 --output before.json
+    $ python -m benchmarks run --rate-limit --output limited.json     # limiter overhead
+    $ python -m benchmarks compare before.json after.json
+    $ python -m benchmarks.serialization --rows 1000
+    $ python -m benchmarks.search --rows 100000
+    $ python -m benchmarks.startup --runs 10
+    $ python -m benchmarks.compression --characters 5000 --limit 1000
+    $ python -m benchmarks.serving --workers 2 --concurrency 64
+    $ python -m benchmarks.export --rows 1000000
+    $ python -m benchmarks.load http://127.0.0.1:3000 /all_planets -c 16 -d 10
+"""
+import os
+import sys
+
+# the app modules import each other as top level modules (from models import db)
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+# the load would be rejected by the rate limits (429s): off, unless a benchmark measures them
+os.environ.setdefault("RATE_LIMIT", "false")
@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import time
+import argparse
+import warnings
+import platform
+import tempfile
+import subprocess
+from benchmarks import SRC_DIR
+from benchmarks.seed import DEFAULT_COUNTS, BENCH_PASSWORD, bench_email
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    database_url = args.database_url
+    if database_url is None:
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    elif not database_url.startswith("sqlite") and not args.drop_existing:
+        sys.exit("seeding drops every table of %s, pass --drop-existing to confirm" % database_url)
+    # create_app() reads its configuration from the environment
+    os.environ["DATABASE_URL"] = database_url
+    # keep stdout for the report, the access log is still written (LOG_FILE=... to keep it)
+    os.environ.setdefault("LOG_FILE", os.devnull)
+    if args.rate_limit is not None:
+        # every request goes through the limiter, none is rejected: compare with a run without
+        from ratelimit import ROUTE_CLASSES
+        classes = set(ROUTE_CLASSES.values()) | {"read", "write"}
+        os.environ["RATE_LIMIT"] = "true"
+        os.environ["RATE_LIMIT_STORAGE"] = args.rate_limit
+        os.environ["RATE_LIMITS"] = ",".join("%s=1000000000/second" % name for name in sorted(classes))
+
+    from app import create_app
+    from models import db
+    from benchmarks.seed import seed
+    from benchmarks.scenarios import SCENARIOS
+    from benchmarks import runner
+
+    app = create_app()
+    counts = {name: getattr(args, name) for name in DEFAULT_COUNTS}
+    runner.quiet(app)
+    with app.app_context():
+        print("seeding %s ..." % db.engine.url.render_as_string(hide_password=True), file=sys.stderr)
+        seeded = seed(db, counts)
+        engine = db.engine
+
+    missing = runner.uncovered_endpoints(app, SCENARIOS)
+    if missing:
+        print("warning: no scenario for: " + ", ".join(missing), file=sys.stderr)
+
+    scenarios = [scenario for scenario in SCENARIOS if not args.only or args.only in scenario.name]
+    # short JWT_SECRET_KEY in development
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        login = app.test_client().post("/login", json={"email": bench_email(1), "password": BENCH_PASSWORD})
+        ctx = {"counts": seeded, "token": login.json["access_token"]}
+        if args.http or args.url:
+            mode = "http"
+            results = runner.run_http(app, engine, scenarios, ctx, args.concurrency, args.duration, base_url=args.url)
+        else:
+            mode = "test_client"
+            results = runner.run_test_client(app, engine, scenarios, ctx, args.iterations)
+
+    report = {
+        "meta": {
+            "mode": mode,
+            "commit": git_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "database": engine.dialect.name,
+            "counts": seeded,
+            "iterations": args.iterations if mode == "test_client" else None,
+            "concurrency": args.concurrency if mode == "http" else None,
+            "duration": args.duration if mode == "http" else None,
+        },
+        "endpoints": results,
+    }
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+        print("saved " + args.output, file=sys.stderr)
+
+def print_results(results):
+    print("%-36s %8s %9s %9s %9s %8s" % ("scenario", "req/s", "p50 ms", "p95 ms", "p99 ms", "sql/req"))
+    for name, result in results.items():
+        print("%-36s %8.1f %9.3f %9.3f %9.3f %8s" % (
+            name[:36], result["rps"], result["p50_ms"], result["p95_ms"], result["p99_ms"], result.get("sql_per_request", "-")
+        ))
+
+def change(before, after):
+    if not before:
+        return "    n/a"
+    return "%+6.1f%%" % ((after - before) / before * 100)
+
+def compare(args):
+    with open(args.before) as before_file, open(args.after) as after_file:
+        before = json.load(before_file)["endpoints"]
+        after = json.load(after_file)["endpoints"]
+
+    print("%-36s %18s %18s %14s" % ("scenario", "p50 ms", "p99 ms", "sql/req"))
+    for name in before:
+        if name not in after:
+            continue
+        old, new = before[name], after[name]
+        print("%-36s %8.2f %s %8.2f %s %6s -> %-5s" % (
+            name[:36], new["p50_ms"], change(old["p50_ms"], new["p50_ms"]),
+            new["p99_ms"], change(old["p99_ms"], new["p99_ms"]),
+            old.get("sql_per_request", "-"), new.get("sql_per_request", "-")
+        ))
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="seed a database and benchmark every route")
+    for name, default in DEFAULT_COUNTS.items():
+        run_parser.add_argument("--" + name.replace("_", "-"), dest=name, type=int, default=default)
+    run_parser.add_argument("--database-url", help="defaults to a new SQLite file")
+    run_parser.add_argument("--drop-existing", action="store_true", help="required to seed a non SQLite database")
+    run_parser.add_argument("--iterations", type=int, default=200, help="requests per scenario (test client mode)")
+    run_parser.add_argument("--http", action="store_true", help="concurrent HTTP load on the read scenarios")
+    run_parser.add_argument("--url", help="send the HTTP load to this server instead of an in-process one")
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--duration", type=float, default=5.0, help="seconds per scenario (HTTP mode)")
+    run_parser.add_argument("--only", help="only the scenarios whose name contains this text")
+    run_parser.add_argument("--rate-limit", nargs="?", const="", metavar="STORAGE",
+                            help="rate limit every request (RATE_LIMIT_STORAGE, default: the SQLite file in /dev/shm)")
+    run_parser.add_argument("--output", help="save the results as JSON")
+    run_parser.set_defaults(handler=run)
+
+    compare_parser = commands.add_parser("compare", help="compare two saved runs")
+    compare_parser.add_argument("before")
+    compare_parser.add_argument("after")
+    compare_parser.set_defaults(handler=compare)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Bytes on the wire and latency of GET /all_characters per Accept-Encoding, and of the
+revalidation of a page the client already has (If-None-Match -> 304).
+
+    $ python -m benchmarks.compression --characters 5000 --limit 1000 --repeat 200
+
+Runs against a throwaway SQLite database, through Flask's test client. "bytes" counts the
+body and the response headers, which is what the client downloads (before TLS and HTTP/2
+framing).
+"""
+import os
+import time
+import argparse
+import tempfile
+from benchmarks.seed import seed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--characters", type=int, default=5000)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(directory, "bench.db")
+    os.environ["PAGE_SIZE_MAX"] = str(args.limit)
+    os.environ.setdefault("LOG_FILE", os.devnull)
+
+    from app import create_app
+    from models import db
+    from compression import ENCODINGS
+
+    app = create_app()
+    with app.app_context():
+        seed(db, {"users": 1, "characters": args.characters, "planets": 0, "starships": 0, "favorites_per_user": 0})
+
+    client = app.test_client()
+    path = "/all_characters?limit=%d" % args.limit
+    etag = client.get(path).headers["ETag"]
+
+    variants = [("identity (no compression)", {"Accept-Encoding": "identity"})]
+    variants += [(encoding, {"Accept-Encoding": encoding}) for encoding in ENCODINGS]
+    variants += [("If-None-Match (304)", {"Accept-Encoding": "gzip", "If-None-Match": etag})]
+
+    print("GET %s, %d characters in the table" % (path, args.characters))
+    print("%-28s %6s %10s %10s %10s" % ("request", "status", "bytes", "p50 (ms)", "p99 (ms)"))
+    for name, headers in variants:
+        response = client.get(path, headers=headers)
+        size = len(response.get_data()) + sum(len(key) + len(value) + 4 for key, value in response.headers.items())
+        latencies = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            client.get(path, headers=headers).get_data()
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2] * 1000
+        p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000
+        print("%-28s %6d %10d %10.2f %10.2f" % (name, response.status_code, size, p50, p99))
+
+if __name__ == "__main__":
+    main()
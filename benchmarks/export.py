@@ -0,0 +1,92 @@
+"""
+Peak memory of a worker sending a whole table: /export/characters (streamed, NDJSON and
+CSV) against /all_characters with a page as large as the table.
+
+    $ python -m benchmarks.export --rows 1000000
+    $ python -m benchmarks.export --rows 1000000 --skip-list      # the list needs GBs at 1M
+
+Every request runs in a new process, through Flask's test client, reading the body chunk by
+chunk like a client on the network would. "peak RSS" is the process' maximum resident
+memory (VmHWM, Linux only), "baseline" the same for one small request: the difference is
+what the response cost.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+from benchmarks import SRC_DIR
+from benchmarks.seed import seed
+
+ROOT_DIR = os.path.dirname(SRC_DIR)
+
+def peak_rss_mb():
+    # VmHWM, not ru_maxrss: ru_maxrss keeps the peak of the parent (the seeding) across exec
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+
+def child(path):
+    os.environ.setdefault("LOG_FILE", os.devnull)
+    from app import create_app
+    client = create_app({"ADMIN": "off"}).test_client()
+    started = time.perf_counter()
+    response = client.get(path)
+    size = 0
+    for chunk in response.iter_encoded():
+        size += len(chunk)
+    response.close()
+    print(json.dumps({
+        "status": response.status_code,
+        "bytes": size,
+        "seconds": time.perf_counter() - started,
+        "peak_rss_mb": peak_rss_mb(),
+    }))
+
+def measure(path, env):
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.export", "--child", path],
+        cwd=ROOT_DIR, env=env, stdout=subprocess.PIPE, check=True
+    ).stdout
+    return json.loads(output.decode("utf-8").splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--skip-list", action="store_true", help="don't measure /all_characters")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args.child)
+
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(directory, "bench.db")
+    os.environ.setdefault("LOG_FILE", os.devnull)
+    from app import create_app
+    from models import db
+    started = time.perf_counter()
+    with create_app({"ADMIN": "off"}).app_context():
+        seed(db, {"users": 1, "characters": args.rows, "planets": 0, "starships": 0, "favorites_per_user": 0})
+    print("%d characters seeded in %.0f s" % (args.rows, time.perf_counter() - started))
+
+    env = dict(os.environ, PAGE_SIZE_MAX=str(args.rows))
+    requests = [
+        ("baseline", "/all_characters?limit=1"),
+        ("export ndjson", "/export/characters?format=ndjson"),
+        ("export csv", "/export/characters?format=csv"),
+    ]
+    if not args.skip_list:
+        requests.append(("all_characters", "/all_characters?limit=%d" % args.rows))
+
+    print("%-16s %6s %12s %10s %14s" % ("request", "status", "MB sent", "seconds", "peak RSS MB"))
+    for name, path in requests:
+        result = measure(path, env)
+        print("%-16s %6d %12.1f %10.2f %14.0f" % (
+            name, result["status"], result["bytes"] / 1024 / 1024, result["seconds"], result["peak_rss_mb"]
+        ))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Minimal multi-threaded HTTP load generator (also used by `python -m benchmarks run --http`).
+
+    $ python -m benchmarks.load http://127.0.0.1:3000 /all_planets?limit=50 /planets/1 -c 16 -d 10
+
+Every thread keeps one keep-alive connection and requests the paths round-robin for
+the given duration. Prints requests per second and p50/p95/p99 latency.
+"""
+import sys
+import time
+import json
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def worker(host, port, paths, deadline, latencies, errors, headers):
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    position = 0
+    while time.perf_counter() < deadline:
+        path = paths[position % len(paths)]
+        position += 1
+        started = time.perf_counter()
+        try:
+            connection.request("GET", path, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors.append(response.status)
+        except (OSError, http.client.HTTPException):
+            errors.append("connection")
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+    connection.close()
+
+def run(base_url, paths, concurrency=16, duration=10.0, headers=None):
+    url = urlsplit(base_url)
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=worker, args=(url.hostname, url.port or 80, paths, deadline, latencies, errors, headers or {}))
+        for _ in range(concurrency)
+    ]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "concurrency": concurrency,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base_url")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("-d", "--duration", type=float, default=10.0)
+    parser.add_argument("-H", "--header", action="append", default=[], help='e.g. -H "Authorization: Bearer ..."')
+    args = parser.parse_args()
+    headers = dict(header.split(":", 1) for header in args.header)
+    headers = {name.strip(): value.strip() for name, value in headers.items()}
+    json.dump(run(args.base_url, args.paths, args.concurrency, args.duration, headers=headers), sys.stdout, indent=2)
+    print()
+
+if __name__ == "__main__":
+    main()
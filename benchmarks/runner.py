@@ -0,0 +1,121 @@
+import time
+import logging
+import threading
+from collections import Counter
+from sqlalchemy import event
+from benchmarks import load
+
+class SQLCounter:
+    """Counts the statements sent to the database, through SQLAlchemy's cursor events."""
+
+    def __init__(self, engine):
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.count += 1
+
+    def take(self):
+        with self._lock:
+            count, self.count = self.count, 0
+        return count
+
+def summarize(latencies, elapsed):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(load.percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(load.percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(load.percentile(latencies, 0.99) * 1000, 3),
+    }
+
+def auth_headers(scenario, ctx):
+    headers = dict(scenario.headers)
+    if scenario.auth:
+        headers["Authorization"] = "Bearer " + ctx["token"]
+    return headers
+
+def quiet(app):
+    # the broken endpoints would print a traceback per request
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    app.logger.setLevel(logging.CRITICAL)
+
+def uncovered_endpoints(app, scenarios):
+    covered = {scenario.endpoint for scenario in scenarios}
+    endpoints = {
+        rule.endpoint for rule in app.url_map.iter_rules()
+        if rule.endpoint != "static" and not rule.rule.startswith("/admin")
+    }
+    return sorted(endpoints - covered)
+
+def run_test_client(app, engine, scenarios, ctx, iterations):
+    """Every scenario through Flask's test client, one request at a time: latency of the app
+    itself (no network, no server) and exact SQL statements per request."""
+    client = app.test_client()
+    counter = SQLCounter(engine)
+    results = {}
+    for scenario in scenarios:
+        latencies = []
+        statuses = Counter()
+        statements = 0
+        started = time.perf_counter()
+        for i in range(scenario.iterations or iterations):
+            path = scenario.path(i, ctx)
+            body = scenario.body(i, ctx) if scenario.body else None
+            counter.take()
+            request_started = time.perf_counter()
+            response = client.open(path, method=scenario.method, json=body, headers=auth_headers(scenario, ctx))
+            response.get_data()
+            latencies.append(time.perf_counter() - request_started)
+            statements += counter.take()
+            statuses[str(response.status_code)] += 1
+        elapsed = time.perf_counter() - started
+
+        results[scenario.name] = {
+            "endpoint": scenario.endpoint,
+            "method": scenario.method,
+            **summarize(latencies, elapsed),
+            "sql_per_request": round(statements / max(len(latencies), 1), 2),
+            "statuses": dict(statuses),
+        }
+    return results
+
+def start_server(app):
+    from werkzeug.serving import make_server
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, "http://127.0.0.1:%d" % server.server_port
+
+def run_http(app, engine, scenarios, ctx, concurrency, duration, base_url=None):
+    """The read scenarios under concurrent HTTP load. Without base_url the app is served
+    in-process by werkzeug's threaded server (and SQL statements are counted); with it the
+    requests go to that server (e.g. gunicorn started with the same DATABASE_URL)."""
+    server = None
+    counter = None
+    if base_url is None:
+        server, base_url = start_server(app)
+        counter = SQLCounter(engine)
+
+    results = {}
+    try:
+        for scenario in scenarios:
+            if not scenario.read:
+                continue
+            paths = [scenario.path(i, ctx) for i in range(200)]
+            if counter:
+                counter.take()
+            result = load.run(base_url, paths, concurrency, duration, headers=auth_headers(scenario, ctx))
+            result["endpoint"] = scenario.endpoint
+            result["method"] = scenario.method
+            if counter:
+                result["sql_per_request"] = round(counter.take() / max(result["requests"], 1), 2)
+            results[scenario.name] = result
+    finally:
+        if server:
+            server.shutdown()
+    return results
@@ -0,0 +1,133 @@
+from benchmarks.seed import BENCH_PASSWORD, bench_email
+from pagination import encode_cursor
+
+# One or more scenarios per route of src/app.py. They run in this order: reads first, then
+# writes, with the destructive ones last. `path` and `body` get the iteration number and the
+# context (seeded counts + token of user 1), so every request can target a different row.
+# Routes without a scenario are reported by `python -m benchmarks run`: add one here when
+# you add an endpoint.
+
+class Scenario:
+    def __init__(self, name, endpoint, method, path, body=None, auth=False, read=None, iterations=None, headers=None):
+        self.name = name
+        self.endpoint = endpoint
+        self.method = method
+        self.path = path
+        self.body = body
+        self.auth = auth
+        # extra request headers, e.g. If-None-Match for the 304 path
+        self.headers = headers or {}
+        # only read scenarios are used by the HTTP load generator, which repeats them freely
+        self.read = method == "GET" if read is None else read
+        # fixed number of iterations for operations that only make sense a few times
+        self.iterations = iterations
+
+def cycle(ctx, table, i):
+    return i % max(ctx["counts"][table], 1) + 1
+
+def middle_cursor(ctx, table):
+    return encode_cursor([ctx["counts"][table] // 2])
+
+def catalog_record(table, name):
+    if table == "planets":
+        return {"name": name, "climate": "arid", "population": 1000, "orbital_period": 300, "rotation_period": 24, "diameter": 10000}
+    if table == "characters":
+        return {"name": name, "height": 172, "mass": 77, "hair_color": "blond", "eye_color": "blue", "gender": "male", "birth_year": "19BBY"}
+    return {"name": name, "manufacturer": "Incom", "crew": 1, "passengers": 0, "consumables": "1 week", "cost_in_credits": 149999}
+
+def favorite_pairs(ctx, i, size=10):
+    kinds = [("planet", "planets"), ("character", "characters"), ("starship", "starships")]
+    pairs = []
+    for offset in range(size):
+        kind, table = kinds[(i + offset) % 3]
+        pairs.append({"type": kind, "id": cycle(ctx, table, i * size + offset)})
+    return pairs
+
+SCENARIOS = [
+    Scenario("sitemap", "api.sitemap", "GET", lambda i, ctx: "/"),
+    Scenario("sitemap revalidated (304)", "api.sitemap", "GET", lambda i, ctx: "/", headers={"If-None-Match": "*"}),
+    Scenario("openapi.json", "api.openapi_spec", "GET", lambda i, ctx: "/openapi.json"),
+    Scenario("all_users first page", "api.get_all_users", "GET", lambda i, ctx: "/all_users"),
+    Scenario("all_planets first page", "api.get_all_planets", "GET", lambda i, ctx: "/all_planets"),
+    Scenario("all_planets middle page", "api.get_all_planets", "GET",
+             lambda i, ctx: "/all_planets?after=" + middle_cursor(ctx, "planets")),
+    Scenario("all_planets with total", "api.get_all_planets", "GET", lambda i, ctx: "/all_planets?total=true"),
+    Scenario("all_characters first page", "api.get_all_characters", "GET", lambda i, ctx: "/all_characters"),
+    Scenario("all_characters max page", "api.get_all_characters", "GET", lambda i, ctx: "/all_characters?limit=1000"),
+    Scenario("all_characters max page gzip", "api.get_all_characters", "GET", lambda i, ctx: "/all_characters?limit=1000",
+             headers={"Accept-Encoding": "gzip"}),
+    Scenario("all_characters revalidated (304)", "api.get_all_characters", "GET", lambda i, ctx: "/all_characters?limit=1000",
+             headers={"If-None-Match": "*"}),
+    Scenario("all_starships first page", "api.get_all_starships", "GET", lambda i, ctx: "/all_starships"),
+    Scenario("all_planets top 10 by population", "api.get_all_planets", "GET",
+             lambda i, ctx: "/all_planets?order_by=population:desc&limit=10"),
+    Scenario("all_planets filtered by climate", "api.get_all_planets", "GET", lambda i, ctx: "/all_planets?climate=arid"),
+    Scenario("all_characters filtered and sorted", "api.get_all_characters", "GET",
+             lambda i, ctx: "/all_characters?eye_color=blue&height[gte]=150&order_by=height"),
+    Scenario("all_starships crew range", "api.get_all_starships", "GET",
+             lambda i, ctx: "/all_starships?crew[gte]=10&crew[lt]=10000&order_by=cost_in_credits:desc"),
+    Scenario("one user", "api.get_one_user", "GET", lambda i, ctx: "/user/%d" % cycle(ctx, "users", i)),
+    Scenario("one starship", "api.get_one_starship", "GET", lambda i, ctx: "/starships/%d" % cycle(ctx, "starships", i)),
+    Scenario("one planet (hot)", "api.get_one_planet", "GET", lambda i, ctx: "/planets/1"),
+    Scenario("one planet (cycling ids)", "api.get_one_planet", "GET", lambda i, ctx: "/planets/%d" % cycle(ctx, "planets", i)),
+    Scenario("one character", "api.get_one_character", "GET", lambda i, ctx: "/characters/%d" % cycle(ctx, "characters", i)),
+    Scenario("search prefix", "api.search_names", "GET", lambda i, ctx: "/search?q=pla"),
+    Scenario("search full name", "api.search_names", "GET", lambda i, ctx: "/search?q=planet %d" % cycle(ctx, "planets", i)),
+    Scenario("popular planets", "api.get_popular", "GET", lambda i, ctx: "/popular/planets?limit=10"),
+    Scenario("export planets ndjson", "api.export_table", "GET", lambda i, ctx: "/export/planets"),
+    Scenario("export planets csv", "api.export_table", "GET", lambda i, ctx: "/export/planets?format=csv"),
+    Scenario("user favorites", "api.get_all_favorites_of_user", "GET", lambda i, ctx: "/user/favorites", auth=True),
+    Scenario("user favorites expanded", "api.get_all_favorites_of_user", "GET", lambda i, ctx: "/user/favorites?expand=true", auth=True),
+    Scenario("favorites", "api.favorites_protected", "GET", lambda i, ctx: "/favorites", auth=True),
+    Scenario("valid token", "api.valid_token", "GET", lambda i, ctx: "/valid-token", auth=True),
+    Scenario("cache stats", "api.cache_stats", "GET", lambda i, ctx: "/cache/stats"),
+    Scenario("metrics", "metrics", "GET", lambda i, ctx: "/metrics"),
+
+    Scenario("login", "api.login", "POST", lambda i, ctx: "/login",
+             body=lambda i, ctx: {"email": bench_email(cycle(ctx, "users", i)), "password": BENCH_PASSWORD}, read=False),
+    Scenario("signup", "api.signup", "POST", lambda i, ctx: "/signup",
+             body=lambda i, ctx: {"first_name": "New", "last_name": "User", "email": "signup%d@bench.local" % i, "password": "x"}),
+    Scenario("add user", "api.add_new_user", "POST", lambda i, ctx: "/user",
+             body=lambda i, ctx: {"first_name": "Added%d" % i, "last_name": "User", "email": "added%d@bench.local" % i, "password": "x"}),
+    Scenario("add planet", "api.add_new_planet", "POST", lambda i, ctx: "/planet",
+             body=lambda i, ctx: catalog_record("planets", "Bench planet %d" % i)),
+    Scenario("add character", "api.add_new_character", "POST", lambda i, ctx: "/character",
+             body=lambda i, ctx: catalog_record("characters", "Bench character %d" % i)),
+    Scenario("add starship", "api.add_new_starship", "POST", lambda i, ctx: "/starship",
+             body=lambda i, ctx: catalog_record("starships", "Bench starship %d" % i)),
+    Scenario("bulk planets (100 per request)", "api.bulk_add_catalog", "POST", lambda i, ctx: "/planets/bulk",
+             body=lambda i, ctx: [catalog_record("planets", "Bulk planet %d-%d" % (i, n)) for n in range(100)]),
+    Scenario("bulk planets in the background (100)", "api.bulk_add_catalog", "POST", lambda i, ctx: "/planets/bulk?background=true",
+             body=lambda i, ctx: [catalog_record("planets", "Background planet %d-%d" % (i, n)) for n in range(100)]),
+    Scenario("submit job", "api.add_new_job", "POST", lambda i, ctx: "/jobs",
+             body=lambda i, ctx: {"kind": "delete", "params": {"table": "planets", "from_id": 10 ** 9}}),
+    # the jobs queued by the two scenarios above
+    Scenario("poll job", "api.get_one_job", "GET", lambda i, ctx: "/jobs/%d" % (i + 1), read=False),
+    Scenario("cancel job", "api.delete_job", "DELETE", lambda i, ctx: "/jobs/%d" % (i + 1)),
+    Scenario("favorite planet", "api.add_new_favorite_planet", "POST",
+             lambda i, ctx: "/favorites/planet/%d" % cycle(ctx, "planets", i), auth=True),
+    Scenario("favorite starship", "api.add_new_favorite_starship", "POST",
+             lambda i, ctx: "/favorites/starship/%d" % cycle(ctx, "starships", i), auth=True),
+    Scenario("favorite character", "api.add_new_favorite_character", "POST",
+             lambda i, ctx: "/favorites/character/%d" % cycle(ctx, "characters", i), auth=True),
+    Scenario("favorites batch add (10)", "api.add_favorites_batch", "POST", lambda i, ctx: "/favorites/batch",
+             body=lambda i, ctx: favorite_pairs(ctx, i), auth=True),
+    Scenario("update planet", "api.update_planet", "PUT", lambda i, ctx: "/planet/%d" % cycle(ctx, "planets", i),
+             body=lambda i, ctx: {"name": "Planet %d" % cycle(ctx, "planets", i), "climate": "temperate", "population": i}),
+    Scenario("update user", "api.update_user", "PUT", lambda i, ctx: "/user",
+             body=lambda i, ctx: {"name": "First%d" % cycle(ctx, "users", i), "email": bench_email(cycle(ctx, "users", i)), "password": "y"}),
+
+    Scenario("favorites batch remove (10)", "api.delete_favorites_batch", "DELETE", lambda i, ctx: "/favorites/batch",
+             body=lambda i, ctx: favorite_pairs(ctx, i), auth=True),
+    Scenario("remove favorite planet", "api.delete_favorite_planet", "DELETE",
+             lambda i, ctx: "/favorites/planet/%d" % cycle(ctx, "planets", i),
+             body=lambda i, ctx: {"user_id": 1, "planets_id": cycle(ctx, "planets", i)}),
+    Scenario("remove favorite character", "api.delete_favorite_character", "DELETE",
+             lambda i, ctx: "/favorites/character/1/%d" % cycle(ctx, "characters", i)),
+    Scenario("remove favorite by id", "api.delete_favorite", "DELETE", lambda i, ctx: "/favorites/%d" % (i + 1), auth=True),
+    Scenario("delete planet", "api.delete_planet", "DELETE", lambda i, ctx: "/planet",
+             body=lambda i, ctx: {"name": "Bench planet %d" % i}),
+    Scenario("delete user", "api.delete_user", "DELETE", lambda i, ctx: "/user",
+             body=lambda i, ctx: {"email": "added%d@bench.local" % i}),
+    Scenario("delete all users", "api.delete_all_users", "DELETE", lambda i, ctx: "/users", iterations=1),
+]
@@ -0,0 +1,66 @@
+"""
+Latency of /search against a LIKE '%q%' scan of the three catalog tables.
+
+    $ python -m benchmarks.search --rows 100000 --repeat 50
+
+Runs against a throwaway SQLite database seeded with --rows names in total, split between
+characters, planets and starships (benchmarks/seed.py generates them).
+"""
+import os
+import time
+import argparse
+import tempfile
+from benchmarks.seed import seed
+
+# typed queries, from one character (rejected, SEARCH_MIN_LENGTH) to a full name
+QUERIES = ["pl", "plan", "planet 4", "planet 4242", "starship 99", "character 12345", "nothing matches"]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(directory, "bench.db")
+    os.environ.setdefault("LOG_FILE", os.devnull)
+
+    from app import create_app
+    from models import db, Characters, Planets, Starships
+
+    app = create_app()
+    per_table = args.rows // 3
+    with app.app_context():
+        started = time.perf_counter()
+        seed(db, {"users": 1, "characters": per_table, "planets": per_table, "starships": per_table, "favorites_per_user": 0})
+        print("seeded %d names in %.1f s (search_index filled by the triggers)" % (per_table * 3, time.perf_counter() - started))
+
+        def like_scan(q):
+            pattern = "%" + q + "%"
+            rows = []
+            for model in (Characters, Planets, Starships):
+                rows += db.session.query(model.id, model.name).filter(model.name.ilike(pattern)).limit(20).all()
+            return rows
+
+        client = app.test_client()
+
+        def timed(function):
+            function()
+            latencies = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                function()
+                latencies.append(time.perf_counter() - started)
+            latencies.sort()
+            return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.95)] * 1000
+
+        print("%-18s %8s %18s %18s" % ("q", "matches", "GET /search p50/p95", "LIKE scan p50/p95"))
+        for q in QUERIES:
+            response = client.get("/search", query_string={"q": q, "limit": 20})
+            matches = len(response.json["results"]) if response.status_code == 200 else response.status_code
+            search_p50, search_p95 = timed(lambda: client.get("/search", query_string={"q": q, "limit": 20}).get_data())
+            like_p50, like_p95 = timed(lambda: like_scan(q))
+            print("%-18s %8s %8.2f / %6.2f ms %8.2f / %6.2f ms" % (q, matches, search_p50, search_p95, like_p50, like_p95))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import random
+
+# Synthetic SWAPI-like data. Everything is generated from a fixed random seed, so two runs
+# with the same counts produce the same database.
+
+CLIMATES = ["arid", "temperate", "tropical", "frozen", "murky", "windy", "hot", "polluted"]
+COLORS = ["blue", "brown", "black", "blond", "red", "yellow", "green", "grey", "white", "none"]
+GENDERS = ["male", "female", "n/a", "hermaphrodite"]
+MANUFACTURERS = ["Corellian Engineering", "Kuat Drive Yards", "Sienar Fleet Systems", "Incom", "Cygnus Spaceworks"]
+CONSUMABLES = ["1 week", "2 months", "1 year", "3 years", "5 days"]
+
+DEFAULT_COUNTS = {
+    "users": 1000,
+    "characters": 1000,
+    "planets": 1000,
+    "starships": 1000,
+    "favorites_per_user": 5,
+}
+
+BENCH_PASSWORD = "bench-password"
+
+def bench_email(user_id):
+    return "user%d@bench.local" % user_id
+
+def user_rows(count, rng):
+    return [
+        dict(first_name="First%d" % i, last_name="Last%d" % rng.randint(1, 10 ** 6), email=bench_email(i), password=BENCH_PASSWORD)
+        for i in range(1, count + 1)
+    ]
+
+def character_rows(count, rng):
+    return [
+        dict(
+            name="Character %d" % i, height=rng.randint(60, 250), mass=rng.randint(20, 200),
+            hair_color=rng.choice(COLORS), eye_color=rng.choice(COLORS), gender=rng.choice(GENDERS),
+            birth_year="%dBBY" % rng.randint(1, 900)
+        )
+        for i in range(1, count + 1)
+    ]
+
+def planet_rows(count, rng):
+    return [
+        dict(
+            name="Planet %d" % i, climate=rng.choice(CLIMATES), population=rng.randint(0, 10 ** 9),
+            orbital_period=rng.randint(100, 5000), rotation_period=rng.randint(10, 60), diameter=rng.randint(1000, 200000)
+        )
+        for i in range(1, count + 1)
+    ]
+
+def starship_rows(count, rng):
+    return [
+        dict(
+            name="Starship %d" % i, manufacturer=rng.choice(MANUFACTURERS), crew=rng.randint(1, 50000),
+            passengers=rng.randint(0, 80000), consumables=rng.choice(CONSUMABLES), cost_in_credits=rng.randint(10 ** 4, 10 ** 9)
+        )
+        for i in range(1, count + 1)
+    ]
+
+def favorite_rows(counts, rng):
+    kinds = [
+        (column, counts[table]) for column, table in
+        (("characters_id", "characters"), ("planets_id", "planets"), ("starships_id", "starships"))
+        if counts[table] > 0
+    ]
+    rows = []
+    if not kinds:
+        return rows
+    for user_id in range(1, counts["users"] + 1):
+        chosen = set()
+        for _ in range(counts["favorites_per_user"]):
+            column, available = rng.choice(kinds)
+            chosen.add((column, rng.randint(1, available)))
+        for column, entity_id in sorted(chosen):
+            row = {"user_id": user_id, "characters_id": None, "planets_id": None, "starships_id": None}
+            row[column] = entity_id
+            rows.append(row)
+    return rows
+
+def insert_chunked(db, model, rows, chunk_size=5000):
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(db.insert(model), rows[start:start + chunk_size])
+    db.session.commit()
+
+def seed(db, counts, rng_seed=42):
+    """Drops and recreates every table, then fills them. Ids start at 1 in every table."""
+    from models import User, Characters, Planets, Starships, Favorites
+    from popularity import rebuild_counts
+
+    rng = random.Random(rng_seed)
+    db.drop_all()
+    db.create_all()
+    insert_chunked(db, User, user_rows(counts["users"], rng))
+    insert_chunked(db, Characters, character_rows(counts["characters"], rng))
+    insert_chunked(db, Planets, planet_rows(counts["planets"], rng))
+    insert_chunked(db, Starships, starship_rows(counts["starships"], rng))
+    favorites = favorite_rows(counts, rng)
+    insert_chunked(db, Favorites, favorites)
+    # the rows above don't go through the favorites engine
+    rebuild_counts()
+    return {**counts, "favorites": len(favorites)}
@@ -0,0 +1,79 @@
+"""
+Compares the ways of turning a page of planets into a JSON response:
+ORM objects + serialize() vs column projection + serialize_row(), stdlib json vs orjson.
+
+    $ python -m benchmarks.serialization --rows 1000 --repeat 50
+
+Runs against a throwaway SQLite database seeded with --rows planets.
+"""
+import os
+import time
+import argparse
+import tempfile
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(directory, "bench.db")
+    os.environ["PAGE_SIZE_MAX"] = str(args.rows)
+
+    from flask.json.provider import DefaultJSONProvider
+    from app import create_app
+    from models import db, Planets
+    from json_provider import ORJSONProvider, orjson
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.execute(db.insert(Planets), [
+            dict(name="planet %d" % i, climate="arid", population=i * 1000, orbital_period=304, rotation_period=23, diameter=10465)
+            for i in range(args.rows)
+        ])
+        db.session.commit()
+
+        def orm_rows():
+            rows = Planets.query.order_by(Planets.id).limit(args.rows).all()
+            return [row.serialize() for row in rows]
+
+        def projected_rows():
+            rows = db.session.query(*Planets.projection()).order_by(Planets.id).limit(args.rows).all()
+            return [Planets.serialize_row(row) for row in rows]
+
+        def timed(function):
+            function()
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                function()
+                db.session.expunge_all()
+            return (time.perf_counter() - started) / args.repeat * 1000
+
+        providers = {"stdlib json": DefaultJSONProvider(app)}
+        if orjson is not None:
+            providers["orjson"] = ORJSONProvider(app)
+
+        results = {}
+        for query_name, query in (("ORM + serialize()", orm_rows), ("projection", projected_rows)):
+            results[query_name + " (query only)"] = timed(query)
+            for provider_name, provider in providers.items():
+                results[query_name + " + " + provider_name] = timed(
+                    lambda: provider.response({"msg": "ok", "results": query()}).get_data()
+                )
+
+        client = app.test_client()
+        for provider_name, provider in providers.items():
+            app.json = provider
+            results["GET /all_planets?limit=%d, %s" % (args.rows, provider_name)] = timed(
+                lambda: client.get("/all_planets?limit=%d" % args.rows).get_data()
+            )
+
+    baseline = results["ORM + serialize() + stdlib json"]
+    print("%d rows, mean of %d runs" % (args.rows, args.repeat))
+    for name, milliseconds in results.items():
+        print("%-55s %8.2f ms  %5.2fx" % (name, milliseconds, baseline / milliseconds))
+
+if __name__ == "__main__":
+    main()
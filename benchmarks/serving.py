@@ -0,0 +1,121 @@
+"""
+Throughput, latency and memory of the serving modes under the same concurrent load:
+gunicorn sync and gthread workers (wsgi.py) against uvicorn workers (asgi.py, async reads).
+
+    $ python -m benchmarks.serving --workers 2 --concurrency 64 --duration 10
+    $ python -m benchmarks.serving --database-url postgresql://... --drop-existing
+
+Every mode gets the same number of worker processes, i.e. about the same memory; the table
+shows the resident memory of gunicorn and its workers (RSS, shared pages counted once per
+process) next to the requests per second. The async mode pays off when the database is
+across a network: on a local SQLite file the waits it overlaps are short.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+import http.client
+from benchmarks import SRC_DIR, load
+from benchmarks.seed import seed, DEFAULT_COUNTS, BENCH_PASSWORD, bench_email
+
+ROOT_DIR = os.path.dirname(SRC_DIR)
+
+# GUNICORN_PROFILE, module, extra environment
+MODES = {
+    "sync": ("sync", "wsgi", {}),
+    "gthread": ("gthread", "wsgi", {"WEB_THREADS": "8"}),
+    "asgi": ("asgi", "asgi", {}),
+}
+
+def rss_mb(pid):
+    """Resident memory of pid and its children, in MB."""
+    pids = [pid]
+    try:
+        with open("/proc/%d/task/%d/children" % (pid, pid)) as children:
+            pids += [int(child) for child in children.read().split()]
+    except OSError:
+        pass
+    total = 0
+    for process in pids:
+        try:
+            with open("/proc/%d/status" % process) as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total / 1024
+
+def wait_until_up(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/all_planets?limit=1")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("the server on port %d did not start" % port)
+
+def login(port):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    connection.request("POST", "/login", body='{"email": "%s", "password": "%s"}' % (bench_email(1), BENCH_PASSWORD),
+                       headers={"Content-Type": "application/json"})
+    response = connection.getresponse()
+    return response.read().decode("utf-8").split('"access_token":"')[1].split('"')[0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default="sync,gthread,asgi")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=3190)
+    parser.add_argument("--database-url", help="defaults to a new SQLite file")
+    parser.add_argument("--drop-existing", action="store_true", help="allow seeding a non SQLite database")
+    args = parser.parse_args()
+
+    database_url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    if not database_url.startswith("sqlite") and not args.drop_existing:
+        sys.exit("seeding drops every table of %s, pass --drop-existing to confirm" % database_url)
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("LOG_FILE", os.devnull)
+
+    from app import create_app
+    from models import db
+    with create_app({"ADMIN": "off"}).app_context():
+        seed(db, DEFAULT_COUNTS)
+
+    paths = ["/all_characters?limit=50", "/planets/%d", "/all_starships?crew[gte]=10&limit=20", "/characters/%d"]
+    paths = [path % (i % 1000 + 1) if "%d" in path else path for i in range(100) for path in paths]
+
+    print("%d workers per mode, %d concurrent clients, %.0f s per mode" % (args.workers, args.concurrency, args.duration))
+    print("%-8s %8s %10s %10s %10s %8s %10s" % ("mode", "req/s", "p50 (ms)", "p99 (ms)", "errors", "RSS MB", "fav req/s"))
+    for name in args.modes.split(","):
+        profile, module, extra = MODES[name]
+        env = dict(os.environ, GUNICORN_PROFILE=profile, WEB_CONCURRENCY=str(args.workers), **extra)
+        server = subprocess.Popen(
+            ["gunicorn", module, "--chdir", SRC_DIR, "-c", os.path.join(ROOT_DIR, "gunicorn.conf.py"),
+             "-b", "127.0.0.1:%d" % args.port],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_until_up(args.port)
+            base_url = "http://127.0.0.1:%d" % args.port
+            load.run(base_url, paths, args.concurrency, 1.0)
+            result = load.run(base_url, paths, args.concurrency, args.duration)
+            memory = rss_mb(server.pid)
+            favorites = load.run(base_url, ["/user/favorites?expand=true"], args.concurrency, args.duration / 2,
+                                 headers={"Authorization": "Bearer " + login(args.port)})
+            print("%-8s %8.0f %10.2f %10.2f %10d %8.0f %10.0f" % (
+                name, result["rps"], result["p50_ms"], result["p99_ms"], result["errors"] + favorites["errors"], memory, favorites["rps"]
+            ))
+        finally:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    main()
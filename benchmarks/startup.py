@@ -0,0 +1,92 @@
+"""
+Cold start: time from launching Python to the first response of the API, per ADMIN mode.
+
+    $ python -m benchmarks.startup --runs 10
+    $ python -m benchmarks.startup --src /tmp/old-checkout/src    # compare with another tree
+
+Every run is a new interpreter that imports wsgi.py (what gunicorn does) and sends one
+request through the test client, so the numbers include the imports and create_app(). Then
+`python -X importtime` lists the imports that cost the most in the default mode.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+from benchmarks import SRC_DIR
+
+# prints the wall clock at the response: the interpreter's shutdown is not part of the start
+FIRST_REQUEST = (
+    "import time\n"
+    "from wsgi import application\n"
+    "response = application.test_client().get(%r)\n"
+    "assert response.status_code < 500, response.status_code\n"
+    "print(time.time())\n"
+)
+
+def run_python(src, code, env, *options):
+    return subprocess.run(
+        [sys.executable] + list(options) + ["-c", code],
+        cwd=src, env=env, capture_output=True, text=True, check=True
+    )
+
+def time_to_first_response(src, env, path, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.time()
+        answered = float(run_python(src, FIRST_REQUEST % path, env).stdout.split()[-1])
+        timings.append(answered - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, timings[0] * 1000
+
+def slowest_imports(src, env, depth, count):
+    """(total ms, [(cumulative ms, module), ...]) of the -X importtime report of `import wsgi`."""
+    stderr = run_python(src, "import wsgi", env, "-X", "importtime").stderr
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # two spaces of indentation per level; a module is listed after everything it imports
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        if level == 0:
+            if name.strip() == "wsgi":
+                imports.sort(reverse=True)
+                return int(cumulative_us) / 1000, imports[:count]
+            imports = []
+        elif level <= depth:
+            imports.append((int(cumulative_us) / 1000, name.strip()))
+    raise RuntimeError("wsgi is not in the -X importtime report")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--src", default=SRC_DIR, help="src directory of the tree to measure")
+    parser.add_argument("--modes", default="eager,lazy,off", help="ADMIN modes to measure")
+    parser.add_argument("--imports", type=int, default=15, help="slowest imports to list, 0 for none")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "startup.db")
+    env.setdefault("LOG_FILE", os.devnull)
+    # the first run writes the bytecode caches, which any deploy has after its first boot
+    run_python(args.src, "import wsgi", env)
+
+    print("%-8s %-8s %12s %10s" % ("ADMIN", "request", "p50 (ms)", "min (ms)"))
+    for mode in args.modes.split(","):
+        env["ADMIN"] = mode
+        paths = ["/"] + (["/admin/"] if mode != "off" else [])
+        for path in paths:
+            p50, fastest = time_to_first_response(args.src, env, path, args.runs)
+            print("%-8s %-8s %12.0f %10.0f" % (mode, path, p50, fastest))
+
+    if args.imports:
+        env.pop("ADMIN")
+        total_ms, imports = slowest_imports(args.src, env, 2, args.imports)
+        print("\nimport wsgi: %.0f ms, slowest imports of wsgi and app (cumulative):" % total_ms)
+        for cumulative_ms, name in imports:
+            print("%10.1f ms  %s" % (cumulative_ms, name))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# Gunicorn settings, used by the Procfile and render.yaml:
+#   gunicorn wsgi --chdir ./src/ -c gunicorn.conf.py
+#
+# GUNICORN_PROFILE picks the worker model:
+#   sync    - one request at a time per worker (gunicorn's default)
+#   gthread - WEB_THREADS threads per worker, good default for a DB bound API
+#   gevent  - WEB_GREENLETS greenlets per worker, with gevent (and psycogreen on
+#             Postgres, so psycopg2 waits cooperatively), both in the Pipfile
+#   asgi    - uvicorn workers serving asgi.py (async read endpoints, see src/async_api.py):
+#             GUNICORN_PROFILE=asgi gunicorn asgi --chdir ./src/ -c gunicorn.conf.py
+# WEB_CONCURRENCY overrides the number of worker processes.
+#
+# Every worker has its own SQLAlchemy pool: keep
+#   workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) < Postgres max_connections
+# and DB_POOL_SIZE >= WEB_THREADS, see docs/PERFORMANCE.md.
+#
+# The workers write their /metrics counters to PROMETHEUS_MULTIPROC_DIR, any worker can then
+# answer a scrape with the totals of all of them. Unset, the master creates a temporary
+# directory and removes it when it exits.
+import os
+import glob
+import shutil
+import tempfile
+import multiprocessing
+
+profile = os.getenv("GUNICORN_PROFILE", "gthread")
+cpus = multiprocessing.cpu_count()
+
+if profile == "sync":
+    worker_class = "sync"
+    workers = int(os.getenv("WEB_CONCURRENCY", cpus * 2 + 1))
+elif profile == "gthread":
+    worker_class = "gthread"
+    workers = int(os.getenv("WEB_CONCURRENCY", cpus + 1))
+    threads = int(os.getenv("WEB_THREADS", 4))
+elif profile == "gevent":
+    worker_class = "gevent"
+    workers = int(os.getenv("WEB_CONCURRENCY", cpus + 1))
+    worker_connections = int(os.getenv("WEB_GREENLETS", 100))
+elif profile == "asgi":
+    # one event loop per worker already overlaps the database waits: one worker per CPU
+    worker_class = "uvicorn.workers.UvicornWorker"
+    workers = int(os.getenv("WEB_CONCURRENCY", cpus))
+else:
+    raise RuntimeError("GUNICORN_PROFILE must be sync, gthread, gevent or asgi, not %r" % profile)
+
+# import the app once in the master and fork it: faster boots and shared memory pages
+preload_app = True
+timeout = int(os.getenv("WEB_TIMEOUT", 30))
+keepalive = 5
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+
+# set before the app is imported: prometheus_client picks its storage at import time
+# (once: a reload of this file on SIGHUP finds the variable set)
+created_metrics_dir = None
+if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    created_metrics_dir = tempfile.mkdtemp(prefix="swapi-metrics-")
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = created_metrics_dir
+
+def on_starting(server):
+    # kept on the arbiter: on_exit may come from a reloaded copy of this file
+    server.created_metrics_dir = created_metrics_dir
+    # counters left by a previous run of the server would be added to the new ones
+    metrics_dir = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, "*.db")):
+        os.remove(path)
+
+def on_exit(server):
+    if getattr(server, "created_metrics_dir", None) is not None:
+        shutil.rmtree(server.created_metrics_dir, ignore_errors=True)
+
+def child_exit(server, worker):
+    from metrics import mark_process_dead
+    mark_process_dead(worker.pid)
+
+def post_fork(server, worker):
+    if profile == "gevent":
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            pass
+
+    # connections opened by the master while preloading must not be shared by the workers
+    if profile == "asgi":
+        from asgi import flask_app as application
+    else:
+        from wsgi import application
+    from models import db
+    with application.app_context():
+        db.engine.dispose(close=False)
+    if "replicas" in application.extensions:
+        application.extensions["replicas"].dispose()
@@ -0,0 +1,67 @@
+"""unique catalog names for bulk upserts
+
+Revision ID: 5b8e2f7a9c13
+Revises: a3f1c9d2e4b7
+Create Date: 2026-10-18 11:02:37.480915
+
+"""
+import logging
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e2f7a9c13'
+down_revision = 'a3f1c9d2e4b7'
+branch_labels = None
+depends_on = None
+
+
+logger = logging.getLogger('alembic.env')
+
+
+def rename_duplicated_names(table):
+    """The tables never enforced unique names: of the rows sharing a name, the one with the
+    smallest id keeps it and the others get their id appended ("X-wing (42)"). Renamed, not
+    deleted, so the favorites that reference them stay valid."""
+    duplicated = op.get_bind().execute(sa.text(
+        "SELECT name, count(*) FROM %s WHERE name IS NOT NULL GROUP BY name HAVING count(*) > 1 ORDER BY name" % table
+    )).all()
+    if not duplicated:
+        return
+    logger.warning("%s: renaming the duplicates of %d names: %s", table, len(duplicated),
+                   ", ".join("%r (%d rows)" % (name, count) for name, count in duplicated))
+    op.execute(
+        "UPDATE %s SET name = name || ' (' || id || ')' WHERE name IS NOT NULL AND id NOT IN "
+        "(SELECT id FROM (SELECT MIN(id) AS id FROM %s GROUP BY name) AS keep)" % (table, table)
+    )
+
+
+# INSERT ... ON CONFLICT (name) needs a unique index on name
+def upgrade():
+    for table in ('planets', 'characters', 'starships'):
+        rename_duplicated_names(table)
+
+    with op.batch_alter_table('planets', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_planets_name'))
+        batch_op.create_index(batch_op.f('ix_planets_name'), ['name'], unique=True)
+
+    with op.batch_alter_table('characters', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_characters_name'))
+        batch_op.create_index(batch_op.f('ix_characters_name'), ['name'], unique=True)
+
+    with op.batch_alter_table('starships', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_starships_name'), ['name'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('starships', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_starships_name'))
+
+    with op.batch_alter_table('characters', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_characters_name'))
+        batch_op.create_index(batch_op.f('ix_characters_name'), ['name'], unique=False)
+
+    with op.batch_alter_table('planets', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_planets_name'))
+        batch_op.create_index(batch_op.f('ix_planets_name'), ['name'], unique=False)
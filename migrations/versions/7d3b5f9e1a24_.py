@@ -0,0 +1,58 @@
+"""full text search on the catalog names
+
+Revision ID: 7d3b5f9e1a24
+Revises: 9c4e1b7d2f60
+Create Date: 2026-10-18 11:20:03.551870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3b5f9e1a24'
+down_revision = '9c4e1b7d2f60'
+branch_labels = None
+depends_on = None
+
+
+# Same objects as src/search.py creates after db.create_all(). On SQLite a batch
+# operation that recreates one of these tables drops its triggers: create them again
+# in that migration.
+TABLES = ['characters', 'planets', 'starships']
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE search_index USING fts5("
+            "name, kind UNINDEXED, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')"
+        )
+        for position, table in enumerate(TABLES):
+            new_rowid = 'new.id * 3 + %d' % position
+            old_rowid = 'old.id * 3 + %d' % position
+            insert = "INSERT INTO search_index (rowid, name, kind) VALUES (%s, new.name, '%s');" % (new_rowid, table)
+            delete = "DELETE FROM search_index WHERE rowid = %s;" % old_rowid
+            op.execute("CREATE TRIGGER %s_search_insert AFTER INSERT ON %s BEGIN %s END" % (table, table, insert))
+            op.execute("CREATE TRIGGER %s_search_update AFTER UPDATE OF name, id ON %s BEGIN %s %s END" % (table, table, delete, insert))
+            op.execute("CREATE TRIGGER %s_search_delete AFTER DELETE ON %s BEGIN %s END" % (table, table, delete))
+            op.execute("INSERT INTO search_index (rowid, name, kind) SELECT id * 3 + %d, name, '%s' FROM %s" % (position, table, table))
+    elif dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for table in TABLES:
+            op.execute("CREATE INDEX ix_%s_name_tsv ON %s USING gin (to_tsvector('simple', name))" % (table, table))
+            op.execute("CREATE INDEX ix_%s_name_trgm ON %s USING gin (name gin_trgm_ops)" % (table, table))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for table in TABLES:
+            for operation in ('insert', 'update', 'delete'):
+                op.execute("DROP TRIGGER %s_search_%s" % (table, operation))
+        op.execute("DROP TABLE search_index")
+    elif dialect == 'postgresql':
+        for table in TABLES:
+            op.execute("DROP INDEX ix_%s_name_tsv" % table)
+            op.execute("DROP INDEX ix_%s_name_trgm" % table)
@@ -0,0 +1,38 @@
+"""indexes for the filters and sort orders of the catalog lists
+
+Revision ID: 9c4e1b7d2f60
+Revises: e2d4a6c8b0f1
+Create Date: 2026-10-18 11:02:40.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4e1b7d2f60'
+down_revision = 'e2d4a6c8b0f1'
+branch_labels = None
+depends_on = None
+
+
+# (column, id) per filterable column, see keyset_indexes() in models.py
+FILTERABLE = {
+    'characters': ['gender', 'eye_color', 'hair_color', 'height', 'mass'],
+    'planets': ['climate', 'population', 'diameter', 'orbital_period', 'rotation_period'],
+    'starships': ['manufacturer', 'crew', 'passengers', 'cost_in_credits'],
+}
+
+
+def upgrade():
+    for table, columns in FILTERABLE.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.create_index('ix_%s_%s_id' % (table, column), [column, 'id'], unique=False)
+
+
+def downgrade():
+    for table, columns in FILTERABLE.items():
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            for column in columns:
+                batch_op.drop_index('ix_%s_%s_id' % (table, column))
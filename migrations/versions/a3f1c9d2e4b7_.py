@@ -0,0 +1,42 @@
+"""add lookup indexes for favorites and catalog names
+
+Revision ID: a3f1c9d2e4b7
+Revises: 31300d8282a8
+Create Date: 2026-10-18 10:45:12.114203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f1c9d2e4b7'
+down_revision = '31300d8282a8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('favorites', schema=None) as batch_op:
+        batch_op.create_index('ix_favorites_user_id_planets_id', ['user_id', 'planets_id'], unique=False)
+        batch_op.create_index('ix_favorites_user_id_characters_id', ['user_id', 'characters_id'], unique=False)
+        batch_op.create_index('ix_favorites_user_id_starships_id', ['user_id', 'starships_id'], unique=False)
+
+    with op.batch_alter_table('planets', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_planets_name'), ['name'], unique=False)
+
+    with op.batch_alter_table('characters', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_characters_name'), ['name'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('characters', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_characters_name'))
+
+    with op.batch_alter_table('planets', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_planets_name'))
+
+    with op.batch_alter_table('favorites', schema=None) as batch_op:
+        batch_op.drop_index('ix_favorites_user_id_starships_id')
+        batch_op.drop_index('ix_favorites_user_id_characters_id')
+        batch_op.drop_index('ix_favorites_user_id_planets_id')
@@ -0,0 +1,48 @@
+"""favorite counters per character, planet and starship
+
+Revision ID: b8f2c4e6a0d3
+Revises: 7d3b5f9e1a24
+Create Date: 2026-10-18 11:41:27.902154
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8f2c4e6a0d3'
+down_revision = '7d3b5f9e1a24'
+branch_labels = None
+depends_on = None
+
+
+COUNTED = [
+    ('characters', 'characters_id'),
+    ('planets', 'planets_id'),
+    ('starships', 'starships_id'),
+]
+
+
+def upgrade():
+    op.create_table('favorite_counts',
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('kind', 'entity_id')
+    )
+    with op.batch_alter_table('favorite_counts', schema=None) as batch_op:
+        batch_op.create_index('ix_favorite_counts_kind_count', ['kind', 'count', 'entity_id'], unique=False)
+
+    # same as `flask favorites rebuild-counts`
+    for kind, column in COUNTED:
+        op.execute(
+            "INSERT INTO favorite_counts (kind, entity_id, count) "
+            "SELECT '%s', %s, count(*) FROM favorites WHERE %s IS NOT NULL GROUP BY %s" % (kind, column, column, column)
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('favorite_counts', schema=None) as batch_op:
+        batch_op.drop_index('ix_favorite_counts_kind_count')
+
+    op.drop_table('favorite_counts')
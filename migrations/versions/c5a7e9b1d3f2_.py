@@ -0,0 +1,29 @@
+"""version counters of the catalog tables, for the ETags of the reads
+
+Revision ID: c5a7e9b1d3f2
+Revises: b8f2c4e6a0d3
+Create Date: 2026-10-18 15:02:44.318265
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5a7e9b1d3f2'
+down_revision = 'b8f2c4e6a0d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # no rows: a table without a counter is at version 0, its first write creates the row
+    op.create_table('table_versions',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('table_versions')
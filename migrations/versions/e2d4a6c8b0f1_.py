@@ -0,0 +1,56 @@
+"""unique favorites per user and entity
+
+Revision ID: e2d4a6c8b0f1
+Revises: 5b8e2f7a9c13
+Create Date: 2026-10-18 11:31:05.627734
+
+"""
+import logging
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2d4a6c8b0f1'
+down_revision = '5b8e2f7a9c13'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    ('ix_favorites_user_id_planets_id', ['user_id', 'planets_id']),
+    ('ix_favorites_user_id_characters_id', ['user_id', 'characters_id']),
+    ('ix_favorites_user_id_starships_id', ['user_id', 'starships_id']),
+]
+
+
+logger = logging.getLogger('alembic.env')
+
+
+def delete_duplicated_favorites(column):
+    """Users could add the same favorite more than once: of the rows of one (user, entity),
+    the one with the smallest id stays. Rows with a NULL entity id never conflict."""
+    deleted = op.get_bind().execute(sa.text(
+        "DELETE FROM favorites WHERE {column} IS NOT NULL AND id NOT IN "
+        "(SELECT id FROM (SELECT MIN(id) AS id FROM favorites WHERE {column} IS NOT NULL "
+        "GROUP BY user_id, {column}) AS keep)".format(column=column)
+    )).rowcount
+    if deleted:
+        logger.warning("favorites: deleted %d duplicated favorites of %s", deleted, column)
+
+
+def upgrade():
+    for name, columns in INDEXES:
+        delete_duplicated_favorites(columns[1])
+
+    with op.batch_alter_table('favorites', schema=None) as batch_op:
+        for name, columns in INDEXES:
+            batch_op.drop_index(name)
+            batch_op.create_index(name, columns, unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('favorites', schema=None) as batch_op:
+        for name, columns in INDEXES:
+            batch_op.drop_index(name)
+            batch_op.create_index(name, columns, unique=False)
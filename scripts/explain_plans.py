@@ -0,0 +1,107 @@
+"""
+Prints the query plans of the lookups every authenticated and favorites route runs, and of
+the filters/sort orders of the catalog lists, with and without the indexes added in
+migrations a3f1c9d2e4b7 and 9c4e1b7d2f60.
+
+    $ python scripts/explain_plans.py              # plans against DATABASE_URL (or the sqlite default)
+    $ python scripts/explain_plans.py --compare    # also show the plans with the indexes dropped
+
+--compare drops the indexes to show the "before" plans. On SQLite that happens on an
+in-memory copy of the database. On Postgres it happens inside a transaction that is always
+rolled back, but DROP INDEX locks the table until then, so run it against a development
+copy of the database.
+"""
+import os
+import sys
+import sqlite3
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+from app import create_app
+from models import db, User, Planets, Characters, Starships, Favorites
+
+INDEXES = [
+    "ix_favorites_user_id_planets_id",
+    "ix_favorites_user_id_characters_id",
+    "ix_favorites_user_id_starships_id",
+    "ix_planets_name",
+    "ix_characters_name",
+    "ix_planets_climate_id",
+    "ix_planets_population_id",
+    "ix_characters_eye_color_id",
+    "ix_starships_crew_id",
+]
+
+def lookups():
+    return {
+        "user by email": db.select(User).filter_by(email="luke@example.com"),
+        "favorites by user": db.select(Favorites).filter_by(user_id=1),
+        "favorite planet of user": db.select(Favorites).filter_by(user_id=1, planets_id=1),
+        "favorite character of user": db.select(Favorites).filter_by(user_id=1, characters_id=1),
+        "favorite starship of user": db.select(Favorites).filter_by(user_id=1, starships_id=1),
+        "planet by name": db.select(Planets).filter_by(name="Tatooine"),
+        "character by name": db.select(Characters).filter_by(name="Luke Skywalker"),
+        "planets by climate, next page": db.select(Planets).filter_by(climate="arid").filter(Planets.id > 100).order_by(Planets.id).limit(101),
+        "top planets by population": db.select(Planets).order_by(Planets.population.desc(), Planets.id.desc()).limit(10),
+        "characters by eye color": db.select(Characters).filter_by(eye_color="blue").order_by(Characters.id).limit(101),
+        "starships by crew range": db.select(Starships).filter(Starships.crew >= 10, Starships.crew < 100).order_by(Starships.crew, Starships.id).limit(101),
+    }
+
+def explain(connection, statement):
+    dialect = connection.dialect.name
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    if dialect == "sqlite":
+        rows = connection.execute(text("EXPLAIN QUERY PLAN " + sql)).fetchall()
+        return [row[-1] for row in rows]
+    rows = connection.execute(text("EXPLAIN " + sql)).fetchall()
+    return [row[0] for row in rows]
+
+def sqlite_copy(engine):
+    # pysqlite does not open a transaction before DDL, so a DROP INDEX could not be
+    # rolled back: work on an in-memory copy instead. The statement cache is off because
+    # a cached EXPLAIN is not re-planned after the schema changes.
+    source = engine.raw_connection()
+    copy = sqlite3.connect(":memory:", check_same_thread=False, cached_statements=0)
+    try:
+        source.driver_connection.backup(copy)
+    finally:
+        source.close()
+    return create_engine("sqlite://", creator=lambda: copy, poolclass=StaticPool)
+
+def print_plans(connection, title):
+    print("=" * 80)
+    print(title)
+    print("=" * 80)
+    for name, statement in lookups().items():
+        print("-- " + name)
+        for line in explain(connection, statement):
+            print("   " + line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--compare", action="store_true", help="also print the plans without the new indexes")
+    args = parser.parse_args()
+
+    app = create_app({"ADMIN": "off"})
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name == "sqlite":
+            engine = sqlite_copy(engine)
+
+        with engine.connect() as connection:
+            print("database: " + connection.dialect.name)
+            transaction = connection.begin()
+            try:
+                print_plans(connection, "AFTER (with indexes)")
+                if args.compare:
+                    for index in INDEXES:
+                        connection.execute(text("DROP INDEX IF EXISTS " + index))
+                    print_plans(connection, "BEFORE (indexes dropped, rolled back afterwards)")
+            finally:
+                transaction.rollback()
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,41 @@
 import os
-from flask_admin import Admin
+import threading
+from flask import Flask
+from werkzeug.middleware.dispatcher import DispatcherMiddleware
 from models import db, User, Favorites, Characters, Planets, Starships
-from flask_admin.contrib.sqla import ModelView
 
-def setup_admin(app):
+# The admin UI is a Flask app of its own, mounted at /admin in front of the API. Flask-Admin
+# (and the pkg_resources scan it triggers) is a good part of the API's import time, and a
+# worker that only serves the API never needs it. ADMIN picks when it is built:
+#   lazy  - on the first request to /admin (the default)
+#   eager - at startup, like before
+#   off   - not mounted, /admin is a 404 of the API
+# Requests to /admin do not go through the API's access log and /metrics.
+
+ADMIN_MODES = ("lazy", "eager", "off")
+ADMIN_URL = "/admin"
+
+def create_admin_app(config):
+    """The Flask-Admin app, with the database settings of the API (config)."""
+    from flask_admin import Admin
+    from flask_admin.contrib.sqla import ModelView
+
+    app = Flask(__name__)
+    app.config.update(config)
     app.secret_key = os.environ.get('FLASK_APP_KEY', 'sample key')
     app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
-    admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3')
+    # its own engine: the admin's connections are opened on its first query, after the fork
+    db.init_app(app)
+    admin = Admin(app, name='4Geeks Admin', template_mode='bootstrap3', url='/')
 
  #Special MODELview for favorite table
     class FavoritesView(ModelView):
         column_list = ('characters_id', 'planets_id', 'starships_id', 'user_id')
-        form_columns = ('characters_id', 'planets_id', 'starships_id', 'user_id')  
+        form_columns = ('characters_id', 'planets_id', 'starships_id', 'user_id')
 
 
     # Add your models here, for example this is how we add a the User model to the admin
-        
+
     admin.add_view(ModelView(User, db.session))
     admin.add_view(ModelView(Characters, db.session))
     admin.add_view(ModelView(Planets, db.session))
@@ -23,8 +43,32 @@ def setup_admin(app):
     admin.add_view(FavoritesView(Favorites, db.session))
     # You can duplicate that line to add mew models
     # admin.add_view(ModelView(YourModelName, db.session))
+    return app
 
-     
+class LazyAdmin:
+    """WSGI app that builds the admin app on its first request, once per process."""
 
-# Add your models here: Favorites (ForeignKey)    
-    
\ No newline at end of file
+    def __init__(self, config):
+        self.config = config
+        self.app = None
+        self.lock = threading.Lock()
+
+    def build(self):
+        with self.lock:
+            if self.app is None:
+                self.app = create_admin_app(self.config)
+        return self.app
+
+    def __call__(self, environ, start_response):
+        return (self.app or self.build())(environ, start_response)
+
+def setup_admin(app):
+    mode = app.config['ADMIN']
+    if mode not in ADMIN_MODES:
+        raise RuntimeError("ADMIN must be lazy, eager or off, not %r" % mode)
+    if mode == "off":
+        return
+    admin = LazyAdmin(app.config)
+    if mode == "eager":
+        admin.build()
+    app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {ADMIN_URL: admin})
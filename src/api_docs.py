@@ -0,0 +1,93 @@
+import re
+import json
+import hashlib
+from flask import Response
+from flask_jwt_extended import view_decorators
+from utils import generate_sitemap
+from compression import matching_etag
+
+# The sitemap (/) and the OpenAPI document (/openapi.json) only change when the routes do.
+# setup_api_docs(app) builds both once, after every route is registered, and the views serve
+# the same bytes with a strong ETag: uptime probes and API explorers that send If-None-Match
+# get a 304 without a body.
+
+RULE_ARGUMENT = re.compile(r"<(?:(\w+)(?:\(([^)]*)\))?:)?(\w+)>")
+IGNORED_METHODS = {"HEAD", "OPTIONS"}
+
+class CachedDocument:
+    def __init__(self, body, mimetype):
+        self.body = body.encode("utf-8")
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(self.body).hexdigest()
+
+    def response(self):
+        matched = matching_etag(self.etag)
+        if matched is not None:
+            response = Response(status=304)
+            response.set_etag(matched)
+        else:
+            response = Response(self.body, mimetype=self.mimetype)
+            response.set_etag(self.etag)
+        # cached, but checked with the ETag on every use: a deploy can change the routes
+        response.cache_control.no_cache = True
+        return response
+
+def requires_jwt(view):
+    # @jwt_required() wraps the view in a function of flask_jwt_extended.view_decorators
+    return view.__code__.co_filename == view_decorators.__file__
+
+def path_parameters(rule):
+    """(OpenAPI path, parameters) of a werkzeug rule: /planets/<int:planet_id> is /planets/{planet_id}."""
+    parameters = []
+    for converter, arguments, name in RULE_ARGUMENT.findall(rule.rule):
+        if converter == "int":
+            schema = {"type": "integer"}
+        elif converter == "any":
+            schema = {"type": "string", "enum": [value.strip() for value in arguments.split(",")]}
+        else:
+            schema = {"type": "string"}
+        parameters.append({"name": name, "in": "path", "required": True, "schema": schema})
+    return RULE_ARGUMENT.sub(r"{\3}", rule.rule), parameters
+
+def operation(app, rule, parameters):
+    view = app.view_functions[rule.endpoint]
+    doc = (view.__doc__ or "").strip()
+    spec = {
+        "operationId": rule.endpoint,
+        "summary": doc.splitlines()[0] if doc else rule.endpoint.split(".")[-1].replace("_", " "),
+        "responses": {"200": {"description": "OK"}},
+    }
+    if parameters:
+        spec["parameters"] = parameters
+    if requires_jwt(view):
+        spec["security"] = [{"bearerAuth": []}]
+        spec["responses"]["401"] = {"description": "Missing or invalid access token"}
+    return spec
+
+def generate_openapi(app):
+    paths = {}
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        if rule.endpoint == "static":
+            continue
+        path, parameters = path_parameters(rule)
+        for method in sorted(rule.methods - IGNORED_METHODS):
+            paths.setdefault(path, {})[method.lower()] = operation(app, rule, parameters)
+    return {
+        "openapi": "3.0.3",
+        "info": {"title": "Star Wars API", "version": "1.0.0"},
+        "paths": paths,
+        "components": {
+            "securitySchemes": {"bearerAuth": {"type": "http", "scheme": "bearer", "bearerFormat": "JWT"}}
+        },
+    }
+
+def setup_api_docs(app):
+    """Builds the sitemap and the OpenAPI document, call it once every route is registered."""
+    with app.test_request_context("/"):
+        app.extensions["api_docs"] = {
+            "sitemap": CachedDocument(generate_sitemap(app), "text/html"),
+            "openapi": CachedDocument(json.dumps(generate_openapi(app), indent=2), "application/json"),
+        }
+
+def api_doc(app, name):
+    return app.extensions["api_docs"][name].response()
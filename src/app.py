@@ -2,43 +2,132 @@
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
 import os
-from flask import Flask, request, jsonify, url_for
-from flask_migrate import Migrate
-from flask_swagger import swagger
+from flask import Flask, Blueprint, request, jsonify, current_app
 from flask_cors import CORS
-from utils import APIException, generate_sitemap
+from utils import APIException, request_flag, request_limit, database_engine_options, env_flag
+from pagination import paginate
+from filters import apply_filters, sort_order
+from search import search
+from popularity import most_favorited, POPULAR_MODELS
+from export import export_response, EXPORT_MODELS
+from favorites import expand_favorites, parse_favorite_pairs, add_favorite, add_favorites, remove_favorite, remove_favorites, remove_favorite_by_id
+from bulk import bulk_load, iter_request_records
+from bulk_delete import delete_rows
+from jobs import setup_jobs, submit_job, cancel_job, accepted_response, check_request_size, request_records, FINISHED_STATUSES
+from identity import identity_claims, current_user_id, identity_cache
+from entity_cache import cached_entity_response, entity_results, entity_cache
 from admin import setup_admin
-from models import db, User, Planets, Characters, Starships, Favorites
+from api_docs import setup_api_docs, api_doc
+from compression import setup_compression
+from replicas import setup_replicas
+from ratelimit import setup_rate_limits, DEFAULT_LIMITS
+from versions import versioned
+from commands import setup_commands
+from json_provider import setup_json
+from logs import setup_logging, log_event
+from models import db, User, Planets, Characters, Starships, Favorites, Jobs
 from flask_jwt_extended import create_access_token
-from flask_jwt_extended import get_jwt_identity
 from flask_jwt_extended import jwt_required
 from flask_jwt_extended import JWTManager
 #from models import Person
 
-app = Flask(__name__)
-app.url_map.strict_slashes = False
+# every endpoint of the API, registered on the app by create_app()
+api = Blueprint("api", __name__)
 
-db_url = os.getenv("DATABASE_URL")
-if db_url is not None:
-    app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
-else:
-    app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+def create_app(config=None):
+    """Builds the API app. config overrides the settings read from the environment."""
+    app = Flask(__name__)
+    app.url_map.strict_slashes = False
 
-MIGRATE = Migrate(app, db)
-db.init_app(app)
-CORS(app)
-setup_admin(app)
+    db_url = os.getenv("DATABASE_URL")
+    if db_url is not None:
+        app.config['SQLALCHEMY_DATABASE_URI'] = db_url.replace("postgres://", "postgresql://")
+    else:
+        app.config['SQLALCHEMY_DATABASE_URI'] = "sqlite:////tmp/test.db"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = database_engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+    # comma separated, the GET requests read from them (replicas.py)
+    app.config['DATABASE_REPLICA_URLS'] = os.getenv("DATABASE_REPLICA_URLS", "")
+    app.config['REPLICA_LAG_SECONDS'] = int(os.getenv("REPLICA_LAG_SECONDS", 5))
+    app.config['REPLICA_EJECT_SECONDS'] = int(os.getenv("REPLICA_EJECT_SECONDS", 30))
+    app.config['REPLICA_CHECK_SECONDS'] = int(os.getenv("REPLICA_CHECK_SECONDS", 10))
+    app.config['PAGE_SIZE_DEFAULT'] = int(os.getenv("PAGE_SIZE_DEFAULT", 100))
+    app.config['PAGE_SIZE_MAX'] = int(os.getenv("PAGE_SIZE_MAX", 1000))
+    app.config['BULK_CHUNK_SIZE'] = int(os.getenv("BULK_CHUNK_SIZE", 500))
+    app.config['DELETE_CHUNK_SIZE'] = int(os.getenv("DELETE_CHUNK_SIZE", 1000))
+    app.config['SEARCH_LIMIT_DEFAULT'] = int(os.getenv("SEARCH_LIMIT_DEFAULT", 20))
+    app.config['SEARCH_LIMIT_MAX'] = int(os.getenv("SEARCH_LIMIT_MAX", 100))
+    app.config['SEARCH_MIN_LENGTH'] = int(os.getenv("SEARCH_MIN_LENGTH", 2))
+    app.config['SEARCH_CANDIDATES'] = int(os.getenv("SEARCH_CANDIDATES", 1000))
+    app.config['POPULAR_LIMIT_MAX'] = int(os.getenv("POPULAR_LIMIT_MAX", 100))
+    app.config['EXPORT_BATCH_SIZE'] = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+    # job worker threads per process, 0 when `flask jobs worker` runs them (jobs.py)
+    app.config['JOBS_THREADS'] = int(os.getenv("JOBS_THREADS", 1))
+    app.config['JOBS_POLL_SECONDS'] = int(os.getenv("JOBS_POLL_SECONDS", 5))
+    app.config['JOBS_HEARTBEAT_SECONDS'] = int(os.getenv("JOBS_HEARTBEAT_SECONDS", 10))
+    app.config['JOBS_STALE_SECONDS'] = int(os.getenv("JOBS_STALE_SECONDS", 60))
+    # what a job may store in its row, larger requests get a 413
+    app.config['JOBS_MAX_PARAMS_BYTES'] = int(os.getenv("JOBS_MAX_PARAMS_BYTES", 5 * 1024 * 1024))
+    app.config['JOBS_MAX_RECORDS'] = int(os.getenv("JOBS_MAX_RECORDS", 10000))
+    app.config['COMPRESS'] = env_flag("COMPRESS", True)
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv("COMPRESS_MIN_SIZE", 1024))
+    app.config['COMPRESS_LEVEL'] = int(os.getenv("COMPRESS_LEVEL", 6))
+    app.config['COMPRESS_BROTLI_QUALITY'] = int(os.getenv("COMPRESS_BROTLI_QUALITY", 4))
+    # proxies in front of the app that append to X-Forwarded-For (1 on Render), utils.client_address()
+    app.config['TRUSTED_PROXIES'] = int(os.getenv("TRUSTED_PROXIES", 0))
+    # token buckets per client and route class (ratelimit.py)
+    app.config['RATE_LIMIT'] = env_flag("RATE_LIMIT", True)
+    app.config['RATE_LIMITS'] = os.getenv("RATE_LIMITS", DEFAULT_LIMITS)
+    app.config['RATE_LIMIT_STORAGE'] = os.getenv("RATE_LIMIT_STORAGE", "")
+    # lazy: /admin is built on its first request, eager: at startup, off: no admin (admin.py)
+    app.config['ADMIN'] = os.getenv("ADMIN", "lazy")
+    # Setup the Flask-JWT-Extended extension
+    app.config["JWT_SECRET_KEY"] = "super-secret"  # Change this!
+    if config:
+        app.config.update(config)
+
+    db.init_app(app)
+    if os.environ.get("FLASK_RUN_FROM_CLI"):
+        # flask db upgrade/migrate/...: alembic takes longer to import than the rest of the
+        # API, gunicorn workers never need it
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    CORS(app)
+    JWTManager(app)
+    setup_admin(app)
+    setup_commands(app)
+    setup_json(app)
+    if env_flag("METRICS", True):
+        # metrics.py, and prometheus_client with it, are only imported when METRICS is on
+        from metrics import setup_metrics
+        setup_metrics(app)
+    setup_logging(app)
+    # the first hook after the logging: a request over its limit is rejected before any other work
+    setup_rate_limits(app)
+    # after the logging, whose hooks start the log pipeline of the worker and the request id
+    setup_replicas(app)
+    # after the logging too: the job threads of a worker log through its pipeline
+    setup_jobs(app)
+    setup_compression(app)
+    app.register_blueprint(api)
+    # last: the sitemap and the OpenAPI document list every route registered above
+    setup_api_docs(app)
+    return app
 
 # Handle/serialize errors like a JSON object
-@app.errorhandler(APIException)
+@api.app_errorhandler(APIException)
 def handle_invalid_usage(error):
     return jsonify(error.to_dict()), error.status_code
 
 # generate sitemap with all your endpoints
-@app.route('/')
+@api.route('/')
 def sitemap():
-    return generate_sitemap(app)
+    return api_doc(current_app, "sitemap")
+
+# OpenAPI 3 description of every endpoint, built at startup like the sitemap
+@api.route('/openapi.json')
+def openapi_spec():
+    return api_doc(current_app, "openapi")
 
                                          ########DEFINIMOS NUESTROS ENDPOINTS############
 #########################################################################################################################################
@@ -47,43 +136,52 @@ def sitemap():
 #########ENDPOINTS GET PARA OBTENER TODOS LOS REGISTROS DE UNA TABLA CONCRETA: 
 
 #OBTENER TODOS LOS USUARIOS: 
-@app.route('/all_users', methods=['GET'])
+@api.route('/all_users', methods=['GET'])
+@versioned(User)
 def get_all_users():
-    query_results = User.query.all()
-    results = list(map(lambda item: item.serialize(), query_results))
+    query_results, page = paginate(db.session.query(*User.projection()), User)
+    results = list(map(User.serialize_row, query_results))
 
     if results == []:
         return jsonify("no users in the database"), 404
     
     response_body = {
         "msg": "ok",
-        "results": results
+        "results": results,
+        **page
     }
     
     return jsonify(response_body), 200
 
 #OBTENER TODOS LOS PLANETAS
-@app.route('/all_planets', methods=['GET'])
+@api.route('/all_planets', methods=['GET'])
+@versioned(Planets)
 def get_all_planets():
-    query_results = Planets.query.all()
-    results = list(map(lambda item: item.serialize(), query_results))
+    # ?climate=arid&population[gte]=1000&order_by=population:desc, see filters.py
+    order_column, descending = sort_order(Planets)
+    query = apply_filters(db.session.query(*Planets.projection()), Planets)
+    query_results, page = paginate(query, Planets, order_column, descending)
+    results = list(map(Planets.serialize_row, query_results))
 
     if results == []:
         return jsonify("no planets in the database"), 404
     
     response_body = {
         "msg": "ok",
-        "results": results
+        "results": results,
+        **page
     }
     
     return jsonify(response_body), 200
 
 #OBTENER TODOS LOS PERSONAJES:
-@app.route('/all_characters', methods=['GET'])
+@api.route('/all_characters', methods=['GET'])
+@versioned(Characters)
 def get_all_characters():
-    query_results = Characters.query.all()
-    result_id = [item.id for item in query_results]
-    results = list(map(lambda item: item.serialize(), query_results))
+    order_column, descending = sort_order(Characters)
+    query = apply_filters(db.session.query(*Characters.projection()), Characters)
+    query_results, page = paginate(query, Characters, order_column, descending)
+    results = list(map(Characters.serialize_row, query_results))
 
     if results == []:
         return jsonify("no characters in the database"), 404
@@ -91,23 +189,28 @@ def get_all_characters():
     response_body = {
         
         "msg": "ok",
-        "results": results
+        "results": results,
+        **page
     }
     
     return jsonify(response_body), 200
 
 #OBTENER TODAS LAS NAVES ESPACIALES: 
-@app.route('/all_starships', methods=['GET'])
+@api.route('/all_starships', methods=['GET'])
+@versioned(Starships)
 def get_all_starships():
-    query_results = Starships.query.all()
-    results = list(map(lambda item: item.serialize(), query_results))
+    order_column, descending = sort_order(Starships)
+    query = apply_filters(db.session.query(*Starships.projection()), Starships)
+    query_results, page = paginate(query, Starships, order_column, descending)
+    results = list(map(Starships.serialize_row, query_results))
 
     if results == []:
         return jsonify("no starships in the database"), 404
     
     response_body = {
         "msg": "ok",
-        "results": results
+        "results": results,
+        **page
     }
     
     return jsonify(response_body), 200
@@ -116,89 +219,134 @@ def get_all_starships():
 
 
 #OBTENER UN USUARIO CONCRETO USANDO SU ID CON URL DINAMICA
-@app.route('/user/<int:user_id>', methods=['GET'])
+@api.route('/user/<int:user_id>', methods=['GET'])
+@versioned(User)
 def get_one_user(user_id):
-    query_results = User.query.filter_by(id=user_id).first()
-   
-
-    if query_results is None:
+    def build_body():
+        query_results = db.session.query(*User.projection()).filter(User.id == user_id).first()
+        if query_results is None:
+            return None
+        return {
+            "msg": "ok",
+            "results": User.serialize_row(query_results)
+        }
+
+    response = cached_entity_response(User, user_id, build_body)
+
+    if response is None:
         return jsonify({"msg": "there is no user matching the ID provided"}), 404
     
-    response_body = {
-        "msg": "ok",
-        "results": query_results.serialize()
-    }
-    return jsonify(response_body), 200
+    return response, 200
 
 #OBTENER UNA NAVE ESPACIAL CONCRETA USANDO SU ID CON URL DINAMICA
-@app.route('/starships/<int:starship_id>', methods=['GET'])
+@api.route('/starships/<int:starship_id>', methods=['GET'])
+@versioned(Starships)
 def get_one_starship(starship_id):
-    query_result = Starships.query.filter_by(id=starship_id).first()
-
-    if query_result is None:
+    def build_body():
+        query_result = db.session.query(*Starships.projection()).filter(Starships.id == starship_id).first()
+        if query_result is None:
+            return None
+        return {
+            "msg": "ok",
+            "results": Starships.serialize_row(query_result)
+        }
+
+    response = cached_entity_response(Starships, starship_id, build_body)
+
+    if response is None:
          return jsonify({"msg": "there is no starship matching the Name provided"}), 404
     
-    response_body = {
-        "msg": "ok",
-        "results": query_result.serialize()
-    }
-    return jsonify(response_body), 200
+    return response, 200
 
 #OBTENER UN PLANETA CONCRETO USANDO URL DINAMICA (cambiamos int por string)
-@app.route('/planets/<int:planet_id>', methods=['GET'])
+@api.route('/planets/<int:planet_id>', methods=['GET'])
+@versioned(Planets)
 def get_one_planet(planet_id):
-    query_result = Planets.query.filter_by(id=planet_id).first()
-   
-
-    if query_result is None:
+    def build_body():
+        query_result = db.session.query(*Planets.projection()).filter(Planets.id == planet_id).first()
+        if query_result is None:
+            return None
+        return {
+            "msg": "ok",
+            "results": Planets.serialize_row(query_result)
+        }
+
+    response = cached_entity_response(Planets, planet_id, build_body)
+
+    if response is None:
         return jsonify({"msg": "there is no planet matching the Name provided"}), 404
     
-    response_body = {
-        "msg": "ok",
-        "results": query_result.serialize()
-    }
-    return jsonify(response_body), 200
+    return response, 200
 
 
 
 #OBTENER UN PERSONAJE CONCRETO USANDO URL DINAMICA
-@app.route('/characters/<int:character_id>', methods=['GET'])
+@api.route('/characters/<int:character_id>', methods=['GET'])
+@versioned(Characters)
 def get_one_character(character_id):
-
-    query_result = Characters.query.filter_by(id=character_id).first()
-    print(query_result)
-    if query_result is None:
+    def build_body():
+        query_result = db.session.query(*Characters.projection()).filter(Characters.id == character_id).first()
+        log_event("character_loaded", character_id=character_id, found=query_result is not None)
+        if query_result is None:
+            return None
+        return {
+            "msg": "ok",
+            "id": query_result.id,
+            "results": Characters.serialize_row(query_result)
+        }
+
+    response = cached_entity_response(Characters, character_id, build_body)
+
+    if response is None:
         return jsonify({"msg": "there is no character matching the name provided"}), 404
-    
-    response_body = {
-        "msg": "ok",
-        "id": query_result.id,
-        "results": query_result.serialize()
-    }
-    return jsonify(response_body), 200
 
+    return response, 200
+
+
+#BUSCAR POR NOMBRE EN PERSONAJES, PLANETAS Y NAVES (/search?q=sky&type=characters,starships&limit=10)
+@api.route('/search', methods=['GET'])
+def search_names():
+    q = request.args.get("q", "").strip()
+    if not q:
+        return jsonify({"msg": "q is required"}), 400
+
+    results = search(q)
+    return jsonify({"msg": "ok", "results": results}), 200
+
+
+#LOS MAS FAVORITOS (/popular/planets?limit=10), servido desde los contadores de favorite_counts
+@api.route('/popular/<any(planets, characters, starships):table>', methods=['GET'])
+def get_popular(table):
+    limit = request_limit(10, current_app.config['POPULAR_LIMIT_MAX'])
+    results = most_favorited(POPULAR_MODELS[table], limit)
+    return jsonify({"msg": "ok", "results": results}), 200
+
+#EXPORTAR UNA TABLA ENTERA EN NDJSON O CSV (/export/characters?format=csv), enviada por lotes
+@api.route('/export/<any(planets, characters, starships):table>', methods=['GET'])
+def export_table(table):
+    return export_response(EXPORT_MODELS[table])
 
 ####### OBTENER TODOS LOS FAVORITOS DE UN USUARIO ######
-@app.route('/user/favorites', methods=['GET'])
+@api.route('/user/favorites', methods=['GET'])
 @jwt_required()
 def get_all_favorites_of_user():
-    email = get_jwt_identity()
+    user_id = current_user_id()
 
-    user_exists = User.query.filter_by(email=email).first()
-
-    if user_exists is None: 
+    if user_id is None: 
            return jsonify({"msg": "This user does not exist"}), 401
 
-    user_id = user_exists.id
-
-    query_results = Favorites.query.filter_by(user_id=user_id).all()
+    query_results = db.session.query(*Favorites.projection()).filter(Favorites.user_id == user_id).order_by(Favorites.id).all()
 
     # planet_exists = Planets.query.filter_by(id=planet_id).first()
     
 
     if query_results:
-        results = list(map(lambda item: item.serialize(), query_results))
-        print(results)
+        # ?expand=true devuelve tambien el personaje/planeta/nave completo de cada favorito
+        if request_flag("expand"):
+            results = expand_favorites(query_results)
+        else:
+            results = list(map(Favorites.serialize_row, query_results))
+        log_event("favorites_listed", user_id=user_id, count=len(results))
         return jsonify({"msg": "ok", "results": results}), 200
     
     else: 
@@ -242,7 +390,7 @@ def get_all_favorites_of_user():
     
 #CREAR UN USUARIO
 
-@app.route('/user', methods=['POST'])
+@api.route('/user', methods=['POST'])
 def add_new_user():
     data = request.json
 
@@ -266,10 +414,10 @@ def add_new_user():
     
 
 #CREAR UN PLANETA NUEVO
-@app.route('/planet', methods=['POST'])
+@api.route('/planet', methods=['POST'])
 def add_new_planet():
     data = request.json
-    print(data)
+    log_event("add_new_planet", body=data)
 
     planet_exists = Planets.query.filter_by(name=data["name"]).first()
     
@@ -294,17 +442,17 @@ def add_new_planet():
     
 
 #CREAR UNA NAVE ESPACIAL NUEVA
-@app.route('/starship', methods=['POST'])
+@api.route('/starship', methods=['POST'])
 def add_new_starship():
     data = request.json
-    print(data)
+    log_event("add_new_starship", body=data)
 
-    starship_exists = Starships.query.filter_by(model=data["model"]).first()
+    starship_exists = Starships.query.filter_by(name=data["name"]).first()
     
     if starship_exists is None: 
 
             new_starship = Starships(
-                model=data["model"], 
+                name=data["name"], 
                 manufacturer=data["manufacturer"], 
                 crew=data["crew"], 
                 passengers=data["passengers"], 
@@ -322,10 +470,10 @@ def add_new_starship():
     
 
 #CREAR UN PERSONAJE NUEVO
-@app.route('/character', methods=['POST'])
+@api.route('/character', methods=['POST'])
 def add_new_character():
     data = request.json
-    print(data)
+    log_event("add_new_character", body=data)
 
     character_exists = Characters.query.filter_by(name=data["name"]).first()
     
@@ -349,41 +497,49 @@ def add_new_character():
     else:
             return ({"msg": "this character is already included in the database"}), 200
 
+################# CARGA MASIVA DE PLANETAS, PERSONAJES Y NAVES ##################
+# body: array JSON o NDJSON (Content-Type: application/x-ndjson)
+# ?on_conflict=nothing (por defecto, ignora los nombres que ya existen) o ?on_conflict=update
+
+BULK_MODELS = {
+    "planets": Planets,
+    "characters": Characters,
+    "starships": Starships
+}
+
+@api.route('/<any(planets, characters, starships):table>/bulk', methods=['POST'])
+def bulk_add_catalog(table):
+    on_conflict = request.args.get("on_conflict", "nothing")
+    if request_flag("background"):
+        # ?background=true: the records are stored in the job and loaded by a job worker
+        records = request_records()
+        return accepted_response(submit_job("bulk_load", {"table": table, "on_conflict": on_conflict, "records": records}))
+    results = bulk_load(BULK_MODELS[table], iter_request_records(), on_conflict=on_conflict)
+    return jsonify({"msg": "ok", "results": results}), 200
+
 ################# AÑADIR FAVORITOS PARA USUARIOS ################################
 
 # AÑADIR PLANETA FAVORITO USANDO IDs EN LA URL DINAMICA 
-@app.route('/favorites/planet/<int:planet_id>', methods=['POST'])
+@api.route('/favorites/planet/<int:planet_id>', methods=['POST'])
 @jwt_required()
 def add_new_favorite_planet(planet_id):
 
-    email = get_jwt_identity()
-  
+    user_id = current_user_id()
 
-    user_exists = User.query.filter_by(email=email).first()
-
-    if user_exists is None: 
+    if user_id is None: 
            return jsonify({"msg": "This user does not exist"}), 401
 
-    user_id = user_exists.id
-
-    planet_exists = Planets.query.filter_by(id=planet_id).first()
-    
-    if planet_exists is None: 
-           return jsonify({"msg": "This fucking planet does not exist"}), 401
-    
-    
-    query_results = Favorites.query.filter_by(planets_id=planet_id, user_id=user_id).first()
-    print(query_results)
-    if query_results is None: 
+    # un solo INSERT: la FK comprueba que el planeta existe y el indice unico evita duplicados
+    try:
+        created = add_favorite(user_id, "planet", planet_id)
+    except APIException:
+           return jsonify({"msg": "This planet does not exist"}), 401
 
-            new_favorite = Favorites(planets_id=planet_id, user_id=user_id)
-            new_planet = Planets.query.filter_by(id=planet_id).first()
-            db.session.add(new_favorite)
-            db.session.commit()
+    if created: 
 
             response_body = {
                  "msg": "ok", 
-                 "results": new_planet.serialize()
+                 "results": entity_results(Planets, planet_id)
             }
             return jsonify(response_body), 200 
 
@@ -392,7 +548,7 @@ def add_new_favorite_planet(planet_id):
         
   
     
-# @app.route('/favorites/<int:item_id>', methods=['POST'])
+# @api.route('/favorites/<int:item_id>', methods=['POST'])
 # @jwt_required()
 # def add_new_favorite(item_id):
 #     data = request.json()
@@ -453,37 +609,25 @@ def add_new_favorite_planet(planet_id):
     
 
 # AÑADIR NAVE ESPACIAL FAVORITA USANDO IDs EN LA URL DINAMICA 
-@app.route('/favorites/starship/<int:starship_id>', methods=['POST'])
+@api.route('/favorites/starship/<int:starship_id>', methods=['POST'])
 @jwt_required()
 def add_new_favorite_starship(starship_id):
 
-    email = get_jwt_identity()
-
-    user_exists = User.query.filter_by(email=email).first()
+    user_id = current_user_id()
 
-    if user_exists is None: 
+    if user_id is None: 
            return jsonify({"msg": "This user does not exist"}), 401
 
-    user_id = user_exists.id
-
-    starships_exists = Starships.query.filter_by(id=starship_id).first()
-
-    if starships_exists is None: 
+    try:
+        created = add_favorite(user_id, "starship", starship_id)
+    except APIException:
            return jsonify({"msg": "This starship does not exist"}), 401
-    
 
-    query_results = Favorites.query.filter_by(starships_id=starship_id, user_id=user_id).first()
-
-    if query_results is None: 
-
-            new_favorite = Favorites(starships_id=starship_id, user_id=user_id)
-            new_starship = Starships.query.filter_by(id=starship_id).first()
-            db.session.add(new_favorite)
-            db.session.commit()
+    if created: 
 
             response_body = {
                  "msg": "ok", 
-                 "results": new_starship.serialize()
+                 "results": entity_results(Starships, starship_id)
             }
             return jsonify(response_body), 200 
 
@@ -491,51 +635,69 @@ def add_new_favorite_starship(starship_id):
             return ({"msg": "this user already has this starship as a favorite"}), 200
     
 #AÑADIR PERSONAJE FAVORITO (usando request.json: el cliente nos tiene que enviar ambos IDs en el body)
-@app.route('/favorites/character/<int:character_id>', methods=['POST'])
+@api.route('/favorites/character/<int:character_id>', methods=['POST'])
 @jwt_required()
 def add_new_favorite_character(character_id):
-    email = get_jwt_identity()
-    
-    user_exists = User.query.filter_by(email=email).first()
+    user_id = current_user_id()
 
-    if user_exists is None:
+    if user_id is None:
          return jsonify({"msg": "this user does not exist"}), 401
-    
-    user_id = user_exists.id
 
-    characters_exists = Characters.query.filter_by(id=character_id).first()
-    
-    if characters_exists is None:
+    try:
+        created = add_favorite(user_id, "character", character_id)
+    except APIException:
          return jsonify({"msg": "this character does not exist"}), 401
-   
-    query_results = Favorites.query.filter_by(characters_id=character_id, user_id=user_id).first()
 
-    if query_results is None: 
+    if created: 
 
-            new_favorite = Favorites(characters_id=character_id, user_id=user_id)
-            new_character = Characters.query.filter_by(id=character_id).first()
-            db.session.add(new_favorite)
-            db.session.commit()
-            return ({"msg": "ok", "results": new_character.serialize()}), 200
+            return ({"msg": "ok", "results": entity_results(Characters, character_id)}), 200
 
     else:
             return ({"msg": "this user already has this character as a favorite"}), 200
         
 
 
+# AÑADIR O BORRAR VARIOS FAVORITOS EN UNA SOLA TRANSACCION
+# body: [{"type": "planet", "id": 1}, {"type": "character", "id": 4}, ...]
+@api.route('/favorites/batch', methods=['POST'])
+@jwt_required()
+def add_favorites_batch():
+    user_id = current_user_id()
+
+    if user_id is None:
+         return jsonify({"msg": "this user does not exist"}), 401
+
+    pairs = parse_favorite_pairs(request.json)
+    created = add_favorites(user_id, pairs)
+
+    return jsonify({"msg": "ok", "results": {"added": len(created), "skipped": len(pairs) - len(created)}}), 200
+
+@api.route('/favorites/batch', methods=['DELETE'])
+@jwt_required()
+def delete_favorites_batch():
+    user_id = current_user_id()
+
+    if user_id is None:
+         return jsonify({"msg": "this user does not exist"}), 401
+
+    pairs = parse_favorite_pairs(request.json)
+    deleted = remove_favorites(user_id, pairs)
+
+    return jsonify({"msg": "ok", "results": {"deleted": deleted}}), 200
+
+
 ############################### ACTUALIZAR REGISTROS EN LA BASE DE DATOS USANDO PUT#########################
     
-#ACTUALIZAR USUARIO (USANDO SU NOMBRE COMO COINCIDENCIA DENTRO DEL BODY)    
-@app.route('/user', methods=['PUT'])
+#ACTUALIZAR USUARIO (USANDO SU EMAIL COMO COINCIDENCIA DENTRO DEL BODY, "name" ES SU NUEVO NOMBRE)    
+@api.route('/user', methods=['PUT'])
 def update_user():
     data = request.json
 
-    user = User.query.filter_by(name=data["name"]).first()
+    user = User.query.filter_by(email=data["email"]).first()
     
     if user: 
     
-            user.name=data["name"], 
-            user.email=data["email"],
+            user.first_name=data["name"]
             user.password=data["password"]
                 
             
@@ -550,7 +712,7 @@ def update_user():
 
  
 # ACTUALIZAR DATOS DE UN PLANETA USANDO URL DINAMICA E ID DEL PLANETA
-@app.route('/planet/<int:planet_id>', methods=['PUT'])
+@api.route('/planet/<int:planet_id>', methods=['PUT'])
 def update_planet(planet_id):
     data = request.json
 
@@ -558,9 +720,9 @@ def update_planet(planet_id):
     
     if planet: 
     
-            planet.name=data["name"], 
-            planet.climate=data["climate"], 
-            planet.population=data["population"], 
+            planet.name=data["name"]
+            planet.climate=data["climate"]
+            planet.population=data["population"]
             # planet.orbital_period=data["orbital_period"], 
             # planet.rotation_period=data["rotation_period"], 
             # planet.diameter=data["diameter"]
@@ -576,17 +738,17 @@ def update_planet(planet_id):
 
 ############################### BORRAR REGISTROS EN LA BASE DE DATOS USANDO DELETE#########################
 
-# BORRAR USUARIO EN BASE A SU NOMBRE        
-@app.route('/user', methods=['DELETE'])
+# BORRAR USUARIO EN BASE A SU EMAIL        
+@api.route('/user', methods=['DELETE'])
 def delete_user():
     data = request.json
 
-    user_exists = User.query.filter_by(name=data["name"]).first()
+    user_exists = User.query.filter_by(email=data["email"]).first()
     
     if user_exists: 
          
-            db.session.delete(user_exists)
-            db.session.commit()
+            # its favorites go first, delete_rows() forgets its identity and cache entry
+            delete_rows(User, User.id == user_exists.id)
             return ({"msg": "ok, its deleted"}), 200
 
         
@@ -597,10 +759,12 @@ def delete_user():
     
 
 # BORRAR TODOS LOS USUARIOS       
-@app.route('/users', methods=['DELETE'])
+@api.route('/users', methods=['DELETE'])
 def delete_all_users():
-    users_deleted = User.query.delete()
-    db.session.commit()
+    if request_flag("background"):
+        return accepted_response(submit_job("delete", {"table": "user"}))
+    # DELETE_CHUNK_SIZE users per transaction, their favorites first (bulk_delete.py)
+    users_deleted = delete_rows(User)["deleted"]
     
     if users_deleted > 0: 
             return ({"msg": "ok, all users have been deleted"}), 200
@@ -613,79 +777,43 @@ def delete_all_users():
 ########## BORRAR UN PLANETA FAVORITO DE UNA CUENTA DE UN USUARIO#############################
     
 # 1 #PRIMER MÉTODO, USANDO EL REQUEST.JSON PARA SABER IDS DE USUARIO Y PLANETA
-@app.route('/favorites/planet/<int:planets_id>', methods=['DELETE'])
+@api.route('/favorites/planet/<int:planets_id>', methods=['DELETE'])
 def delete_favorite_planet(planets_id):
     data = request.json
 
-    user_exists = User.query.filter_by(id=data["user_id"]).first()
-    planets_exists = Planets.query.filter_by(id=data["planets_id"]).first()
-    
-    if user_exists and planets_exists: 
-
-        query_results = Favorites.query.filter_by(planets_id=data["planets_id"], user_id=data["user_id"]).first()
+    if remove_favorite(data["user_id"], "planet", data["planets_id"]): 
 
-        if query_results: 
-         
-            db.session.delete(query_results)
-            db.session.commit()
             return ({"msg": "ok, its deleted"}), 200
 
-        
-
-        else: 
+    else: 
 
            return ({"msg": "there is nothing to delete"}), 200
 
        
 
 # 2 # SEGUNDO MÉTODO, USANDO LA URL DINÁMICA PARA SABER IDS DE USUARIO Y PLANETA (METODO OPTIMO)        
-@app.route('/favorites/character/<int:user_id>/<int:characters_id>', methods=['DELETE'])
+@api.route('/favorites/character/<int:user_id>/<int:characters_id>', methods=['DELETE'])
 def delete_favorite_character(user_id,characters_id):
-   
 
-    user_exists = User.query.filter_by(id=user_id).first()
-    character_exists = Characters.query.filter_by(id=characters_id).first()
-    
-    if user_exists and character_exists: 
+    if remove_favorite(user_id, "character", characters_id): 
 
-        query_results = Favorites.query.filter_by(characters_id=characters_id, user_id=user_id).first()
-
-        if query_results: 
-         
-            db.session.delete(query_results)
-            db.session.commit()
             return ({"msg": "ok, its deleted"}), 200
 
-        
-
-        else: 
+    else: 
 
            return ({"msg": "there is nothing to delete"}), 200
 
        
 #BORRAR UN FAVORITO USANDO EL ID DEL FAVORITO @@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@    
-@app.route('/favorites/<int:favorite_id>', methods=['DELETE'])
+@api.route('/favorites/<int:favorite_id>', methods=['DELETE'])
 @jwt_required()
 def delete_favorite(favorite_id):
-    email = get_jwt_identity()
-
-    user_exists = User.query.filter_by(email=email).first()
-    if user_exists is None: 
+    user_id = current_user_id()
+    if user_id is None: 
             return jsonify({"msg": "this user does not exist"})
-    
-    user_id = user_exists.id
 
-    favorite_exists = Favorites.query.filter_by(id=favorite_id).first()
-    if favorite_exists is None: 
-            return jsonify({"msg": "this favorite does not exist"})
-    
+    if remove_favorite_by_id(user_id, favorite_id): 
 
-    query_results = Favorites.query.filter_by(id=favorite_id, user_id=user_id).first()
-
-    if query_results: 
-         
-            db.session.delete(query_results)
-            db.session.commit()
             return ({"msg": "ok, its deleted"}), 200
 
     else: 
@@ -696,17 +824,16 @@ def delete_favorite(favorite_id):
 
         
 # BORRAR PLANETAS EN BASE A SU NOMBRE        
-@app.route('/planet', methods=['DELETE'])
+@api.route('/planet', methods=['DELETE'])
 def delete_planet():
     data = request.json
 
     
-    planet_exists = Planets.query.filter_by(name=data["name"]).first()
+    # the favorites of the planet go first, its cache entry is dropped by delete_rows()
+    planet_deleted = delete_rows(Planets, Planets.name == data["name"])["deleted"]
     
-    if planet_exists: 
+    if planet_deleted: 
          
-            db.session.delete(planet_exists)
-            db.session.commit()
             return ({"msg": "ok, its deleted"}), 200
 
         
@@ -716,7 +843,7 @@ def delete_planet():
            return ({"msg": "there is nothing to delete"}), 200
 
 # # BORRAR TODOS LOS PLANETAS        
-# @app.route('/planets', methods=['DELETE'])
+# @api.route('/planets', methods=['DELETE'])
 # def delete_all_planets():
    
 #     planets_deleted = Planets.query.delete()
@@ -735,21 +862,52 @@ def delete_planet():
 
 
 
+################# TAREAS EN SEGUNDO PLANO (jobs.py) ################################
+
+# ENCOLAR UNA TAREA LARGA, RESPONDE 202 CON LA TAREA Y SU URL EN Location
+@api.route('/jobs', methods=['POST'])
+def add_new_job():
+    check_request_size()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise APIException("the body must be a JSON object", status_code=400)
+    return accepted_response(submit_job(data.get("kind"), data.get("params", {})))
+
+# ESTADO Y PROGRESO DE UNA TAREA
+@api.route('/jobs/<int:job_id>', methods=['GET'])
+def get_one_job(job_id):
+    job = db.session.get(Jobs, job_id)
+    if job is None:
+        return jsonify({"msg": "there is no job with this id"}), 404
+    return jsonify({"msg": "ok", "results": job.serialize()}), 200
+
+# CANCELAR UNA TAREA: EN COLA SE CANCELA YA, EN CURSO AL TERMINAR SU BLOQUE ACTUAL
+@api.route('/jobs/<int:job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    job = db.session.get(Jobs, job_id)
+    if job is None:
+        return jsonify({"msg": "there is no job with this id"}), 404
+    if job.status in FINISHED_STATUSES:
+        return jsonify({"msg": "the job is already " + job.status, "results": job.serialize()}), 409
+    job = cancel_job(job)
+    if job.status == "cancelled":
+        return jsonify({"msg": "ok, its cancelled", "results": job.serialize()}), 200
+    return jsonify({"msg": "the job will stop after its current chunk", "results": job.serialize()}), 202
+
+
+
 ##################GENERAR UN TOKEN AL HACER UN LOGIN#######################
-    
-# Setup the Flask-JWT-Extended extension
-app.config["JWT_SECRET_KEY"] = "super-secret"  # Change this!
-jwt = JWTManager(app)
 
 # Create a route to authenticate your users and return JWTs. The
 # create_access_token() function is used to actually generate the JWT.
-@app.route("/login", methods=["POST"])
+@api.route("/login", methods=["POST"])
 def login():
     email = request.json.get("email", None)
     password = request.json.get("password", None)
 
     query_results = User.query.filter_by(email=email).first()
-    print(query_results)
+    # the user id, never the email: failed attempts would log the addresses people typed
+    log_event("login", user_id=query_results.id if query_results is not None else None, found=query_results is not None)
 
     if query_results is None:
             return jsonify({"msg": "Bad Request"}), 404
@@ -757,12 +915,12 @@ def login():
     if email != query_results.email or password != query_results.password:
          return jsonify({"msg": "Bad email or password"}), 401
     
-    access_token = create_access_token(identity=email)
+    access_token = create_access_token(identity=email, additional_claims=identity_claims(query_results))
     return jsonify(access_token=access_token)
 
 
 #SIGN IN ############################################################################################
-@app.route("/signup", methods=["POST"])
+@api.route("/signup", methods=["POST"])
 def signup():
     first_name = request.json.get("first_name", None)
     last_name = request.json.get("last_name", None)
@@ -781,7 +939,7 @@ def signup():
                 )
             db.session.add(new_user)
             db.session.commit()
-            access_token = create_access_token(identity=email)
+            access_token = create_access_token(identity=email, additional_claims=identity_claims(new_user))
             return jsonify(access_token=access_token), 200
             
     else:
@@ -793,25 +951,25 @@ def signup():
 
 
 # PROTEGER UNA RUTA
-@app.route("/favorites", methods=["GET"])
+@api.route("/favorites", methods=["GET"])
 @jwt_required()
 def favorites_protected():
-    # Access the identity of the current user with get_jwt_identity
-    email = get_jwt_identity()
-    print(email)
-
-    user = User.query.filter_by(email=email).first()
-    print(user)
+    # Access the id of the current user (JWT claim + per-worker identity cache)
+    user_id = current_user_id()
+    log_event("favorites_protected", user_id=user_id)
     
-    if user is None: 
+    if user_id is None: 
            return jsonify("wrong authorization/restricted area"), 401
 
     
-    user_favorites = Favorites.query.filter_by(user_id=user.id).all()
+    user_favorites = db.session.query(*Favorites.projection()).filter(Favorites.user_id == user_id).order_by(Favorites.id).all()
 
     if user_favorites:
     
-        results = list(map(lambda item: item.serialize(), user_favorites))
+        if request_flag("expand"):
+            results = expand_favorites(user_favorites)
+        else:
+            results = list(map(Favorites.serialize_row, user_favorites))
         return jsonify({"msg": "ok", "results": results}), 200
     
     else: 
@@ -820,12 +978,10 @@ def favorites_protected():
 
 # CONDICIONAL RENDERING #############################################################################
 
-@app.route("/valid-token", methods=["GET"])
+@api.route("/valid-token", methods=["GET"])
 @jwt_required()
 def valid_token():
-     current_user = get_jwt_identity()
-     querty_results = User.query.filter_by(email=current_user).first()
-     if querty_results is None:
+     if current_user_id() is None:
             return jsonify({"msg": "user does not exist",
                            "is_logged": False}), 404
      
@@ -836,7 +992,20 @@ def valid_token():
 
 
 
+# ESTADISTICAS DE LAS CACHES (hits/misses por worker) #################################################
+
+@api.route("/cache/stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "msg": "ok",
+        "results": {
+            "entity": entity_cache.stats(),
+            "identity": identity_cache.stats()
+        }
+    }), 200
+
+
 # this only runs if `$ python src/app.py` is executed
 if __name__ == '__main__':
     PORT = int(os.environ.get('PORT', 3000))
-    app.run(host='0.0.0.0', port=PORT, debug=False)
+    create_app().run(host='0.0.0.0', port=PORT, debug=False)
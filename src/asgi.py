@@ -0,0 +1,10 @@
+# ASGI entry point: the read endpoints run on an async engine (async_api.py), the rest of the
+# API through the same Flask app as wsgi.py.
+#   uvicorn asgi:application --app-dir src --workers 2
+#   GUNICORN_PROFILE=asgi gunicorn asgi --chdir ./src/ -c gunicorn.conf.py
+
+from app import create_app
+from async_api import create_asgi_app
+
+flask_app = create_app()
+application = create_asgi_app(flask_app)
@@ -0,0 +1,321 @@
+import os
+import sys
+import asyncio
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from flask import request, jsonify
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from sqlalchemy import func
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Query
+from werkzeug.exceptions import HTTPException
+from models import db, User, Characters, Planets, Starships, Favorites
+from utils import request_flag, database_engine_options
+from filters import apply_filters, sort_order
+from pagination import get_page_size, page_query, next_page
+from entity_cache import entity_cache, entity_key, cache_entity_body, entity_response
+from favorites import expansion_statements, add_expansion
+from identity import identity_cache, identity_key, identity_statement, remember_identity
+from versions import version_statement, version_etag, not_modified
+from compression import matching_etag
+from logs import log_event
+
+# Async serving mode (asgi.py): the read endpoints below run as coroutines on an async
+# SQLAlchemy engine (aiosqlite or asyncpg), so one worker process keeps many requests waiting
+# on the database at once instead of one per thread. Everything else (writes, /search,
+# /popular, /admin, ...) goes to the Flask app, run in a pool of ASGI_THREADS threads.
+#
+# The coroutines run inside a Flask request context of the same app: the filters, the
+# pagination, the caches, the ETags, the JWT checks, the error handlers and the after_request
+# hooks (CORS, access log, /metrics, compression) are the ones of the WSGI app, and the
+# responses are the same, byte for byte.
+#
+# Needs uvicorn and aiosqlite (asyncpg on Postgres), all in the Pipfile, see docs/PERFORMANCE.md.
+
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def async_database_url(database_url):
+    url = make_url(database_url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise RuntimeError("the async read path supports SQLite and Postgres, not " + url.get_backend_name())
+    return url.set(drivername=driver)
+
+########## VIEWS ##########
+# Same bodies and status codes as their namesakes in app.py.
+
+LIST_NAMES = {User: "users", Planets: "planets", Characters: "characters", Starships: "starships"}
+
+async def list_view(session, model, filtered=True):
+    order_column, descending = sort_order(model) if filtered else (None, False)
+    query = Query(model.projection())
+    if filtered:
+        query = apply_filters(query, model)
+    limit = get_page_size()
+    rows = (await session.execute(page_query(query, model, order_column, descending, limit).statement)).all()
+    rows, next_cursor = next_page(rows, limit, order_column)
+    page = {"next_cursor": next_cursor}
+    if request_flag("total"):
+        page["total"] = await session.scalar(db.select(func.count()).select_from(query.order_by(None).statement.subquery()))
+    results = list(map(model.serialize_row, rows))
+
+    if results == []:
+        return jsonify("no %s in the database" % LIST_NAMES[model]), 404
+
+    return jsonify({"msg": "ok", "results": results, **page}), 200
+
+async def detail_view(session, model, entity_id, not_found, with_id=False):
+    data = entity_cache.get(entity_key(model, entity_id))
+    if data is None:
+        row = (await session.execute(db.select(*model.projection()).where(model.id == entity_id))).first()
+        if model is Characters:
+            log_event("character_loaded", character_id=entity_id, found=row is not None)
+        if row is None:
+            return jsonify({"msg": not_found}), 404
+        body = {"msg": "ok"}
+        if with_id:
+            body["id"] = row.id
+        body["results"] = model.serialize_row(row)
+        data = cache_entity_body(model, entity_id, body)
+    return entity_response(data), 200
+
+async def current_user_id(session):
+    """identity.current_user_id() on the async session."""
+    email = get_jwt_identity()
+    user_id = identity_cache.get(identity_key(email))
+    if user_id is not None:
+        return user_id
+    return remember_identity(email, (await session.execute(identity_statement(email))).first())
+
+async def get_all_users(session):
+    return await list_view(session, User, filtered=False)
+
+async def get_all_planets(session):
+    return await list_view(session, Planets)
+
+async def get_all_characters(session):
+    return await list_view(session, Characters)
+
+async def get_all_starships(session):
+    return await list_view(session, Starships)
+
+async def get_one_user(session, user_id):
+    return await detail_view(session, User, user_id, "there is no user matching the ID provided")
+
+async def get_one_starship(session, starship_id):
+    return await detail_view(session, Starships, starship_id, "there is no starship matching the Name provided")
+
+async def get_one_planet(session, planet_id):
+    return await detail_view(session, Planets, planet_id, "there is no planet matching the Name provided")
+
+async def get_one_character(session, character_id):
+    return await detail_view(session, Characters, character_id, "there is no character matching the name provided", with_id=True)
+
+async def get_all_favorites_of_user(session):
+    verify_jwt_in_request()
+    user_id = await current_user_id(session)
+
+    if user_id is None:
+        return jsonify({"msg": "This user does not exist"}), 401
+
+    rows = (await session.execute(
+        db.select(*Favorites.projection()).where(Favorites.user_id == user_id).order_by(Favorites.id)
+    )).all()
+
+    if not rows:
+        return jsonify({"msg": "this user has no favorites yet"}), 404
+
+    results = list(map(Favorites.serialize_row, rows))
+    if request_flag("expand"):
+        for expansion, statement in expansion_statements(results):
+            add_expansion(results, expansion, await session.execute(statement))
+    log_event("favorites_listed", user_id=user_id, count=len(results))
+    return jsonify({"msg": "ok", "results": results}), 200
+
+async def valid_token(session):
+    verify_jwt_in_request()
+    if await current_user_id(session) is None:
+        return jsonify({"msg": "user does not exist", "is_logged": False}), 404
+    return jsonify({"is_logged": True}), 200
+
+# endpoint -> (coroutine, model whose version gives the ETag)
+ASYNC_VIEWS = {
+    "api.get_all_users": (get_all_users, User),
+    "api.get_all_planets": (get_all_planets, Planets),
+    "api.get_all_characters": (get_all_characters, Characters),
+    "api.get_all_starships": (get_all_starships, Starships),
+    "api.get_one_user": (get_one_user, User),
+    "api.get_one_starship": (get_one_starship, Starships),
+    "api.get_one_planet": (get_one_planet, Planets),
+    "api.get_one_character": (get_one_character, Characters),
+    "api.get_all_favorites_of_user": (get_all_favorites_of_user, None),
+    "api.valid_token": (valid_token, None),
+}
+
+########## ASGI ##########
+
+def build_environ(scope, body):
+    """WSGI environ of an ASGI http scope, body being a file with the request body."""
+    script_name = scope.get("root_path", "").encode("utf-8").decode("latin-1")
+    path_info = scope["path"].encode("utf-8").decode("latin-1")
+    if script_name and path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": script_name,
+        "PATH_INFO": path_info,
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope["http_version"],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        # the whole body is in the file: read it to the end, with or without a Content-Length
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_LENGTH", "CONTENT_TYPE"):
+            name = "HTTP_" + name
+        value = value.decode("latin-1")
+        environ[name] = environ[name] + "," + value if name in environ else value
+    return environ
+
+def start_message(status, headers):
+    return {
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+    }
+
+class AsyncAPI:
+    """ASGI app serving ASYNC_VIEWS with an async engine and the rest with the Flask app."""
+
+    def __init__(self, app, threads):
+        self.app = app
+        database_url = app.config["SQLALCHEMY_DATABASE_URI"]
+        try:
+            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+            self.engine = create_async_engine(async_database_url(database_url), **database_engine_options(database_url))
+        except ImportError as error:
+            raise RuntimeError("the async read path needs aiosqlite (SQLite) or asyncpg (Postgres), see the Pipfile: %s" % error)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix="wsgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            raise RuntimeError("unsupported ASGI scope " + scope["type"])
+
+        # bodies of more than 1 MB (bulk loads) are spooled to disk
+        body = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+        while True:
+            message = await receive()
+            body.write(message.get("body", b""))
+            if not message.get("more_body"):
+                break
+        body.seek(0)
+        environ = build_environ(scope, body)
+        try:
+            view = self.async_view(environ)
+            if view is None:
+                await self.run_wsgi(environ, send)
+            else:
+                await self.run_async(view, environ, send)
+        finally:
+            body.close()
+
+    def async_view(self, environ):
+        if environ["REQUEST_METHOD"] != "GET":
+            return None
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            # 404s, 405s and redirects come from the Flask app
+            return None
+        return ASYNC_VIEWS.get(endpoint)
+
+    async def run_async(self, view, environ, send):
+        # what Flask.wsgi_app does, with an awaited view
+        with self.app.request_context(environ):
+            try:
+                try:
+                    rv = self.app.preprocess_request()
+                    if rv is None:
+                        async with self.sessions() as session:
+                            rv = await self.dispatch(session, *view)
+                except Exception as error:
+                    rv = self.app.handle_user_exception(error)
+                response = self.app.finalize_request(rv)
+            except Exception as error:
+                response = self.app.handle_exception(error)
+        await send(start_message(response.status_code, response.headers.to_wsgi_list()))
+        await send({"type": "http.response.body", "body": response.get_data()})
+
+    async def dispatch(self, session, function, model):
+        if model is None:
+            return await function(session, **request.view_args)
+        # versions.versioned(), on the async session
+        etag = version_etag(await session.scalar(version_statement(model)) or 0)
+        matched = matching_etag(etag)
+        if matched is not None:
+            return not_modified(matched)
+        response = self.app.make_response(await function(session, **request.view_args))
+        if response.status_code == 200:
+            response.set_etag(etag)
+        return response
+
+    async def run_wsgi(self, environ, send):
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            start = []
+
+            def start_response(status, headers, exc_info=None):
+                start[:] = [start_message(int(status.split(" ", 1)[0]), headers)]
+
+            iterable = self.app(environ, start_response)
+            started = False
+            try:
+                # chunk by chunk: the streaming responses stay streamed
+                for chunk in iterable:
+                    if not chunk:
+                        continue
+                    if not started:
+                        send_from_thread(start[0])
+                        started = True
+                    send_from_thread({"type": "http.response.body", "body": chunk, "more_body": True})
+            finally:
+                if hasattr(iterable, "close"):
+                    iterable.close()
+            if not started:
+                send_from_thread(start[0])
+            send_from_thread({"type": "http.response.body"})
+
+        await loop.run_in_executor(self.executor, run)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+def create_asgi_app(app):
+    return AsyncAPI(app, int(os.getenv("ASGI_THREADS", 8)))
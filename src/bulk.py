@@ -0,0 +1,183 @@
+import json
+import functools
+from flask import request, current_app
+from sqlalchemy import Integer, String
+from sqlalchemy.exc import SQLAlchemyError
+from models import db
+from utils import APIException, dialect_insert
+from entity_cache import invalidate_entity
+
+# Bulk ingestion of catalog rows (planets, characters, starships): records are validated
+# and written in chunks, each chunk is one executemany INSERT ... ON CONFLICT (name) in its
+# own transaction. Needs the unique name indexes and, on SQLite, version 3.35+ (RETURNING).
+
+NDJSON_MIMETYPES = ("application/x-ndjson", "application/jsonl", "application/json-lines")
+ON_CONFLICT_ACTIONS = ("nothing", "update")
+INTEGER_MIN, INTEGER_MAX = -2 ** 31, 2 ** 31 - 1
+
+def iter_ndjson_records(lines):
+    """Yields (index, record) of NDJSON lines, record None for a line that isn't JSON."""
+    index = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield index, json.loads(line)
+        except ValueError:
+            yield index, None
+        index += 1
+
+def iter_request_records():
+    """Yields (index, record) from a JSON array body or, for NDJSON, line by line from the stream."""
+    if request.mimetype in NDJSON_MIMETYPES:
+        yield from iter_ndjson_records(request.stream)
+        return
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, list):
+        raise APIException("the body must be a JSON array or NDJSON", status_code=400)
+    for index, record in enumerate(data):
+        yield index, record
+
+def iter_chunks(records, size):
+    chunk = []
+    for item in records:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+@functools.lru_cache(maxsize=None)
+def catalog_columns(model):
+    # cached: validate_record() runs once per record of the loads
+    return tuple(column for column in model.__table__.columns if not column.primary_key)
+
+def validate_record(model, record):
+    """Returns (row, error): the values to insert, or why the record was rejected."""
+    if not isinstance(record, dict):
+        return None, "record is not a JSON object"
+
+    row = {}
+    for column in catalog_columns(model):
+        value = record.get(column.name)
+        if value is None:
+            if not column.nullable:
+                return None, "missing field: " + column.name
+            row[column.name] = None
+            continue
+
+        if isinstance(column.type, Integer):
+            if isinstance(value, bool):
+                return None, column.name + " must be an integer"
+            try:
+                value = int(value)
+            except (ValueError, TypeError):
+                return None, column.name + " must be an integer"
+            # INTEGER on Postgres: a larger value would fail the whole chunk
+            if not INTEGER_MIN <= value <= INTEGER_MAX:
+                return None, column.name + " is out of range"
+        elif isinstance(column.type, String):
+            if not isinstance(value, str):
+                return None, column.name + " must be a string"
+            if column.type.length and len(value) > column.type.length:
+                return None, column.name + " is too long"
+        row[column.name] = value
+
+    return row, None
+
+def upsert_statement(model, on_conflict):
+    table = model.__table__
+    statement = dialect_insert(db.session)(table)
+    if on_conflict == "update":
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.name],
+            set_={column.name: statement.excluded[column.name] for column in catalog_columns(model) if column.name != "name"}
+        )
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=[table.c.name])
+    return statement.returning(table.c.id)
+
+def chunk_report(chunk):
+    return {"received": len(chunk), "inserted": 0, "updated": 0, "skipped": 0, "collapsed": 0, "failed": 0,
+            "errors": [], "duplicates": []}
+
+def chunk_rows(model, chunk, on_conflict, report):
+    """The valid rows of chunk by name, one per name. Counts the rest in report.
+
+    One statement can't write a name twice (Postgres refuses to update a row twice), so the
+    records of a chunk that share a name are collapsed into one before the upsert: the first
+    with on_conflict=nothing, the last with update, which is what writing them one after the
+    other would leave. Each record dropped that way is listed in report["duplicates"] with
+    the index of the record written in its place."""
+    rows = {}
+    indexes = {}
+    dropped = {}
+    for index, record in chunk:
+        row, error = validate_record(model, record)
+        if error:
+            report["errors"].append({"index": index, "error": error})
+            continue
+        name = row["name"]
+        if name in rows:
+            dropped.setdefault(name, []).append(index if on_conflict == "nothing" else indexes[name])
+            if on_conflict == "nothing":
+                continue
+        rows[name] = row
+        indexes[name] = index
+    for name, collapsed in dropped.items():
+        report["duplicates"].extend({"index": index, "written": indexes[name]} for index in collapsed)
+    report["duplicates"].sort(key=lambda duplicate: duplicate["index"])
+    report["collapsed"] = len(report["duplicates"])
+    return rows
+
+def write_chunk(model, chunk, on_conflict):
+    report = chunk_report(chunk)
+    rows = chunk_rows(model, chunk, on_conflict, report)
+    if not rows:
+        return report
+
+    try:
+        existing = set()
+        if on_conflict == "update":
+            existing = set(db.session.scalars(db.select(model.name).where(model.name.in_(list(rows)))))
+        ids = db.session.scalars(upsert_statement(model, on_conflict), list(rows.values())).all()
+        db.session.commit()
+    except SQLAlchemyError as error:
+        db.session.rollback()
+        report["failed"] = len(rows)
+        report["errors"].append({"index": None, "error": "chunk failed: " + type(error).__name__})
+        return report
+
+    if on_conflict == "update":
+        report["updated"] = len(existing)
+        report["inserted"] = len(ids) - len(existing)
+        for entity_id in ids:
+            invalidate_entity(model, entity_id)
+    else:
+        report["inserted"] = len(ids)
+        report["skipped"] += len(rows) - len(ids)
+    return report
+
+def bulk_load(model, records, on_conflict="nothing", chunk_size=None, write=write_chunk, progress=None):
+    """Writes records chunk by chunk with write(model, chunk, on_conflict) and returns the
+    totals and the report of every chunk. progress(totals, report) is called after each chunk."""
+    if on_conflict not in ON_CONFLICT_ACTIONS:
+        raise APIException("on_conflict must be one of: " + ", ".join(ON_CONFLICT_ACTIONS), status_code=400)
+    chunk_size = chunk_size or current_app.config["BULK_CHUNK_SIZE"]
+
+    totals = {"received": 0, "inserted": 0, "updated": 0, "skipped": 0, "collapsed": 0, "failed": 0, "invalid": 0}
+    chunks = []
+    for number, chunk in enumerate(iter_chunks(records, chunk_size)):
+        report = write(model, chunk, on_conflict)
+        report["chunk"] = number
+        chunks.append(report)
+        for key in ("received", "inserted", "updated", "skipped", "collapsed", "failed"):
+            totals[key] += report[key]
+        totals["invalid"] += len([error for error in report["errors"] if error["index"] is not None])
+        if progress is not None:
+            progress(totals, report)
+
+    return {**totals, "chunks": chunks}
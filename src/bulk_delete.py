@@ -0,0 +1,71 @@
+from flask import current_app
+from models import db, User, Characters, Planets, Starships, Favorites, FavoriteCounts
+from favorites import CHANGED_COLUMNS
+from popularity import count_changes, decrement_counts
+from identity import forget_identity
+from entity_cache import invalidate_entity
+
+# Bulk deletes of users and catalog rows (DELETE /users, DELETE /planet, `flask delete`): the
+# rows are deleted DELETE_CHUNK_SIZE at a time in id order, one transaction per chunk, so the
+# table is never locked for the whole delete and the other writers get in between chunks.
+# The favorites that reference a chunk go first, with one DELETE ... WHERE <column> IN (...),
+# and come off favorite_counts in the same transaction. A chunk that commits stays deleted:
+# a delete that stops half way can be run again, it starts over from the rows left.
+
+# model -> the favorites column that references it
+REFERENCING_COLUMNS = {
+    User: Favorites.user_id,
+    Characters: Favorites.characters_id,
+    Planets: Favorites.planets_id,
+    Starships: Favorites.starships_id,
+}
+DELETE_MODELS = {model.__tablename__: model for model in REFERENCING_COLUMNS}
+
+def chunk_ids(model, criteria, after, chunk_size):
+    """The next chunk_size ids of model matching criteria, after the id `after` (keyset)."""
+    statement = db.select(model.id).where(model.id > after, *criteria).order_by(model.id).limit(chunk_size)
+    return db.session.scalars(statement).all()
+
+def delete_chunk(model, ids):
+    """Deletes the rows ids of model and the favorites that reference them, in the caller's
+    transaction. Returns (deleted rows, deleted favorites)."""
+    favorites = db.session.execute(
+        db.delete(Favorites).where(REFERENCING_COLUMNS[model].in_(ids)).returning(*CHANGED_COLUMNS)
+    ).all()
+    decrement_counts(count_changes(favorites))
+    if model is not User:
+        # the counters of the rows themselves are 0 now, they go with the rows
+        db.session.execute(
+            db.delete(FavoriteCounts).where(FavoriteCounts.kind == model.__tablename__, FavoriteCounts.entity_id.in_(ids))
+        )
+    returned = (model.id, model.email) if model is User else (model.id,)
+    rows = db.session.execute(db.delete(model).where(model.id.in_(ids)).returning(*returned)).all()
+    return rows, len(favorites)
+
+def delete_rows(model, *criteria, chunk_size=None, progress=None):
+    """Deletes the rows of model that match criteria (all of them without criteria) chunk by
+    chunk and returns the totals. progress(totals) is called after each chunk's commit."""
+    chunk_size = chunk_size or current_app.config["DELETE_CHUNK_SIZE"]
+    totals = {"deleted": 0, "favorites": 0, "chunks": 0}
+    after = 0
+    while True:
+        ids = chunk_ids(model, criteria, after, chunk_size)
+        if not ids:
+            break
+        try:
+            rows, favorites = delete_chunk(model, ids)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        for row in rows:
+            invalidate_entity(model, row.id)
+            if model is User:
+                forget_identity(row.email, row.id)
+        totals["deleted"] += len(rows)
+        totals["favorites"] += favorites
+        totals["chunks"] += 1
+        after = ids[-1]
+        if progress is not None:
+            progress(totals)
+    return totals
@@ -0,0 +1,134 @@
+import time
+import threading
+from collections import OrderedDict
+
+# LRUCache is a small in-process cache. Each gunicorn worker gets its own copy, so entries
+# are only invalidated in the worker that handled the write: keep the TTLs short.
+# SharedCache keeps the entries in a server every worker talks to (redis), so an
+# invalidation is seen by all of them.
+
+_MISSING = object()
+
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "backend": "local",
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize
+        }
+
+class SharedCache:
+    """Cache kept in a redis server. `client` only needs redis-py's get/set/delete/scan_iter,
+    so LocalRedis can stand in for it in tests and local development."""
+
+    def __init__(self, client, prefix="swapi:", ttl=300):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+        # counted per worker
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, value, ex=ttl or None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        return {
+            "backend": "shared",
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+class LocalRedis:
+    """In-memory stand-in for a redis client, for tests and running without a redis server."""
+
+    def __init__(self):
+        self._cache = LRUCache(maxsize=float("inf"), ttl=None)
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value, ex=None):
+        self._cache.set(key, value, ttl=ex)
+
+    def delete(self, *keys):
+        for key in keys:
+            self._cache.delete(key)
+
+    def scan_iter(self, match="*"):
+        prefix = match.rstrip("*")
+        with self._cache._lock:
+            return [key for key in self._cache._data if key.startswith(prefix)]
+
+def make_cache(url=None, maxsize=1024, ttl=60, prefix="swapi:"):
+    """CACHE_URL unset -> per-worker LRUCache, "local://" -> SharedCache over LocalRedis,
+    "redis://..." -> SharedCache over a real redis server (needs the redis package)."""
+    if not url:
+        return LRUCache(maxsize=maxsize, ttl=ttl)
+    if url == "local://":
+        return SharedCache(LocalRedis(), prefix=prefix, ttl=ttl)
+
+    import redis
+    return SharedCache(redis.Redis.from_url(url), prefix=prefix, ttl=ttl)
@@ -0,0 +1,163 @@
+import io
+import os
+import re
+import csv
+import json
+from contextlib import contextmanager
+from sqlalchemy import Integer, text
+from sqlalchemy.exc import SQLAlchemyError
+from models import db, Characters, Planets, Starships
+from bulk import bulk_load, catalog_columns, chunk_report, chunk_rows, iter_ndjson_records, write_chunk
+from entity_cache import invalidate_entity
+from versions import written_tables
+
+# `flask catalog load` (commands.py): loads SWAPI dumps of people, planets and starships.
+# A dump is NDJSON, read line by line, or a JSON array or SWAPI page ({"results": [...]}),
+# parsed whole: convert very large ones to NDJSON first (jq -c '.[]'). SWAPI's field names
+# are the column names; its numbers are strings, see parse_number().
+#
+# The records go through the validation and ON CONFLICT (name) handling of the bulk endpoint
+# (bulk.py), one transaction per chunk, written with an executemany INSERT or, on Postgres,
+# COPY FROM STDIN into a temporary table followed by one INSERT ... SELECT.
+
+DUMP_TYPES = {"people": Characters, "characters": Characters, "planets": Planets, "starships": Starships}
+LOAD_METHODS = ("auto", "copy", "insert")
+UNKNOWN_NUMBERS = ("zero", "skip")
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+def dump_model(path, type_name=None):
+    """Model of a dump: type_name, else the file name (people.json, planets.ndjson, ...)."""
+    name = type_name or os.path.basename(path).split(".")[0].lower()
+    return DUMP_TYPES.get(name)
+
+def load_method(method, dialect_name):
+    if method == "auto":
+        return "copy" if dialect_name == "postgresql" else "insert"
+    if method == "copy" and dialect_name != "postgresql":
+        raise ValueError("COPY needs Postgres, this database is " + dialect_name)
+    return method
+
+def parse_number(value):
+    """int of a SWAPI number: "1,358" -> 1358, "78.2" -> 78, "30-165" -> 165 (a range gives
+    its upper bound), None for "unknown", "n/a", "none"..."""
+    numbers = NUMBER.findall(value.replace(",", ""))
+    if not numbers:
+        return None
+    return max(int(float(number)) for number in numbers)
+
+def swapi_record(model, record, unknown):
+    """The columns of model from a SWAPI object. bulk.validate_record() reports what is
+    still wrong with it."""
+    if not isinstance(record, dict):
+        return record
+    # the fixtures of the SWAPI project: {"model": ..., "pk": ..., "fields": {...}}
+    record = record.get("fields", record)
+    row = {}
+    for column in catalog_columns(model):
+        value = record.get(column.name)
+        if isinstance(column.type, Integer) and isinstance(value, str):
+            value = parse_number(value)
+            if value is None and unknown == "zero":
+                value = 0
+        row[column.name] = value
+    return row
+
+def iter_dump_records(stream, path):
+    """Yields (index, record) of a dump, like bulk.iter_request_records()."""
+    if path.endswith((".ndjson", ".jsonl")):
+        yield from iter_ndjson_records(stream)
+        return
+    data = json.load(stream)
+    if isinstance(data, dict) and isinstance(data.get("results"), list):
+        data = data["results"]
+    if not isinstance(data, list):
+        raise ValueError("%s is not a JSON array nor a SWAPI page with results" % path)
+    yield from enumerate(data)
+
+def copy_from(cursor, statement, buffer):
+    if hasattr(cursor, "copy_expert"):
+        # psycopg2
+        cursor.copy_expert(statement, buffer)
+    else:
+        # psycopg 3
+        with cursor.copy(statement) as copy:
+            copy.write(buffer.getvalue())
+
+def copy_chunk(model, chunk, on_conflict):
+    """bulk.write_chunk() with COPY FROM STDIN, on Postgres."""
+    report = chunk_report(chunk)
+    rows = chunk_rows(model, chunk, on_conflict, report)
+    if not rows:
+        return report
+
+    table = model.__tablename__
+    staging = "load_" + table
+    columns = [column.name for column in catalog_columns(model)]
+    names = ", ".join(columns)
+    if on_conflict == "update":
+        action = "DO UPDATE SET " + ", ".join("%s = EXCLUDED.%s" % (name, name) for name in columns if name != "name")
+    else:
+        action = "DO NOTHING"
+    buffer = io.StringIO()
+    # strings quoted: an empty string stays one, unquoted empty fields are NULLs for COPY
+    csv.writer(buffer, quoting=csv.QUOTE_NONNUMERIC).writerows([row[name] for name in columns] for row in rows.values())
+    buffer.seek(0)
+
+    connection = db.session.connection()
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(
+            "CREATE TEMPORARY TABLE IF NOT EXISTS %s ON COMMIT DELETE ROWS AS SELECT %s FROM %s WITH NO DATA"
+            % (staging, names, table)
+        )
+        copy_from(cursor, "COPY %s (%s) FROM STDIN WITH (FORMAT csv)" % (staging, names), buffer)
+        # xmax = 0: the row was inserted, not updated
+        cursor.execute(
+            "INSERT INTO %s (%s) SELECT %s FROM %s ON CONFLICT (name) %s RETURNING id, xmax = 0"
+            % (table, names, names, staging, action)
+        )
+        written = cursor.fetchall()
+        # the session events don't see the statements of the cursor: bump the table version
+        written_tables(db.session).add(table)
+        db.session.commit()
+    except (SQLAlchemyError, connection.dialect.loaded_dbapi.Error) as error:
+        db.session.rollback()
+        report["failed"] = len(rows)
+        report["errors"].append({"index": None, "error": "chunk failed: " + type(error).__name__})
+        return report
+    finally:
+        cursor.close()
+
+    updated = [entity_id for entity_id, inserted in written if not inserted]
+    report["inserted"] = len(written) - len(updated)
+    report["updated"] = len(updated)
+    report["skipped"] += len(rows) - len(written)
+    for entity_id in updated:
+        invalidate_entity(model, entity_id)
+    return report
+
+@contextmanager
+def secondary_indexes_dropped(model):
+    """Drops the indexes of model a load can do without (all but the primary key and the
+    unique name index ON CONFLICT needs), creates them again and updates the statistics."""
+    indexes = [index for index in model.__table__.indexes if not index.unique]
+    for index in indexes:
+        index.drop(db.engine, checkfirst=True)
+    try:
+        yield indexes
+    finally:
+        db.session.rollback()
+        for index in indexes:
+            index.create(db.engine, checkfirst=True)
+        with db.engine.begin() as connection:
+            connection.execute(text("ANALYZE " + model.__tablename__))
+
+def load_dump(path, model, on_conflict="nothing", chunk_size=None, method="insert", unknown="zero", progress=None):
+    """Loads one dump into model's table, returns bulk_load()'s report."""
+    write = copy_chunk if method == "copy" else write_chunk
+    with open(path, encoding="utf-8") as stream:
+        records = (
+            (index, swapi_record(model, record, unknown))
+            for index, record in iter_dump_records(stream, path)
+        )
+        return bulk_load(model, records, on_conflict=on_conflict, chunk_size=chunk_size, write=write, progress=progress)
@@ -0,0 +1,146 @@
+"""
+In this file, you can add as many commands as you want using the @app.cli.command decorator.
+Flask commands are useful to run cronjobs or tasks outside of the API but still in
+integration with your database, for example: rebuild the favorite counters every night.
+"""
+import time
+import click
+import signal
+from contextlib import nullcontext
+from popularity import rebuild_counts
+from models import db
+from bulk import ON_CONFLICT_ACTIONS
+from bulk_delete import DELETE_MODELS, delete_rows
+from jobs import JobWorkers
+from catalog_load import DUMP_TYPES, LOAD_METHODS, UNKNOWN_NUMBERS, dump_model, load_method, load_dump, secondary_indexes_dropped
+
+# invalid records printed per file, the rest are only counted
+SHOWN_ERRORS = 20
+
+def setup_commands(app):
+
+    @app.cli.group()
+    def favorites():
+        """Maintenance of the favorites."""
+
+    @favorites.command("rebuild-counts")
+    def rebuild_counts_command():
+        """Recomputes favorite_counts (used by /popular) from the favorites table."""
+        written = rebuild_counts()
+        click.echo("favorite_counts rebuilt: %d counters" % written)
+
+    @app.cli.group()
+    def catalog():
+        """Loading of the catalog tables (characters, planets, starships)."""
+
+    @catalog.command("load")
+    @click.argument("paths", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+    @click.option("--type", "type_name", type=click.Choice(sorted(DUMP_TYPES)),
+                  help="Type of every file. By default the file name: people.json, planets.ndjson...")
+    @click.option("--on-conflict", type=click.Choice(ON_CONFLICT_ACTIONS), default="nothing", show_default=True,
+                  help="Rows whose name is already in the table: keep the table's or update it.")
+    @click.option("--chunk-size", type=int, default=5000, show_default=True, help="Rows per transaction.")
+    @click.option("--method", type=click.Choice(LOAD_METHODS), default="auto", show_default=True,
+                  help="copy (COPY FROM STDIN, Postgres only) or insert (executemany). auto: copy on Postgres.")
+    @click.option("--unknown", type=click.Choice(UNKNOWN_NUMBERS), default="zero", show_default=True,
+                  help='Numbers given as "unknown" or "n/a": store 0, or skip the record.')
+    @click.option("--rebuild-indexes", is_flag=True,
+                  help="Drop the secondary indexes during the load and create them after, for large loads.")
+    @click.option("--quiet", is_flag=True, help="No progress lines.")
+    def load_catalog_command(paths, type_name, on_conflict, chunk_size, method, unknown, rebuild_indexes, quiet):
+        """Loads SWAPI JSON or NDJSON dumps of people, planets and starships."""
+        models = [dump_model(path, type_name) for path in paths]
+        for path, model in zip(paths, models):
+            if model is None:
+                raise click.UsageError("can't tell the type of %s from its name, pass --type" % path)
+        try:
+            method = load_method(method, db.engine.dialect.name)
+        except ValueError as error:
+            raise click.UsageError(str(error))
+
+        failed = 0
+        for path, model in zip(paths, models):
+            table = model.__tablename__
+            started = time.perf_counter()
+            shown = []
+
+            def progress(totals, report):
+                for error in report["errors"]:
+                    if len(shown) < SHOWN_ERRORS:
+                        shown.append(error)
+                        where = "record %d" % error["index"] if error["index"] is not None else "chunk %d" % report["chunk"]
+                        click.echo("%s: %s: %s" % (path, where, error["error"]), err=True)
+                if not quiet:
+                    click.echo("%s: %d read, %d inserted, %d updated, %d skipped, %d collapsed, %d invalid, %d failed (%.0f rows/s)" % (
+                        table, totals["received"], totals["inserted"], totals["updated"], totals["skipped"], totals["collapsed"],
+                        totals["invalid"], totals["failed"], totals["received"] / (time.perf_counter() - started)
+                    ), err=True)
+
+            try:
+                with secondary_indexes_dropped(model) if rebuild_indexes else nullcontext():
+                    result = load_dump(path, model, on_conflict, chunk_size, method, unknown, progress)
+            except ValueError as error:
+                # not JSON, or not a list of records
+                raise click.ClickException(str(error))
+            failed += result["failed"]
+            click.echo("%s -> %s (%s): %d inserted, %d updated, %d skipped, %d collapsed, %d invalid, %d failed in %.1f s" % (
+                path, table, method, result["inserted"], result["updated"], result["skipped"], result["collapsed"],
+                result["invalid"], result["failed"], time.perf_counter() - started
+            ))
+        if failed:
+            raise click.ClickException("%d rows were in chunks that failed" % failed)
+
+    @app.cli.command("delete")
+    @click.argument("table", type=click.Choice(sorted(DELETE_MODELS)))
+    @click.option("--from-id", type=int, help="Only the rows with this id or a greater one.")
+    @click.option("--to-id", type=int, help="Only the rows with this id or a smaller one.")
+    @click.option("--chunk-size", type=int, default=1000, show_default=True, help="Rows per transaction.")
+    @click.option("--yes", is_flag=True, help="Don't ask for a confirmation.")
+    @click.option("--quiet", is_flag=True, help="No progress lines.")
+    def delete_command(table, from_id, to_id, chunk_size, yes, quiet):
+        """Deletes the rows of a table and the favorites that reference them, chunk by chunk."""
+        model = DELETE_MODELS[table]
+        criteria = []
+        if from_id is not None:
+            criteria.append(model.id >= from_id)
+        if to_id is not None:
+            criteria.append(model.id <= to_id)
+        count = db.session.scalar(db.select(db.func.count()).select_from(model).where(*criteria))
+        if not count:
+            click.echo("%s: nothing to delete" % table)
+            return
+        if not yes:
+            click.confirm("Delete %d rows of %s and their favorites?" % (count, table), abort=True)
+        started = time.perf_counter()
+
+        def progress(totals):
+            if not quiet:
+                click.echo("%s: %d/%d deleted, %d favorites (%.0f rows/s)" % (
+                    table, totals["deleted"], count, totals["favorites"], totals["deleted"] / (time.perf_counter() - started)
+                ), err=True)
+
+        totals = delete_rows(model, *criteria, chunk_size=chunk_size, progress=progress)
+        click.echo("%s: %d deleted, %d favorites, %d chunks in %.1f s" % (
+            table, totals["deleted"], totals["favorites"], totals["chunks"], time.perf_counter() - started
+        ))
+
+    @app.cli.group()
+    def jobs():
+        """Background jobs queued by the API (POST /jobs, ?background=true)."""
+
+    @jobs.command("worker")
+    @click.option("--threads", type=click.IntRange(min=1), default=1, show_default=True, help="Jobs run at the same time.")
+    def jobs_worker_command(threads):
+        """Runs the queued jobs until stopped (Ctrl-C or SIGTERM), then waits for the running ones."""
+        app.extensions["log_pipeline"].start()
+        workers = JobWorkers(app, threads)
+        workers.start()
+        signal.signal(signal.SIGTERM, lambda signum, frame: workers.stop())
+        click.echo("job worker %s: %d threads" % (workers.name, threads), err=True)
+        try:
+            while not workers.stopping.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        click.echo("stopping: waiting for the running jobs", err=True)
+        workers.stop(wait=True)
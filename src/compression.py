@@ -0,0 +1,73 @@
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Compression of the JSON/HTML responses, negotiated with Accept-Encoding: brotli when the
+# `brotli` package (in the Pipfile) is installed, gzip otherwise. Only bodies of
+# COMPRESS_MIN_SIZE bytes or more are compressed, below that the headers cost more than
+# the bytes saved. COMPRESS=false turns it off (e.g. behind a proxy that compresses).
+#
+# A compressed body is a different representation: its ETag gets the encoding as a suffix
+# ("abc" -> "abc-gzip"), and matching_etag() accepts both forms in If-None-Match.
+
+COMPRESSIBLE_TYPES = {"application/json", "text/html", "text/plain", "text/csv", "application/x-ndjson"}
+
+# preferred first when the client accepts both with the same quality
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+ALL_ENCODINGS = ("br", "gzip")
+
+def matching_etag(etag):
+    """The tag of the request's If-None-Match that names etag, compressed or not, or None."""
+    if_none_match = request.if_none_match
+    if not if_none_match:
+        return None
+    for tag in (etag,) + tuple("%s-%s" % (etag, encoding) for encoding in ALL_ENCODINGS):
+        if if_none_match.contains_weak(tag):
+            return tag
+    return None
+
+def negotiate_encoding():
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = request.accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def compress(data, encoding, config):
+    if encoding == "br":
+        return brotli.compress(data, quality=config["COMPRESS_BROTLI_QUALITY"])
+    # mtime=0: the same body always gives the same bytes
+    return gzip.compress(data, compresslevel=config["COMPRESS_LEVEL"], mtime=0)
+
+def setup_compression(app):
+    """Registered after the logging and metrics hooks, so it runs before them and the access
+    log and /metrics see the time spent compressing."""
+    if not app.config["COMPRESS"]:
+        return
+    config = app.config
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+        data = response.get_data()
+        if len(data) < config["COMPRESS_MIN_SIZE"]:
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate_encoding()
+        if encoding is None:
+            return response
+        response.set_data(compress(data, encoding, config))
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag("%s-%s" % (etag, encoding), weak)
+        return response
@@ -0,0 +1,79 @@
+import os
+import json
+from flask import current_app
+from sqlalchemy import event
+from cache import make_cache
+from models import db
+from replicas import replica_cache_ttl
+
+# Read-through cache of the detail endpoints (/planets/<id>, /characters/<id>, ...):
+# stores the JSON bytes of the response body per (table, id). The rows written through the
+# ORM session (the routes, the admin) are invalidated by the session events below once their
+# transaction commits. The bulk statements don't go through the unit of work: bulk.py,
+# bulk_delete.py and catalog_load.py call invalidate_entity() for the ids they write.
+entity_cache = make_cache(
+    url=os.getenv("CACHE_URL"),
+    maxsize=int(os.getenv("ENTITY_CACHE_SIZE", 4096)),
+    ttl=int(os.getenv("ENTITY_CACHE_TTL", 300)),
+    prefix="swapi:entity:"
+)
+
+def entity_key(model, entity_id):
+    return "%s:%s" % (model.__tablename__, entity_id)
+
+def cached_entity_response(model, entity_id, build_body):
+    """Returns the cached response for (model, entity_id), or calls build_body() on a miss and
+    caches its result. build_body returns None when the row does not exist (not cached)."""
+    data = entity_cache.get(entity_key(model, entity_id))
+    if data is None:
+        body = build_body()
+        if body is None:
+            return None
+        data = cache_entity_body(model, entity_id, body)
+    return entity_response(data)
+
+def cache_entity_body(model, entity_id, body):
+    """Caches the JSON of a detail response body, returns its bytes."""
+    data = current_app.json.response(body).get_data()
+    # a body read from a replica may be up to REPLICA_LAG_SECONDS old: cached no longer than that
+    entity_cache.set(entity_key(model, entity_id), data, ttl=replica_cache_ttl())
+    return data
+
+def entity_response(data):
+    return current_app.response_class(data, mimetype=current_app.json.mimetype)
+
+def entity_results(model, entity_id):
+    """Serialized row for other endpoints' responses: taken from the cached detail response
+    when there is one, loaded by primary key otherwise (without filling the cache, whose
+    entries keep the exact body of the detail endpoint)."""
+    data = entity_cache.get(entity_key(model, entity_id))
+    if data is not None:
+        return json.loads(data)["results"]
+    row = db.session.query(*model.projection()).filter(model.id == entity_id).first()
+    return model.serialize_row(row) if row is not None else None
+
+def invalidate_entity(model, entity_id):
+    entity_cache.delete(entity_key(model, entity_id))
+
+def invalidate_all_entities():
+    entity_cache.clear()
+
+CACHED_TABLES = {"user", "characters", "planets", "starships"}
+
+def record_flush(session, flush_context):
+    written = session.info.setdefault("written_entities", set())
+    for instance in session.new | session.dirty | session.deleted:
+        if getattr(instance, "__tablename__", None) in CACHED_TABLES and instance.id is not None:
+            written.add((type(instance), instance.id))
+
+def invalidate_written(session):
+    # after the commit: a reader can't cache the old row again in between
+    for model, entity_id in session.info.pop("written_entities", ()):
+        invalidate_entity(model, entity_id)
+
+def forget_written(session, *args):
+    session.info.pop("written_entities", None)
+
+event.listen(db.session, "after_flush", record_flush)
+event.listen(db.session, "after_commit", invalidate_written)
+event.listen(db.session, "after_soft_rollback", forget_written)
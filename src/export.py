@@ -0,0 +1,68 @@
+import io
+import csv
+from flask import current_app, request, stream_with_context
+from compression import matching_etag
+from models import db, Characters, Planets, Starships
+from utils import APIException
+from versions import table_version, version_etag, not_modified
+
+# Streaming export of a whole catalog table (/export/<table>) for the sync jobs. The rows are
+# fetched EXPORT_BATCH_SIZE at a time (yield_per: a server side cursor on Postgres, SQLite
+# steps its cursor), each batch is encoded and sent before the next one is fetched, so the
+# memory of the worker stays flat whatever the size of the table. Rows are in id order.
+#
+# The response is not compressed (compression.py leaves streamed responses alone) and it has
+# a version ETag: a sync job that sends it back gets a 304 while the table is unchanged.
+
+EXPORT_MODELS = {model.__tablename__: model for model in (Planets, Characters, Starships)}
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+def export_format():
+    """?format=ndjson|csv, else the one the Accept header prefers (NDJSON by default)."""
+    name = request.args.get("format")
+    if name is None:
+        mimetype = request.accept_mimetypes.best_match(list(EXPORT_FORMATS.values()), EXPORT_FORMATS["ndjson"])
+        return "csv" if mimetype == EXPORT_FORMATS["csv"] else "ndjson"
+    if name not in EXPORT_FORMATS:
+        raise APIException("format must be one of: " + ", ".join(EXPORT_FORMATS), status_code=400)
+    return name
+
+def ndjson_lines(rows):
+    dumps = current_app.json.dumps
+    return "".join([dumps(row._asdict()) + "\n" for row in rows])
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+def export_response(model):
+    name = export_format()
+    # the representations of one URL differ by format (Accept): so do their ETags
+    etag = "%s-%s" % (version_etag(table_version(model)), name)
+    matched = matching_etag(etag)
+    if matched is not None:
+        return not_modified(matched)
+
+    statement = db.select(*model.projection()).order_by(model.id).execution_options(
+        yield_per=current_app.config['EXPORT_BATCH_SIZE']
+    )
+    # executed here, not in the generator: a failing query is still a JSON error response
+    result = db.session.execute(statement)
+    encode = csv_lines if name == "csv" else ndjson_lines
+
+    def generate():
+        try:
+            if name == "csv":
+                yield csv_lines([model.serialized_fields])
+            for rows in result.partitions():
+                yield encode(rows)
+        finally:
+            result.close()
+
+    # the request context (and its session) stays open until the last batch is sent
+    response = current_app.response_class(stream_with_context(generate()), mimetype=EXPORT_FORMATS[name])
+    response.headers["Content-Disposition"] = "attachment; filename=%s.%s" % (model.__tablename__, name)
+    response.vary.add("Accept")
+    response.set_etag(etag)
+    return response
@@ -0,0 +1,133 @@
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from models import db, Favorites, Characters, Planets, Starships
+from utils import APIException, dialect_insert
+from popularity import count_changes, increment_counts, decrement_counts
+
+# favorite column -> (model, key of the expanded entity in the response)
+EXPANSIONS = (
+    ("characters_id", Characters, "character"),
+    ("planets_id", Planets, "planet"),
+    ("starships_id", Starships, "starship"),
+)
+
+# type used in the urls and batch bodies -> (favorite column, model)
+FAVORITE_TYPES = {
+    "character": ("characters_id", Characters),
+    "planet": ("planets_id", Planets),
+    "starship": ("starships_id", Starships),
+}
+
+def expand_favorites(favorites):
+    """Serializes favorites (rows of Favorites.projection()) with their full character/planet/
+    starship, loading the entities with one IN (...) query per table instead of one request
+    per favorite."""
+    results = [Favorites.serialize_row(favorite) for favorite in favorites]
+    for expansion, statement in expansion_statements(results):
+        add_expansion(results, expansion, db.session.execute(statement))
+    return results
+
+def expansion_statements(results):
+    """[(expansion, SELECT of its entities), ...] for the serialized favorites in results."""
+    statements = []
+    for column, model, key in EXPANSIONS:
+        ids = {item[column] for item in results if item[column] is not None}
+        if ids:
+            statements.append(((column, model, key), db.select(*model.projection()).where(model.id.in_(ids))))
+    return statements
+
+def add_expansion(results, expansion, rows):
+    column, model, key = expansion
+    entities = {row.id: model.serialize_row(row) for row in rows}
+    for item in results:
+        if item[column] is not None:
+            item[key] = entities.get(item[column])
+
+########## FAVORITES ENGINE ##########
+# Adding is a single INSERT ... ON CONFLICT DO NOTHING: the unique (user_id, <type>_id)
+# indexes make duplicates a no-op and the foreign keys reject entities that don't exist,
+# so there is no need to look anything up first.
+# Adding and removing also update favorite_counts (popularity.py) in the same transaction,
+# from the rows the INSERT/DELETE ... RETURNING report, so skipped duplicates and favorites
+# that did not exist don't change the counters.
+
+# columns RETURNING gives back for the counters
+CHANGED_COLUMNS = (Favorites.id, Favorites.characters_id, Favorites.planets_id, Favorites.starships_id)
+
+def favorite_row(user_id, favorite_type, entity_id):
+    row = {"user_id": user_id, "characters_id": None, "planets_id": None, "starships_id": None}
+    column, model = FAVORITE_TYPES[favorite_type]
+    row[column] = entity_id
+    return row
+
+def parse_favorite_pairs(data):
+    """[{"type": "planet", "id": 1}, ...] (or {"favorites": [...]}) -> [("planet", 1), ...]"""
+    if isinstance(data, dict):
+        data = data.get("favorites")
+    if not isinstance(data, list) or not data:
+        raise APIException("the body must be a non empty list of {\"type\", \"id\"}", status_code=400)
+
+    pairs = []
+    for item in data:
+        if not isinstance(item, dict) or item.get("type") not in FAVORITE_TYPES:
+            raise APIException("type must be one of: " + ", ".join(FAVORITE_TYPES), status_code=400)
+        if not isinstance(item.get("id"), int) or isinstance(item.get("id"), bool):
+            raise APIException("id must be an integer", status_code=400)
+        pairs.append((item["type"], item["id"]))
+    # keep the order, drop repeated pairs
+    return list(dict.fromkeys(pairs))
+
+def missing_entities(pairs):
+    missing = []
+    for favorite_type, (column, model) in FAVORITE_TYPES.items():
+        ids = {entity_id for pair_type, entity_id in pairs if pair_type == favorite_type}
+        if ids:
+            found = set(db.session.scalars(db.select(model.id).where(model.id.in_(ids))))
+            missing.extend({"type": favorite_type, "id": entity_id} for entity_id in sorted(ids - found))
+    return missing
+
+def add_favorites(user_id, pairs):
+    """Adds the (type, id) pairs in one transaction. Returns the ids of the favorites that were
+    created (pairs the user already had are skipped). Raises APIException 404 if an entity does
+    not exist, in which case nothing is added."""
+    insert = dialect_insert(db.session)
+    statement = insert(Favorites).on_conflict_do_nothing().returning(*CHANGED_COLUMNS)
+    rows = [favorite_row(user_id, favorite_type, entity_id) for favorite_type, entity_id in pairs]
+    try:
+        created = db.session.execute(statement, rows).all()
+        increment_counts(count_changes(created))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise APIException("not found", status_code=404, payload={"missing": missing_entities(pairs)})
+    return [favorite.id for favorite in created]
+
+def add_favorite(user_id, favorite_type, entity_id):
+    """True if the favorite was created, False if the user already had it."""
+    return len(add_favorites(user_id, [(favorite_type, entity_id)])) > 0
+
+def remove_favorites(user_id, pairs):
+    """Removes the (type, id) pairs with one DELETE. Returns how many favorites were removed."""
+    conditions = []
+    for favorite_type, (column, model) in FAVORITE_TYPES.items():
+        ids = [entity_id for pair_type, entity_id in pairs if pair_type == favorite_type]
+        if ids:
+            conditions.append(getattr(Favorites, column).in_(ids))
+
+    statement = db.delete(Favorites).where(Favorites.user_id == user_id, or_(*conditions))
+    return delete_favorites(statement)
+
+def remove_favorite(user_id, favorite_type, entity_id):
+    return remove_favorites(user_id, [(favorite_type, entity_id)]) > 0
+
+def remove_favorite_by_id(user_id, favorite_id):
+    statement = db.delete(Favorites).where(Favorites.id == favorite_id, Favorites.user_id == user_id)
+    return delete_favorites(statement) > 0
+
+def delete_favorites(statement):
+    """Runs a DELETE of favorites and takes the deleted rows off the counters. Returns how
+    many favorites were deleted."""
+    deleted = db.session.execute(statement.returning(*CHANGED_COLUMNS)).all()
+    decrement_counts(count_changes(deleted))
+    db.session.commit()
+    return len(deleted)
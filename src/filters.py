@@ -0,0 +1,71 @@
+import re
+import operator
+from flask import request
+from utils import APIException
+
+# Filters and sort order of the catalog list endpoints, from the query string:
+#   /all_characters?eye_color=blue&gender=female      equality
+#   /all_planets?population[gte]=1000000&diameter[lt]=10000   ranges (gt, gte, lt, lte)
+#   /all_planets?order_by=population:desc&limit=10     sort, asc by default
+# Only the model's filterable_fields are accepted, so every query runs on an index.
+
+OPERATORS = {
+    "eq": operator.eq,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+}
+DIRECTIONS = ("asc", "desc")
+
+# limit/after/total belong to the pagination
+RESERVED_ARGS = {"limit", "after", "total", "order_by"}
+
+FILTER_ARG = re.compile(r"^(\w+)(?:\[(\w+)\])?$")
+
+def parse_value(column, value):
+    python_type = column.type.python_type
+    if python_type is str:
+        return value
+    try:
+        return python_type(value)
+    except ValueError:
+        raise APIException("%s must be %s" % (column.key, "an integer" if python_type is int else python_type.__name__), status_code=400)
+
+def filterable_column(model, field):
+    if field not in model.filterable_fields:
+        raise APIException(
+            "cannot filter or sort on %s, use one of: %s" % (field, ", ".join(model.filterable_fields)),
+            status_code=400
+        )
+    return getattr(model, field)
+
+def apply_filters(query, model):
+    """Adds the WHERE conditions of the query string to query. Arguments that are not columns
+    of the model are ignored, columns without an index are rejected with a 400."""
+    for arg, values in request.args.lists():
+        if arg in RESERVED_ARGS:
+            continue
+        match = FILTER_ARG.match(arg)
+        if match is None or match.group(1) not in model.serialized_fields:
+            continue
+        field, op = match.group(1), match.group(2) or "eq"
+        if op not in OPERATORS:
+            raise APIException("unknown operator %s, use one of: %s" % (op, ", ".join(OPERATORS)), status_code=400)
+        column = filterable_column(model, field)
+        for value in values:
+            query = query.filter(OPERATORS[op](column, parse_value(column, value)))
+    return query
+
+def sort_order(model):
+    """(column, descending) of ?order_by=field[:asc|desc], (None, False) for the default id order."""
+    order_by = request.args.get("order_by")
+    if not order_by:
+        return None, False
+    field, _, direction = order_by.partition(":")
+    direction = direction or "asc"
+    if direction not in DIRECTIONS:
+        raise APIException("order_by direction must be asc or desc", status_code=400)
+    if field == "id":
+        return None, direction == "desc"
+    return filterable_column(model, field), direction == "desc"
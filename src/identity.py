@@ -0,0 +1,49 @@
+import os
+from flask_jwt_extended import get_jwt, get_jwt_identity
+from cache import LRUCache
+from models import db, User
+
+# (email, user_id claim) of the JWT -> user id, so authenticated routes don't hit the user
+# table on every request. delete_user / delete_all_users invalidate it in their worker. The
+# claim is part of the key: an email deleted and signed up again is another user, and the
+# other workers' entries for the deleted one never answer for a token of the new one.
+identity_cache = LRUCache(
+    maxsize=int(os.getenv("IDENTITY_CACHE_SIZE", 1024)),
+    ttl=int(os.getenv("IDENTITY_CACHE_TTL", 60))
+)
+
+def identity_claims(user):
+    return {"user_id": user.id}
+
+def identity_key(email):
+    # tokens issued before the claim existed only carry the email: (email, None)
+    return (email, get_jwt().get("user_id"))
+
+def current_user_id():
+    """Id of the user behind the JWT of the current request, or None if that user no longer exists."""
+    email = get_jwt_identity()
+    user_id = identity_cache.get(identity_key(email))
+    if user_id is not None:
+        return user_id
+    return remember_identity(email, db.session.execute(identity_statement(email)).first())
+
+def identity_statement(email):
+    statement = db.select(User.id).where(User.email == email)
+    claim_id = get_jwt().get("user_id")
+    if claim_id is not None:
+        # tokens issued before the claim existed only carry the email
+        statement = statement.where(User.id == claim_id)
+    return statement.limit(1)
+
+def remember_identity(email, row):
+    if row is None:
+        return None
+    identity_cache.set(identity_key(email), row.id)
+    return row.id
+
+def forget_identity(email, user_id):
+    identity_cache.delete((email, user_id))
+    identity_cache.delete((email, None))
+
+def forget_all_identities():
+    identity_cache.clear()
@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import current_app, request, jsonify, url_for
+from models import db, Jobs
+from utils import APIException
+from logs import log_event
+from bulk import bulk_load, iter_request_records, ON_CONFLICT_ACTIONS
+from bulk_delete import delete_rows, DELETE_MODELS
+from popularity import rebuild_counts
+from export import EXPORT_MODELS
+
+# Background jobs for the operations that don't fit in a request (gunicorn kills a worker
+# after WEB_TIMEOUT seconds): the API inserts a row in the jobs table and answers 202 with
+# its id, a job worker runs it and writes its progress and result to the row, the client
+# polls GET /jobs/<id>. The workers are
+#   - JOBS_THREADS threads (1) in each web worker process, started on its first request
+#   - `flask jobs worker`, a process of its own (then set JOBS_THREADS=0 on the web service)
+# Both claim the oldest queued job with one UPDATE ... WHERE id = (SELECT ... FOR UPDATE SKIP
+# LOCKED) RETURNING: on Postgres concurrent workers skip the rows the others are claiming,
+# SQLite has no row locks but runs one write at a time, which makes the UPDATE atomic alike.
+#
+# The params are stored in the job row and read again by the worker that claims it: they
+# take at most JOBS_MAX_PARAMS_BYTES of JSON, a bulk_load at most JOBS_MAX_RECORDS records,
+# larger requests get a 413 before anything is queued.
+#
+# A cancelled job stops at its next progress report (the chunks already committed stay). A
+# running job whose worker stopped sending heartbeats for JOBS_STALE_SECONDS (the process
+# died or was restarted) is marked failed.
+
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+class JobCancelled(Exception):
+    pass
+
+def utcnow():
+    return datetime.utcnow()
+
+def check_delete(params):
+    if params.get("table") not in DELETE_MODELS:
+        raise APIException("table must be one of: " + ", ".join(sorted(DELETE_MODELS)), status_code=400)
+    for name in ("from_id", "to_id"):
+        if not isinstance(params.get(name, 0), int):
+            raise APIException(name + " must be an integer", status_code=400)
+
+def run_delete(params, progress):
+    model = DELETE_MODELS[params["table"]]
+    criteria = []
+    if params.get("from_id") is not None:
+        criteria.append(model.id >= params["from_id"])
+    if params.get("to_id") is not None:
+        criteria.append(model.id <= params["to_id"])
+    return delete_rows(model, *criteria, progress=progress)
+
+def check_bulk_load(params):
+    if params.get("table") not in EXPORT_MODELS:
+        raise APIException("table must be one of: " + ", ".join(sorted(EXPORT_MODELS)), status_code=400)
+    if params.get("on_conflict", "nothing") not in ON_CONFLICT_ACTIONS:
+        raise APIException("on_conflict must be one of: " + ", ".join(ON_CONFLICT_ACTIONS), status_code=400)
+    if not isinstance(params.get("records"), list):
+        raise APIException("records must be a JSON array", status_code=400)
+    if len(params["records"]) > current_app.config["JOBS_MAX_RECORDS"]:
+        raise too_many_records()
+
+def run_bulk_load(params, progress):
+    return bulk_load(
+        EXPORT_MODELS[params["table"]], enumerate(params["records"]),
+        on_conflict=params.get("on_conflict", "nothing"),
+        progress=lambda totals, report: progress(totals)
+    )
+
+def check_rebuild_counts(params):
+    pass
+
+def run_rebuild_counts(params, progress):
+    return {"counters": rebuild_counts()}
+
+# kind -> (check(params), run(params, progress) -> result). check raises an APIException for
+# params the job can't run with, run calls progress(dict) between its transactions.
+JOB_KINDS = {
+    "delete": (check_delete, run_delete),
+    "bulk_load": (check_bulk_load, run_bulk_load),
+    "rebuild_counts": (check_rebuild_counts, run_rebuild_counts),
+}
+
+def too_many_records():
+    return APIException("a job loads at most %d records" % current_app.config["JOBS_MAX_RECORDS"], status_code=413)
+
+def check_request_size():
+    """413 for a request body that can't fit in the params of a job, before it is read."""
+    max_bytes = current_app.config["JOBS_MAX_PARAMS_BYTES"]
+    if request.content_length is not None and request.content_length > max_bytes:
+        raise APIException("the params of a job take at most %d bytes" % max_bytes, status_code=413)
+
+def request_records():
+    """The records of a bulk request body, for a bulk_load job: 413 past JOBS_MAX_RECORDS,
+    without reading the rest of an NDJSON body."""
+    check_request_size()
+    records = []
+    for index, record in iter_request_records():
+        if len(records) >= current_app.config["JOBS_MAX_RECORDS"]:
+            raise too_many_records()
+        records.append(record)
+    return records
+
+def submit_job(kind, params):
+    """Queues a job and returns it, after checking its params."""
+    if kind not in JOB_KINDS:
+        raise APIException("kind must be one of: " + ", ".join(sorted(JOB_KINDS)), status_code=400)
+    if not isinstance(params, dict):
+        raise APIException("params must be a JSON object", status_code=400)
+    JOB_KINDS[kind][0](params)
+    max_bytes = current_app.config["JOBS_MAX_PARAMS_BYTES"]
+    if len(json.dumps(params)) > max_bytes:
+        raise APIException("the params of a job take at most %d bytes" % max_bytes, status_code=413)
+    job = Jobs(kind=kind, params=params, status="queued", cancel_requested=False, created_at=utcnow())
+    db.session.add(job)
+    db.session.commit()
+    workers = current_app.extensions.get("jobs")
+    if workers is not None:
+        workers.wake()
+    return job
+
+def accepted_response(job):
+    """202 with the queued job, its URL in Location."""
+    response = jsonify({"msg": "accepted", "results": job.serialize()})
+    response.status_code = 202
+    response.headers["Location"] = url_for("api.get_one_job", job_id=job.id)
+    return response
+
+def cancel_job(job):
+    """A queued job is cancelled at once, a running one at its next progress report."""
+    if job.status == "queued":
+        cancelled = db.session.execute(
+            db.update(Jobs).where(Jobs.id == job.id, Jobs.status == "queued")
+            .values(status="cancelled", finished_at=utcnow())
+        ).rowcount
+        if cancelled:
+            db.session.commit()
+            db.session.refresh(job)
+            return job
+    if job.status in ("queued", "running"):
+        # queued a moment ago, claimed since
+        db.session.execute(db.update(Jobs).where(Jobs.id == job.id, Jobs.status == "running").values(cancel_requested=True))
+        db.session.commit()
+    db.session.refresh(job)
+    return job
+
+def claim_job(connection, worker):
+    """Marks the oldest queued job as running by worker and returns (id, kind, params), or None."""
+    oldest = db.select(Jobs.id).where(Jobs.status == "queued").order_by(Jobs.id).limit(1)
+    # a read first: an idle worker polling the table doesn't take SQLite's write lock
+    if connection.scalar(oldest) is None:
+        return None
+    now = utcnow()
+    oldest = oldest.with_for_update(skip_locked=True)
+    return connection.execute(
+        db.update(Jobs).where(Jobs.id == oldest.scalar_subquery(), Jobs.status == "queued")
+        .values(status="running", worker=worker, started_at=now, heartbeat_at=now)
+        .returning(Jobs.id, Jobs.kind, Jobs.params)
+    ).first()
+
+def fail_stale_jobs(connection, stale_seconds):
+    """Marks failed the running jobs without a heartbeat for stale_seconds, returns how many."""
+    stale = (Jobs.status == "running", Jobs.heartbeat_at < utcnow() - timedelta(seconds=stale_seconds))
+    if connection.scalar(db.select(Jobs.id).where(*stale).limit(1)) is None:
+        return 0
+    return connection.execute(
+        db.update(Jobs).where(*stale).values(status="failed", error="the worker running the job stopped", finished_at=utcnow())
+    ).rowcount
+
+class JobWorkers:
+    """Threads that claim and run the queued jobs, in one process."""
+
+    def __init__(self, app, threads):
+        self.app = app
+        self.threads = threads
+        self.poll_seconds = app.config["JOBS_POLL_SECONDS"]
+        self.heartbeat_seconds = app.config["JOBS_HEARTBEAT_SECONDS"]
+        self.stale_seconds = app.config["JOBS_STALE_SECONDS"]
+        self.name = None
+        self.pid = None
+        self.running = set()
+        self.workers = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+
+    def start(self):
+        # threads don't survive a fork: every gunicorn worker starts its own
+        if self.pid == os.getpid() or self.threads <= 0:
+            return
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            self.name = "%s:%d" % (socket.gethostname(), self.pid)
+            self.running = set()
+            self.wakeup = threading.Event()
+            self.stopping = threading.Event()
+            self.workers = [
+                threading.Thread(target=self.work, name="job-worker-%d" % number, daemon=True)
+                for number in range(self.threads)
+            ]
+            for thread in self.workers:
+                thread.start()
+            threading.Thread(target=self.beat, name="job-heartbeat", daemon=True).start()
+
+    def wake(self):
+        self.start()
+        self.wakeup.set()
+
+    def stop(self, wait=False):
+        """No more claims. wait: until the running jobs are done."""
+        self.stopping.set()
+        self.wakeup.set()
+        if wait:
+            for thread in self.workers:
+                thread.join()
+
+    def work(self):
+        while not self.stopping.is_set():
+            try:
+                with self.app.app_context():
+                    with db.engine.begin() as connection:
+                        job = claim_job(connection, self.name)
+                    if job is not None:
+                        self.run(*job)
+                        continue
+            except Exception as error:
+                log_event("job_worker_error", level=logging.ERROR, error=repr(error))
+            self.wakeup.wait(self.poll_seconds)
+            self.wakeup.clear()
+
+    def beat(self):
+        while not self.stopping.wait(self.heartbeat_seconds):
+            try:
+                with self.app.app_context(), db.engine.begin() as connection:
+                    with self.lock:
+                        running = list(self.running)
+                    if running:
+                        connection.execute(db.update(Jobs).where(Jobs.id.in_(running)).values(heartbeat_at=utcnow()))
+                    stale = fail_stale_jobs(connection, self.stale_seconds)
+                if stale:
+                    log_event("jobs_stale", level=logging.WARNING, jobs=stale)
+            except Exception as error:
+                log_event("job_worker_error", level=logging.ERROR, error=repr(error))
+
+    def run(self, job_id, kind, params):
+        """Runs a claimed job in the app context of the caller and records how it ended."""
+        with self.lock:
+            self.running.add(job_id)
+        started = time.perf_counter()
+
+        def progress(data):
+            with db.engine.begin() as connection:
+                cancel = connection.execute(
+                    db.update(Jobs).where(Jobs.id == job_id).values(progress=data, heartbeat_at=utcnow())
+                    .returning(Jobs.cancel_requested)
+                ).scalar()
+            if cancel:
+                raise JobCancelled()
+
+        values = {"status": "succeeded"}
+        try:
+            values["result"] = JOB_KINDS[kind][1](params, progress)
+        except JobCancelled:
+            values = {"status": "cancelled"}
+        except Exception as error:
+            db.session.rollback()
+            values = {"status": "failed", "error": "%s: %s" % (type(error).__name__, error)}
+            log_event("job_failed", level=logging.ERROR, job=job_id, kind=kind, error=repr(error))
+        finally:
+            with self.lock:
+                self.running.discard(job_id)
+        with db.engine.begin() as connection:
+            connection.execute(db.update(Jobs).where(Jobs.id == job_id).values(finished_at=utcnow(), **values))
+        log_event("job_finished", level=logging.INFO, job=job_id, kind=kind, status=values["status"], seconds=round(time.perf_counter() - started, 3))
+
+def setup_jobs(app):
+    workers = JobWorkers(app, app.config["JOBS_THREADS"])
+    app.extensions["jobs"] = workers
+
+    @app.before_request
+    def start_job_workers():
+        workers.start()
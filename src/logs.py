@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import random
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, request, has_request_context
+from utils import env_flag
+
+# Structured logging: one JSON object per line on stdout (or LOG_FILE).
+#   api.access  one line per response, sampled per endpoint
+#   api.events  log_event() from the routes (DEBUG by default)
+# Request threads only put the record on a queue; a listener thread per process formats
+# it (redaction included) and does the write, so a slow stdout never delays a response.
+#
+# LOG_LEVEL           level of api.events, INFO by default
+# LOG_SAMPLE_RATE     fraction of the responses in the access log, 1 by default
+# LOG_SAMPLE_RATES    per endpoint rates, e.g. "api.get_one_planet=0.01,api.get_all_planets=0.1"
+#                     5xx responses are always logged
+# LOG_REDACT          extra field names to redact (comma separated)
+# LOG_QUEUE           false writes from the request thread (to measure the difference)
+# LOG_QUEUE_SIZE      records waiting for the listener, 10000 by default. When the output
+#                     can't keep up, new records are dropped instead of blocking the
+#                     requests or growing the memory (see "dropped_records")
+
+REQUEST_ID_HEADER = "X-Request-ID"
+REDACTED = "[redacted]"
+REDACTED_FIELDS = {"password", "access_token", "refresh_token", "token", "authorization", "secret", "email"}
+
+logger = logging.getLogger("api")
+access_logger = logging.getLogger("api.access")
+event_logger = logging.getLogger("api.events")
+
+def parse_sample_rates(value):
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        endpoint, rate = item.split("=", 1)
+        rates[endpoint.strip()] = float(rate)
+    return rates
+
+def redact(value, fields):
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if str(key).lower() in fields else redact(item, fields)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item, fields) for item in value]
+    return value
+
+class JSONFormatter(logging.Formatter):
+    def __init__(self, redacted_fields=REDACTED_FIELDS):
+        super().__init__()
+        self.redacted_fields = redacted_fields
+
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + ".%03dZ" % record.msecs,
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(redact(fields, self.redacted_fields))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class RecordQueueHandler(QueueHandler):
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # the listener is a thread of the same process: pass the record as is and let it
+        # do the formatting, instead of formatting here and pickling-proofing the record
+        return record
+
+    def enqueue(self, record):
+        dropped = self.dropped
+        if dropped:
+            # the next record that gets through says how many were lost before it
+            record.fields = dict(getattr(record, "fields", None) or {}, dropped_records=dropped)
+        try:
+            self.queue.put_nowait(record)
+            self.dropped -= dropped
+        except queue.Full:
+            self.dropped += 1
+
+class LogPipeline:
+    """Queue + listener thread. Threads don't survive a fork, so start() is called again by
+    every gunicorn worker (on its first request) and gives it its own queue and listener."""
+
+    def __init__(self, handlers, maxsize):
+        self.handlers = handlers
+        self.maxsize = maxsize
+        self.queue_handler = RecordQueueHandler(queue.Queue(maxsize))
+        self.listener = None
+        self.pid = None
+
+    def start(self):
+        if self.pid == os.getpid():
+            return
+        self.queue_handler.queue = queue.Queue(self.maxsize)
+        self.queue_handler.dropped = 0
+        self.listener = QueueListener(self.queue_handler.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+        self.pid = os.getpid()
+
+    def stop(self):
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+            self.pid = None
+
+def log_event(event, level=logging.DEBUG, **fields):
+    """Structured replacement for print(): log_event("planet_created", name=...). Fields named
+    like a secret (password, token, ...) are redacted before they are written."""
+    if not event_logger.isEnabledFor(level):
+        return
+    if has_request_context() and "request_id" in g:
+        fields["request_id"] = g.request_id
+    event_logger.log(level, event, extra={"fields": fields})
+
+def valid_request_id(value):
+    return value and len(value) <= 128 and value.replace("-", "").replace("_", "").replace(".", "").isalnum()
+
+def setup_logging(app):
+    """Request id (the client's X-Request-ID or a new one, echoed in the response), sampled JSON
+    access log and the api.events logger, all written through a LogPipeline."""
+    log_file = os.getenv("LOG_FILE")
+    stream_handler = logging.FileHandler(log_file) if log_file else logging.StreamHandler(sys.stdout)
+    redacted_fields = REDACTED_FIELDS | {name.strip().lower() for name in os.getenv("LOG_REDACT", "").split(",") if name.strip()}
+    stream_handler.setFormatter(JSONFormatter(redacted_fields))
+
+    pipeline = LogPipeline([stream_handler], int(os.getenv("LOG_QUEUE_SIZE", 10000)))
+    handler = pipeline.queue_handler if env_flag("LOG_QUEUE", True) else stream_handler
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    event_logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    access_logger.setLevel(logging.INFO)
+    atexit.register(pipeline.stop)
+
+    default_rate = float(os.getenv("LOG_SAMPLE_RATE", 1))
+    sample_rates = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+
+    @app.before_request
+    def start_request_log():
+        pipeline.start()
+        request_id = request.headers.get(REQUEST_ID_HEADER)
+        g.request_id = request_id if valid_request_id(request_id) else uuid.uuid4().hex
+        g.log_started = time.perf_counter()
+
+    @app.after_request
+    def access_log(response):
+        if "request_id" not in g:
+            return response
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+        endpoint = request.endpoint or "unmatched"
+        rate = sample_rates.get(endpoint, default_rate)
+        if response.status_code < 500 and (rate <= 0 or (rate < 1 and random.random() >= rate)):
+            return response
+        access_logger.info("request", extra={"fields": {
+            "request_id": g.request_id,
+            "method": request.method,
+            "path": request.path,
+            "endpoint": endpoint,
+            "status": response.status_code,
+            "duration_ms": round((time.perf_counter() - g.log_started) * 1000, 3),
+            "remote_addr": request.remote_addr,
+            "sample_rate": rate,
+        }})
+        return response
+
+    app.extensions["log_pipeline"] = pipeline
+    return pipeline
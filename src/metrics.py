@@ -0,0 +1,97 @@
+import os
+import time
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from utils import env_flag
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess, Counter, Histogram
+except ImportError:
+    prometheus_client = None
+
+# Per endpoint metrics in the Prometheus text format, served at /metrics:
+#   http_request_duration_seconds{endpoint,method}  latency histogram
+#   http_requests_total{endpoint,method,status}     responses by status code
+#   db_statements_per_request{endpoint}             SQL statements per request (histogram)
+#   db_statements_total{endpoint}                   SQL statements
+#   db_seconds_total{endpoint}                      time spent waiting on the database
+#
+# Under gunicorn every worker has its own counters. With PROMETHEUS_MULTIPROC_DIR set
+# (gunicorn.conf.py does it) prometheus_client keeps them in files of that directory and
+# /metrics adds up the files of every worker, whichever worker answers the scrape.
+
+# the API answers in milliseconds, the default buckets start at 5ms
+LATENCY_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+if prometheus_client is not None:
+    REQUEST_LATENCY = Histogram(
+        "http_request_duration_seconds", "Time to build the response, per endpoint",
+        ["endpoint", "method"], buckets=LATENCY_BUCKETS
+    )
+    REQUESTS = Counter("http_requests", "Responses per endpoint and status code", ["endpoint", "method", "status"])
+    STATEMENTS_PER_REQUEST = Histogram(
+        "db_statements_per_request", "SQL statements sent by one request", ["endpoint"], buckets=STATEMENT_BUCKETS
+    )
+    STATEMENTS = Counter("db_statements", "SQL statements sent to the database", ["endpoint"])
+    DB_SECONDS = Counter("db_seconds", "Time spent executing SQL statements", ["endpoint"])
+
+def endpoint_name():
+    # 404s have no endpoint, don't make a label per unknown URL
+    return request.endpoint or "unmatched"
+
+def start_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_statements = 0
+    g.metrics_db_seconds = 0.0
+
+def record_request(response):
+    started = g.pop("metrics_started", None)
+    if started is None:
+        return response
+    endpoint = endpoint_name()
+    REQUEST_LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - started)
+    REQUESTS.labels(endpoint, request.method, str(response.status_code)).inc()
+    STATEMENTS_PER_REQUEST.labels(endpoint).observe(g.metrics_statements)
+    if g.metrics_statements:
+        STATEMENTS.labels(endpoint).inc(g.metrics_statements)
+        DB_SECONDS.labels(endpoint).inc(g.metrics_db_seconds)
+    return response
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["metrics_started"].pop()
+    # statements outside of a request (flask shell, migrations, scripts) are not counted
+    if has_request_context() and "metrics_started" in g:
+        g.metrics_statements += 1
+        g.metrics_db_seconds += time.perf_counter() - started
+
+def metrics():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), 200, {"Content-Type": prometheus_client.CONTENT_TYPE_LATEST}
+
+def setup_metrics(app):
+    """Registers the request hooks, the SQL events (of every engine, so a read replica is
+    counted too) and the /metrics endpoint. Needs prometheus_client (in the Pipfile),
+    METRICS=false turns everything off."""
+    if prometheus_client is None or not env_flag("METRICS", True):
+        return
+    app.before_request(start_request)
+    app.after_request(record_request)
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+    app.add_url_rule("/metrics", "metrics", metrics)
+
+def mark_process_dead(pid):
+    """Called by gunicorn when a worker exits, so its live gauges (none today) are dropped."""
+    if prometheus_client is not None and "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
@@ -1,23 +1,76 @@
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from replicas import RoutingSession
 
-db = SQLAlchemy()
+# RoutingSession sends the reads of GET requests to a read replica when there is one (replicas.py)
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# SQLite ignores foreign keys unless asked to; Postgres always checks them. The favorites
+# engine relies on the FK to reject favorites of characters/planets/starships that don't exist.
+# With it on, a user or catalog row can't be deleted while favorites reference it: the API
+# deletes go through bulk_delete.py, which removes those favorites first, the ORM deletes
+# cascade to them (FAVORITES_CASCADE).
+@event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+class Serializable:
+    # the fields serialize() returns. The list and detail endpoints select just these
+    # columns into row tuples instead of hydrating full ORM objects.
+    serialized_fields = ()
+
+    @classmethod
+    def projection(cls):
+        return [getattr(cls, name) for name in cls.serialized_fields]
+
+    @staticmethod
+    def serialize_row(row):
+        return row._asdict()
+
+    # columns the list endpoints can filter and sort on (see filters.py). Each one needs an
+    # index that starts with it: keyset_indexes() below, or the unique index of name.
+    filterable_fields = ()
+
+def keyset_indexes(table, fields):
+    # (field, id) serves "WHERE field = x AND id > :after ORDER BY id" as well as the pages
+    # of "ORDER BY field, id", both without sorting the table
+    return tuple(db.Index("ix_%s_%s_id" % (table, field), field, "id") for field in fields)
+
+# Deleting a user or a catalog row through the ORM (the admin) deletes its favorites as ORM
+# objects too, instead of setting their foreign key to NULL: orphaned favorites with no
+# entity. The API deletes in bulk and removes the favorites itself (bulk_delete.py).
+FAVORITES_CASCADE = "save-update, merge, delete"
 
 #DEFINIMOS NUESTRAS TABLAS Y LAS RELACIONES ENTRE ELLAS, AÑADIENDO LOS ATRIBUTOS CORRESPONDIENTES:
 
-class Favorites(db.Model):
+class Favorites(Serializable, db.Model):
     __tablename__ = 'favorites'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     characters_id = db.Column(db.Integer, db.ForeignKey('characters.id'))
     planets_id = db.Column(db.Integer, db.ForeignKey('planets.id'))
     starships_id = db.Column(db.Integer, db.ForeignKey('starships.id'))
-    
+
+    # every favorites route looks rows up by user plus one of the entity ids, and a user can
+    # favorite each entity once (INSERT ... ON CONFLICT DO NOTHING relies on it)
+    __table_args__ = (
+        db.Index('ix_favorites_user_id_planets_id', 'user_id', 'planets_id', unique=True),
+        db.Index('ix_favorites_user_id_characters_id', 'user_id', 'characters_id', unique=True),
+        db.Index('ix_favorites_user_id_starships_id', 'user_id', 'starships_id', unique=True),
+    )
    
 
 
     def __repr__(self):
         return '<Favorites %r>' % self.id
 
+    serialized_fields = ("id", "characters_id", "planets_id", "starships_id")
+
     def serialize(self):
         return {
             "id": self.id,
@@ -27,18 +80,90 @@ class Favorites(db.Model):
         
         }
     
-class User(db.Model):
+class FavoriteCounts(db.Model):
+    # favorites per character/planet/starship, kept up to date by the favorites engine and, for
+    # the favorites written as ORM objects, by a session event (popularity.py) in the
+    # transaction that adds or removes the favorites. `flask favorites rebuild-counts`
+    # recomputes it from the favorites table.
+    __tablename__ = 'favorite_counts'
+    kind = db.Column(db.String(20), primary_key=True)
+    entity_id = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    # /popular/<kind> reads the top of this index
+    __table_args__ = (
+        db.Index('ix_favorite_counts_kind_count', 'kind', 'count', 'entity_id'),
+    )
+
+    def __repr__(self):
+        return '<FavoriteCounts %s %r: %r>' % (self.kind, self.entity_id, self.count)
+
+class TableVersions(db.Model):
+    # one counter per table, bumped in the transaction of every write to the table; the
+    # catalog reads derive their ETags from it (versions.py)
+    __tablename__ = 'table_versions'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        return '<TableVersions %s: %r>' % (self.name, self.version)
+
+class Jobs(db.Model):
+    # long operations run by the job workers outside of the requests that ask for them
+    # (jobs.py): queued -> running -> succeeded / failed / cancelled
+    __tablename__ = 'jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    progress = db.Column(db.JSON)
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    # host:pid of the process running it
+    worker = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    # updated by the worker while it runs the job, a running job without it is stale
+    heartbeat_at = db.Column(db.DateTime)
+
+    # the workers claim the oldest queued job
+    __table_args__ = (
+        db.Index('ix_jobs_status_id', 'status', 'id'),
+    )
+
+    def __repr__(self):
+        return '<Jobs %r %s: %s>' % (self.id, self.kind, self.status)
+
+    def serialize(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "progress": self.progress,
+            "result": self.result,
+            "error": self.error,
+            "cancel_requested": self.cancel_requested,
+            "created_at": self.created_at.isoformat() + "Z",
+            "started_at": self.started_at.isoformat() + "Z" if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() + "Z" if self.finished_at else None,
+        }
+
+class User(Serializable, db.Model):
     __tablename__ = 'user'
     id = db.Column(db.Integer, primary_key=True)
     first_name = db.Column(db.String(250), nullable=False)
     last_name = db.Column(db.String(250), nullable=False)
     email = db.Column(db.String(250), unique=True, nullable=False)
     password = db.Column(db.String(250), nullable=True)
-    user_favorites = db.relationship(Favorites)
+    user_favorites = db.relationship(Favorites, cascade=FAVORITES_CASCADE)
 
     def __repr__(self):
         return '<User %r>' % self.first_name
 
+    serialized_fields = ("id", "first_name", "last_name", "email", "password")
+
     def serialize(self):
         return {
             "id": self.id,
@@ -48,10 +173,10 @@ class User(db.Model):
             "password": self.password
         }
     
-class Characters(db.Model):
+class Characters(Serializable, db.Model):
     __tablename__ = 'characters'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(250), nullable=False)
+    name = db.Column(db.String(250), nullable=False, unique=True, index=True)
 
     height = db.Column(db.Integer, nullable=False)
     mass = db.Column(db.Integer, nullable=False)
@@ -59,12 +184,17 @@ class Characters(db.Model):
     eye_color = db.Column(db.String(250), nullable=False)
     gender = db.Column(db.String(250), nullable=False)
     birth_year = db.Column(db.String(250), nullable=False)
-    characters_favorites = db.relationship(Favorites)
+    characters_favorites = db.relationship(Favorites, cascade=FAVORITES_CASCADE)
+
+    filterable_fields = ("name", "gender", "eye_color", "hair_color", "height", "mass")
+    __table_args__ = keyset_indexes("characters", filterable_fields[1:])
 
     
     def __repr__(self):
         return '<Characters %r>' % self.name
 
+    serialized_fields = ("id", "name", "height", "mass", "hair_color", "eye_color", "gender", "birth_year")
+
     def serialize(self):
         return {
             "id": self.id,
@@ -79,21 +209,26 @@ class Characters(db.Model):
             
         }
 
-class Planets(db.Model):
+class Planets(Serializable, db.Model):
     __tablename__ = 'planets'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(250), nullable=False)
+    name = db.Column(db.String(250), nullable=False, unique=True, index=True)
     climate = db.Column(db.String(250), nullable=False)
     population = db.Column(db.Integer, nullable=False)
     orbital_period = db.Column(db.Integer, nullable=False)
     rotation_period = db.Column(db.Integer, nullable=False)
     diameter = db.Column(db.Integer, nullable=False)
-    planets_favorites = db.relationship(Favorites)
+    planets_favorites = db.relationship(Favorites, cascade=FAVORITES_CASCADE)
+
+    filterable_fields = ("name", "climate", "population", "diameter", "orbital_period", "rotation_period")
+    __table_args__ = keyset_indexes("planets", filterable_fields[1:])
 
     
     def __repr__(self):
         return '<Planets %r>' % self.name
 
+    serialized_fields = ("id", "name", "climate", "population", "orbital_period", "rotation_period", "diameter")
+
     def serialize(self):
         return {
             "id": self.id,
@@ -106,21 +241,26 @@ class Planets(db.Model):
            
         }
     
-class Starships(db.Model):
+class Starships(Serializable, db.Model):
     __tablename__ = 'starships'
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(250), nullable=False)
+    name = db.Column(db.String(250), nullable=False, unique=True, index=True)
     manufacturer = db.Column(db.String(250), nullable=False)
     crew = db.Column(db.Integer, nullable=False)
     passengers = db.Column(db.Integer, nullable=False)
     consumables = db.Column(db.String(250), nullable=False)
     cost_in_credits = db.Column(db.Integer, nullable=False)
-    starships_favorites = db.relationship(Favorites)
+    starships_favorites = db.relationship(Favorites, cascade=FAVORITES_CASCADE)
+
+    filterable_fields = ("name", "manufacturer", "crew", "passengers", "cost_in_credits")
+    __table_args__ = keyset_indexes("starships", filterable_fields[1:])
 
     
     def __repr__(self):
         return '<Starships %r>' % self.model
 
+    serialized_fields = ("id", "name", "manufacturer", "crew", "passengers", "consumables", "cost_in_credits")
+
     def serialize(self):
         return {
             "id": self.id,
@@ -0,0 +1,69 @@
+import base64
+import json
+from flask import request, current_app
+from sqlalchemy import tuple_
+from utils import APIException, request_flag, request_limit
+
+# Keyset (cursor) pagination: every page is "WHERE id > :after ORDER BY id LIMIT :n",
+# so the cost of a request does not grow with the size of the table. Sorted by another
+# column the cursor holds (value, id) of the last row: "WHERE (column, id) > (:value, :id)
+# ORDER BY column, id", id breaking the ties.
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor, size=1):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError):
+        raise APIException("invalid cursor", status_code=400)
+    if not isinstance(values, list) or len(values) != size:
+        raise APIException("invalid cursor", status_code=400)
+    return values
+
+def get_page_size():
+    return request_limit(current_app.config["PAGE_SIZE_DEFAULT"], current_app.config["PAGE_SIZE_MAX"])
+
+def page_query(query, model, order_column, descending, limit):
+    """query restricted to the page after ?after, in page order, with one row more than limit."""
+    after = request.args.get("after")
+    if order_column is None:
+        if after:
+            last_id = decode_cursor(after)[0]
+            query = query.filter(model.id < last_id if descending else model.id > last_id)
+        query = query.order_by(model.id.desc() if descending else model.id)
+    else:
+        if after:
+            key = tuple_(order_column, model.id)
+            values = tuple_(*decode_cursor(after, size=2))
+            query = query.filter(key < values if descending else key > values)
+        if descending:
+            query = query.order_by(order_column.desc(), model.id.desc())
+        else:
+            query = query.order_by(order_column, model.id)
+    # fetch one extra row to know whether there is a next page without a COUNT
+    return query.limit(limit + 1)
+
+def next_page(rows, limit, order_column):
+    """(rows of the page, next_cursor) from the rows of page_query()."""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    if order_column is None:
+        return rows, encode_cursor([last.id])
+    return rows, encode_cursor([getattr(last, order_column.key), last.id])
+
+def paginate(query, model, order_column=None, descending=False):
+    """Returns (rows, page) for the current request, where page holds next_cursor and
+    optionally total (only counted when the client asks for it with ?total=true).
+    order_column must be selected by the query (its value goes in the cursor)."""
+    limit = get_page_size()
+    rows, next_cursor = next_page(page_query(query, model, order_column, descending, limit).all(), limit, order_column)
+
+    page = {"next_cursor": next_cursor}
+    if request_flag("total"):
+        page["total"] = query.order_by(None).count()
+    return rows, page
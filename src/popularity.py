@@ -0,0 +1,126 @@
+from collections import Counter
+from sqlalchemy import bindparam, event, func, text
+from sqlalchemy.orm.attributes import get_history
+from models import db, FavoriteCounts, Favorites, Characters, Planets, Starships
+from utils import dialect_insert
+
+# favorite column -> model counted in favorite_counts (kind is the model's table name)
+COUNTED = (
+    ("characters_id", Characters),
+    ("planets_id", Planets),
+    ("starships_id", Starships),
+)
+
+POPULAR_MODELS = {model.__tablename__: model for column, model in COUNTED}
+
+def count_changes(favorites):
+    """Counter of (kind, entity_id) for favorite rows that have the three entity columns."""
+    changes = Counter()
+    for favorite in favorites:
+        for column, model in COUNTED:
+            entity_id = getattr(favorite, column)
+            if entity_id is not None:
+                changes[(model.__tablename__, entity_id)] += 1
+    return changes
+
+def increment_counts(changes):
+    """Adds changes to favorite_counts with one upsert, in the caller's transaction."""
+    if not changes:
+        return
+    insert = dialect_insert(db.session)(FavoriteCounts.__table__)
+    statement = insert.on_conflict_do_update(
+        index_elements=["kind", "entity_id"],
+        set_={"count": FavoriteCounts.__table__.c.count + insert.excluded["count"]}
+    )
+    db.session.execute(statement, [
+        {"kind": kind, "entity_id": entity_id, "count": count}
+        for (kind, entity_id), count in changes.items()
+    ])
+
+def decrement_counts(changes):
+    """Subtracts changes from favorite_counts, in the caller's transaction."""
+    if not changes:
+        return
+    table = FavoriteCounts.__table__
+    statement = table.update().where(
+        table.c.kind == bindparam("b_kind"), table.c.entity_id == bindparam("b_entity_id")
+    ).values(count=table.c.count - bindparam("b_count"))
+    db.session.execute(statement, [
+        {"b_kind": kind, "b_entity_id": entity_id, "b_count": count}
+        for (kind, entity_id), count in changes.items()
+    ])
+
+# The favorites engine (favorites.py, bulk_delete.py) counts the rows its INSERT/DELETE ...
+# RETURNING statements report. Favorites added, edited or deleted as ORM objects (the admin,
+# the delete cascade of models.py) are counted here, when the session flushes them.
+
+def flushed_changes(session):
+    """(increments, decrements) of the Favorites objects of the flush in progress."""
+    increments, decrements = Counter(), Counter()
+    for instance in session.new:
+        if isinstance(instance, Favorites):
+            increments.update(count_changes([instance]))
+    for instance in session.deleted:
+        if isinstance(instance, Favorites):
+            decrements.update(count_changes([instance]))
+    for instance in session.dirty:
+        if isinstance(instance, Favorites):
+            for column, model in COUNTED:
+                history = get_history(instance, column)
+                decrements.update((model.__tablename__, entity_id) for entity_id in history.deleted if entity_id is not None)
+                increments.update((model.__tablename__, entity_id) for entity_id in history.added if entity_id is not None)
+    return increments, decrements
+
+def count_flush(session, flush_context):
+    increments, decrements = flushed_changes(session)
+    increment_counts(increments)
+    decrement_counts(decrements)
+    # the counters of deleted rows are 0 now, they go with the rows (as in bulk_delete.py)
+    for instance in session.deleted:
+        if isinstance(instance, tuple(POPULAR_MODELS.values())) and instance.id is not None:
+            session.execute(db.delete(FavoriteCounts).where(
+                FavoriteCounts.kind == instance.__tablename__, FavoriteCounts.entity_id == instance.id
+            ))
+
+event.listen(db.session, "after_flush", count_flush)
+
+def most_favorited(model, limit):
+    """[(serialized entity + "favorites": count), ...] for the `limit` most favorited rows of
+    model: a read of the top of ix_favorite_counts_kind_count plus one IN (...) query."""
+    counts = db.session.execute(
+        db.select(FavoriteCounts.entity_id, FavoriteCounts.count)
+        .where(FavoriteCounts.kind == model.__tablename__, FavoriteCounts.count > 0)
+        .order_by(FavoriteCounts.count.desc(), FavoriteCounts.entity_id)
+        .limit(limit)
+    ).all()
+    rows = db.session.query(*model.projection()).filter(model.id.in_([entity_id for entity_id, count in counts]))
+    entities = {row.id: model.serialize_row(row) for row in rows}
+    return [
+        dict(entities[entity_id], favorites=count)
+        for entity_id, count in counts if entity_id in entities
+    ]
+
+def rebuild_counts():
+    """Recomputes favorite_counts from the favorites table, in one transaction. Returns the
+    number of counters written."""
+    if db.session.get_bind().dialect.name == "postgresql":
+        # favorites added or removed while counting would be lost: hold the writes until
+        # the commit (SQLite does the same with its single writer lock)
+        db.session.execute(text("LOCK TABLE favorites IN SHARE MODE"))
+    db.session.execute(db.delete(FavoriteCounts))
+    written = 0
+    for column, model in COUNTED:
+        entity_column = getattr(Favorites, column)
+        rows = db.session.execute(
+            db.select(entity_column, func.count())
+            .where(entity_column.isnot(None))
+            .group_by(entity_column)
+        ).all()
+        if rows:
+            db.session.execute(db.insert(FavoriteCounts), [
+                {"kind": model.__tablename__, "entity_id": entity_id, "count": count}
+                for entity_id, count in rows
+            ])
+        written += len(rows)
+    db.session.commit()
+    return written
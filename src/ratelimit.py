@@ -0,0 +1,231 @@
+import os
+import math
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+from flask import request, jsonify
+from utils import client_keys
+from logs import log_event
+
+# Token bucket rate limits per route class, checked in a before_request hook: a request
+# takes a token from the bucket of its address and, with a valid token, from the bucket of
+# its JWT identity (utils.client_keys()). If either is empty it gets a 429 with Retry-After
+# before the view, i.e. before any database work.
+#
+# RATE_LIMIT          false turns the limits off
+# RATE_LIMITS         class=requests/period, e.g. "auth=10/minute,read=600/minute". A client
+#                     can send `requests` at once, then one more every period / requests.
+#                     A class that isn't listed has no limit.
+# RATE_LIMIT_STORAGE  where the buckets are, shared by the gunicorn workers:
+#                       unset                  SQLite file in /dev/shm (memory), one per host
+#                       sqlite:////path/to.db  SQLite file
+#                       redis://host:6379/0    redis server, shared by every host (needs redis)
+#                       memory://              per worker (limits multiplied by the workers)
+#                     or, through create_app(config), any object with the take() of the
+#                     classes below.
+# TRUSTED_PROXIES     proxies in front of the app (1 on Render), see utils.client_address()
+#
+# If the store fails, requests go through (logged as rate_limit_unavailable).
+
+DEFAULT_LIMITS = "auth=10/minute,heavy=30/minute,write=120/minute,read=600/minute"
+PERIODS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# endpoint -> route class. The others are "read" (GET, HEAD) or "write".
+ROUTE_CLASSES = {
+    "api.login": "auth",
+    "api.signup": "auth",
+    "api.export_table": "heavy",
+    "api.bulk_add_catalog": "heavy",
+    "api.add_new_job": "heavy",
+}
+EXEMPT_ENDPOINTS = {"metrics"}
+
+# a store that fails is logged once per interval, not once per request
+UNAVAILABLE_LOG_SECONDS = 60
+# idle buckets (full again, same as no bucket) are deleted every interval
+FORGET_SECONDS = 60
+
+def parse_limits(value):
+    """"read=600/minute,..." -> {"read": (tokens per second, bucket size)}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, limit = item.partition("=")
+        count, _, period = limit.partition("/")
+        try:
+            count = int(count)
+            seconds = PERIODS[period.strip()]
+        except (ValueError, KeyError):
+            raise RuntimeError("RATE_LIMITS: %r is not class=count/%s" % (item, "|".join(PERIODS)))
+        limits[name.strip()] = (count / seconds, count)
+    return limits
+
+def route_class():
+    route = ROUTE_CLASSES.get(request.endpoint)
+    if route is not None:
+        return route
+    return "read" if request.method in ("GET", "HEAD") else "write"
+
+def refill(tokens, updated_at, now, rate, capacity):
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+def retry_after(tokens, rate):
+    return (1 - tokens) / rate
+
+class MemoryBuckets:
+    """Buckets of one worker."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, capacity):
+        """Takes a token from the bucket of key: (True, 0), or (False, seconds until the next one)."""
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = refill(tokens, updated_at, now, rate, capacity)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+        return allowed, 0 if allowed else retry_after(tokens, rate)
+
+    def forget_idle(self, seconds):
+        before = time.time() - seconds
+        with self._lock:
+            for key in [key for key, (tokens, updated_at) in self._buckets.items() if updated_at < before]:
+                del self._buckets[key]
+
+# one statement, so one atomic transaction: the refill, the take and whether it was allowed
+TAKE_SQL = """
+INSERT INTO buckets (key, tokens, updated_at, allowed) VALUES (:key, :capacity - 1, :now, 1)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = min(:capacity, tokens + max(0, :now - updated_at) * :rate)
+             - (min(:capacity, tokens + max(0, :now - updated_at) * :rate) >= 1),
+    allowed = min(:capacity, tokens + max(0, :now - updated_at) * :rate) >= 1,
+    updated_at = max(updated_at, :now)
+RETURNING tokens, allowed
+"""
+
+class SQLiteBuckets:
+    """Buckets in a SQLite file, shared by the processes of a host. One connection per thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def connection(self):
+        # connections don't survive a fork: the gunicorn workers open their own
+        if getattr(self._local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=1, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, "
+                "updated_at REAL NOT NULL, allowed INTEGER NOT NULL) WITHOUT ROWID"
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def take(self, key, rate, capacity):
+        tokens, allowed = self.connection().execute(
+            TAKE_SQL, {"key": key, "rate": rate, "capacity": capacity, "now": time.time()}
+        ).fetchone()
+        return bool(allowed), 0 if allowed else retry_after(tokens, rate)
+
+    def forget_idle(self, seconds):
+        self.connection().execute("DELETE FROM buckets WHERE updated_at < ?", (time.time() - seconds,))
+
+# KEYS[1] bucket, ARGV rate and capacity. The clock is the server's: the same for every host.
+TAKE_LUA = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rate, capacity = tonumber(ARGV[1]), tonumber(ARGV[2])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+class RedisBuckets:
+    """Buckets in redis, shared by every host. Idle ones expire."""
+
+    def __init__(self, client, prefix="swapi:bucket:"):
+        self.prefix = prefix
+        self._take = client.register_script(TAKE_LUA)
+
+    def take(self, key, rate, capacity):
+        allowed, tokens = self._take(keys=[self.prefix + key], args=[rate, capacity])
+        return bool(allowed), 0 if allowed else retry_after(float(tokens), rate)
+
+def default_storage_path():
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "swapi-ratelimit.db")
+
+def make_buckets(storage):
+    if not isinstance(storage, str):
+        return storage
+    if not storage:
+        return SQLiteBuckets(default_storage_path())
+    if storage == "memory://":
+        return MemoryBuckets()
+    if storage.startswith("sqlite:///"):
+        return SQLiteBuckets(storage[len("sqlite:///"):])
+    if storage.startswith(("redis://", "rediss://", "unix://")):
+        import redis
+        return RedisBuckets(redis.Redis.from_url(storage))
+    raise RuntimeError("RATE_LIMIT_STORAGE must be sqlite:///..., redis://... or memory://, not " + storage)
+
+def too_many_requests(seconds):
+    response = jsonify({"msg": "too many requests, retry in %d s" % seconds})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(seconds)
+    return response
+
+def setup_rate_limits(app):
+    if not app.config['RATE_LIMIT']:
+        return
+    limits = parse_limits(app.config['RATE_LIMITS'])
+    buckets = make_buckets(app.config['RATE_LIMIT_STORAGE'])
+    app.extensions["rate_limits"] = buckets
+    # bucket sizes / rates: the time after which an idle bucket is full again
+    idle_seconds = max([capacity / rate for rate, capacity in limits.values()] or [0])
+    state = {"logged_at": 0.0, "forgotten_at": time.monotonic()}
+
+    @app.before_request
+    def check_rate_limit():
+        if request.method == "OPTIONS" or request.endpoint in EXEMPT_ENDPOINTS:
+            return None
+        route = route_class()
+        if route not in limits:
+            return None
+        rate, capacity = limits[route]
+        try:
+            for key in client_keys():
+                allowed, seconds = buckets.take("%s:%s" % (route, key), rate, capacity)
+                if not allowed:
+                    break
+            now = time.monotonic()
+            if hasattr(buckets, "forget_idle") and now - state["forgotten_at"] >= FORGET_SECONDS:
+                state["forgotten_at"] = now
+                buckets.forget_idle(idle_seconds)
+        except Exception as error:
+            now = time.monotonic()
+            if now - state["logged_at"] >= UNAVAILABLE_LOG_SECONDS:
+                state["logged_at"] = now
+                log_event("rate_limit_unavailable", level=logging.WARNING, error=repr(error))
+            return None
+        if not allowed:
+            return too_many_requests(max(1, math.ceil(seconds)))
+        return None
@@ -0,0 +1,127 @@
+import os
+import time
+import itertools
+import logging
+from flask import g, request, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.sql.dml import UpdateBase
+from cache import make_cache
+from utils import database_engine_options, client_key
+from logs import log_event
+
+# Read replicas (DATABASE_REPLICA_URLS, comma separated). GET and HEAD requests read from one
+# replica, picked round-robin per request; everything else uses the primary (DATABASE_URL):
+#   - POST/PUT/DELETE requests, the admin, the CLI and the async read path (async_api.py)
+#   - the rest of a request once its session flushed or sent an INSERT/UPDATE/DELETE
+#   - the GETs of a client that wrote in the last REPLICA_LAG_SECONDS (read-your-writes),
+#     clients being told apart by utils.client_key(): JWT identity, else address. Set
+#     CACHE_URL so that every worker knows about the writes of the others.
+# A replica that fails a query, or the health check run every REPLICA_CHECK_SECONDS (on
+# Postgres: replaying more than REPLICA_LAG_SECONDS behind), is left out for
+# REPLICA_EJECT_SECONDS. Without a healthy replica the reads go to the primary.
+
+class Replica:
+    def __init__(self, url, config):
+        self.engine = create_engine(url, **database_engine_options(url))
+        self.name = self.engine.url.render_as_string(hide_password=True)
+        self.config = config
+        self.ejected_until = 0.0
+        self.checked_at = 0.0
+        event.listen(self.engine, "handle_error", self.on_error)
+
+    def on_error(self, context):
+        dbapi = context.dialect.loaded_dbapi
+        if context.is_disconnect or isinstance(context.original_exception, dbapi.OperationalError):
+            self.eject(context.original_exception)
+
+    def eject(self, error):
+        self.ejected_until = time.monotonic() + self.config["REPLICA_EJECT_SECONDS"]
+        log_event("replica_ejected", level=logging.WARNING, replica=self.name, error=str(error))
+
+    def check(self):
+        with self.engine.connect() as connection:
+            if connection.dialect.name != "postgresql":
+                connection.execute(text("SELECT 1"))
+                return
+            # 0 while the replica has replayed everything it received (an idle primary sends nothing)
+            lag = connection.scalar(text(
+                "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+            ))
+        if lag is not None and lag > self.config["REPLICA_LAG_SECONDS"]:
+            self.eject("replaying %.1f s behind the primary" % lag)
+
+    def available(self):
+        now = time.monotonic()
+        if now < self.ejected_until:
+            return False
+        if now - self.checked_at >= self.config["REPLICA_CHECK_SECONDS"]:
+            self.checked_at = now
+            try:
+                self.check()
+            except Exception as error:
+                # on_error has ejected it already for database errors
+                if time.monotonic() >= self.ejected_until:
+                    self.eject(error)
+        return time.monotonic() >= self.ejected_until
+
+class ReplicaSet:
+    def __init__(self, urls, config):
+        self.replicas = [Replica(url, config) for url in urls]
+        self.positions = itertools.count()
+        # client key -> 1 for REPLICA_LAG_SECONDS after each of its writes
+        self.recent_writers = make_cache(
+            url=os.getenv("CACHE_URL"),
+            maxsize=int(os.getenv("REPLICA_WRITERS_SIZE", 10000)),
+            ttl=config["REPLICA_LAG_SECONDS"],
+            prefix="swapi:writer:"
+        )
+
+    def pick(self):
+        """Next available replica, or None."""
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self.positions) % len(self.replicas)]
+            if replica.available():
+                return replica
+        return None
+
+    def dispose(self):
+        for replica in self.replicas:
+            replica.engine.dispose(close=False)
+
+class RoutingSession(Session):
+    """db.session: reads of a GET request go to the replica of the request (g.replica)."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_request_context() and g.get("replica") is not None:
+            if self._flushing or isinstance(clause, UpdateBase):
+                self.info["wrote"] = True
+            if not self.info.get("wrote"):
+                return g.replica.engine
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+def replica_cache_ttl():
+    """TTL for what a request caches from its reads: a replica read can be up to
+    REPLICA_LAG_SECONDS old, keep it no longer than that. None (the cache's TTL) otherwise."""
+    if has_request_context() and g.get("replica") is not None:
+        return g.replica.config["REPLICA_LAG_SECONDS"]
+    return None
+
+def setup_replicas(app):
+    urls = [url.strip().replace("postgres://", "postgresql://") for url in app.config["DATABASE_REPLICA_URLS"].split(",") if url.strip()]
+    if not urls:
+        return
+    replicas = ReplicaSet(urls, app.config)
+    app.extensions["replicas"] = replicas
+
+    @app.before_request
+    def route_reads():
+        if request.method in ("GET", "HEAD") and not replicas.recent_writers.get(client_key()):
+            g.replica = replicas.pick()
+
+    @app.after_request
+    def remember_writer(response):
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            replicas.recent_writers.set(client_key(), 1)
+        return response
@@ -0,0 +1,144 @@
+import re
+from flask import request, current_app
+from sqlalchemy import event, text
+from utils import APIException, request_limit
+from models import db
+
+# Name search over characters, planets and starships (/search?q=).
+#
+# SQLite: one FTS5 table, search_index, with the names of the three tables. Triggers on the
+# tables keep it in sync with every write (routes, bulk upserts, admin, raw SQL). Its rowid
+# is id * 3 + the table's position in SEARCH_TABLES, so a trigger updates one row by rowid.
+# Every word of q is a prefix ("ana sky" matches "Anakin Skywalker"), ranked by bm25.
+#
+# Ranking needs every match scored before the LIMIT applies, and a 2 letter prefix can match
+# a third of the catalog. Only the first SEARCH_CANDIDATES matches (in id order) are ranked,
+# which bounds the cost of the broad queries of the first keystrokes.
+#
+# Postgres: GIN indexes on to_tsvector('simple', name) (same prefix matching, ranked by
+# ts_rank) and on name gin_trgm_ops, which also finds q inside a word ("walker"). Postgres
+# maintains both indexes itself.
+#
+# Databases migrated with flask db upgrade get all of it from migration 7d3b5f9e1a24.
+# db.create_all() gets it from the after_create listener at the end of this file.
+
+SEARCH_TABLES = ("characters", "planets", "starships")
+
+WORD = re.compile(r"\w+", re.UNICODE)
+
+def sqlite_ddl():
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "name, kind UNINDEXED, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4')"
+    ]
+    for position, table in enumerate(SEARCH_TABLES):
+        rowid = "%%s.id * %d + %d" % (len(SEARCH_TABLES), position)
+        insert = "INSERT INTO search_index (rowid, name, kind) VALUES (%s, new.name, '%s');" % (rowid % "new", table)
+        delete = "DELETE FROM search_index WHERE rowid = %s;" % (rowid % "old")
+        statements += [
+            "CREATE TRIGGER IF NOT EXISTS %s_search_insert AFTER INSERT ON %s BEGIN %s END" % (table, table, insert),
+            "CREATE TRIGGER IF NOT EXISTS %s_search_update AFTER UPDATE OF name, id ON %s BEGIN %s %s END" % (table, table, delete, insert),
+            "CREATE TRIGGER IF NOT EXISTS %s_search_delete AFTER DELETE ON %s BEGIN %s END" % (table, table, delete),
+            "INSERT INTO search_index (rowid, name, kind) SELECT %s, name, '%s' FROM %s" % (rowid % table, table, table),
+        ]
+    return statements
+
+def postgresql_ddl():
+    statements = ["CREATE EXTENSION IF NOT EXISTS pg_trgm"]
+    for table in SEARCH_TABLES:
+        statements += [
+            "CREATE INDEX IF NOT EXISTS ix_%s_name_tsv ON %s USING gin (to_tsvector('simple', name))" % (table, table),
+            "CREATE INDEX IF NOT EXISTS ix_%s_name_trgm ON %s USING gin (name gin_trgm_ops)" % (table, table),
+        ]
+    return statements
+
+def create_search_index(target, connection, **kw):
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        # create_all() on an existing database: the index is already there and filled
+        exists = connection.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'search_index'")).first()
+        statements = [] if exists else sqlite_ddl()
+    elif dialect == "postgresql":
+        statements = postgresql_ddl()
+    else:
+        statements = []
+    for statement in statements:
+        connection.execute(text(statement))
+
+def drop_search_index(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        # the triggers go away with their tables
+        connection.execute(text("DROP TABLE IF EXISTS search_index"))
+
+event.listen(db.metadata, "after_create", create_search_index)
+event.listen(db.metadata, "after_drop", drop_search_index)
+
+def search_words(q):
+    words = WORD.findall(q.lower())
+    if not words or len("".join(words)) < current_app.config["SEARCH_MIN_LENGTH"]:
+        raise APIException("q needs at least %d letters or digits" % current_app.config["SEARCH_MIN_LENGTH"], status_code=400)
+    return words
+
+def search_kinds():
+    kinds = request.args.get("type")
+    if not kinds:
+        return SEARCH_TABLES
+    kinds = tuple(kind.strip() for kind in kinds.split(","))
+    unknown = [kind for kind in kinds if kind not in SEARCH_TABLES]
+    if unknown:
+        raise APIException("type must be one of: %s" % ", ".join(SEARCH_TABLES), status_code=400)
+    return kinds
+
+def sqlite_search(words, kinds, limit):
+    # bm25() is lower for better matches; the rowid encodes (id, table)
+    rows = db.session.execute(text(
+        "SELECT rowid, name, kind FROM ("
+        "SELECT rowid, name, kind, bm25(search_index) AS rank FROM search_index "
+        "WHERE search_index MATCH :query AND kind IN (%s) LIMIT :candidates"
+        ") ORDER BY rank, length(name) LIMIT :limit"
+        % ", ".join("'%s'" % kind for kind in kinds)
+    ), {
+        "query": " ".join('"%s"*' % word for word in words),
+        "candidates": current_app.config["SEARCH_CANDIDATES"],
+        "limit": limit,
+    })
+    return [
+        {"type": kind, "id": rowid // len(SEARCH_TABLES), "name": name}
+        for rowid, name, kind in rows
+    ]
+
+def postgresql_search(words, kinds, limit, q):
+    match = "to_tsvector('simple', name) @@ to_tsquery('simple', :query)"
+    if len(q) >= 3:
+        # the trigram index only serves patterns of 3 characters or more
+        match += " OR name ILIKE :pattern"
+    selects = [
+        "(SELECT '{table}' AS kind, id, name, "
+        "ts_rank(to_tsvector('simple', name), to_tsquery('simple', :query)) + similarity(name, :q) AS rank "
+        "FROM {table} WHERE {match} LIMIT :candidates)".format(table=table, match=match)
+        for table in kinds
+    ]
+    rows = db.session.execute(text(
+        "SELECT kind, id, name FROM (" + " UNION ALL ".join(selects) + ") AS matches "
+        "ORDER BY rank DESC, length(name) LIMIT :limit"
+    ), {
+        "query": " & ".join(word + ":*" for word in words),
+        "q": q,
+        "pattern": "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%",
+        "candidates": current_app.config["SEARCH_CANDIDATES"],
+        "limit": limit,
+    })
+    return [{"type": kind, "id": entity_id, "name": name} for kind, entity_id, name in rows]
+
+def search(q):
+    """Best matches of q first, at most ?limit (SEARCH_LIMIT_MAX) of them, optionally only
+    in ?type=planets,characters."""
+    words = search_words(q)
+    kinds = search_kinds()
+    limit = request_limit(current_app.config["SEARCH_LIMIT_DEFAULT"], current_app.config["SEARCH_LIMIT_MAX"])
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite_search(words, kinds, limit)
+    if dialect == "postgresql":
+        return postgresql_search(words, kinds, limit, q.strip())
+    raise APIException("search is not available on %s" % dialect, status_code=501)
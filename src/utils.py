@@ -1,4 +1,9 @@
-from flask import jsonify, url_for
+import os
+from flask import jsonify, url_for, request, g, current_app
+from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
+from sqlalchemy.dialects import postgresql, sqlite
 
 class APIException(Exception):
     status_code = 400
@@ -15,13 +20,96 @@ class APIException(Exception):
         rv['message'] = self.message
         return rv
 
+def env_flag(name, default):
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes")
+
+def database_engine_options(database_url):
+    """SQLALCHEMY_ENGINE_OPTIONS from the environment. Size the pool so that
+    workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays under the Postgres max_connections."""
+    options = {
+        "pool_pre_ping": env_flag("DB_POOL_PRE_PING", True),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", 1800)),
+    }
+    if database_url.startswith("sqlite"):
+        # one file, no server connections to size or to time out
+        return options
+
+    options["pool_size"] = int(os.getenv("DB_POOL_SIZE", 5))
+    options["max_overflow"] = int(os.getenv("DB_MAX_OVERFLOW", 10))
+    options["pool_timeout"] = int(os.getenv("DB_POOL_TIMEOUT", 30))
+    statement_timeout = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+    if database_url.startswith("postgresql") and statement_timeout > 0:
+        options["connect_args"] = {"options": "-c statement_timeout=%d" % statement_timeout}
+    return options
+
+def dialect_insert(session):
+    # INSERT ... ON CONFLICT is dialect specific (Postgres and SQLite 3.24+)
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise APIException("INSERT ... ON CONFLICT is not supported on " + dialect, status_code=501)
+
+def request_flag(name, default=False):
+    # ?name=true / 1 / yes in the query string
+    value = request.args.get(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes")
+
+def request_limit(default, maximum):
+    # ?limit=n, capped at maximum
+    limit = request.args.get("limit", default)
+    try:
+        limit = int(limit)
+    except (ValueError, TypeError):
+        raise APIException("limit must be an integer", status_code=400)
+    if limit < 1:
+        raise APIException("limit must be greater than 0", status_code=400)
+    return min(limit, maximum)
+
+def client_address():
+    # the remote address, or behind TRUSTED_PROXIES proxies (1 on Render) the address the
+    # outermost one received the request from, the last it appended to X-Forwarded-For
+    proxies = current_app.config['TRUSTED_PROXIES']
+    if proxies:
+        forwarded = [address.strip() for address in request.headers.get("X-Forwarded-For", "").split(",") if address.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.remote_addr
+
+def client_key():
+    # who is making the request, for the read-your-writes window of the replicas: the JWT
+    # identity, or the client's address without a valid token
+    if "client_key" not in g:
+        identity = None
+        # tokens come in the Authorization header (JWT_TOKEN_LOCATION's default): without
+        # one, skip the JWT extension, which raises and catches an exception to say so
+        if "Authorization" in request.headers:
+            try:
+                verify_jwt_in_request(optional=True)
+                identity = get_jwt_identity()
+            except (JWTExtendedException, PyJWTError):
+                pass
+        g.client_key = "user:%s" % identity if identity else "ip:%s" % client_address()
+    return g.client_key
+
+def client_keys():
+    # the rate limit buckets the request takes from: its address, and with a valid token its
+    # JWT identity too. A client can't skip the limit of its address by using several
+    # accounts, nor the limit of its account by using several addresses.
+    key = client_key()
+    address = "ip:%s" % client_address()
+    return [address] if key == address else [address, key]
+
 def has_no_empty_params(rule):
     defaults = rule.defaults if rule.defaults is not None else ()
     arguments = rule.arguments if rule.arguments is not None else ()
     return len(defaults) >= len(arguments)
 
 def generate_sitemap(app):
-    links = ['/admin/']
+    links = [] if app.config.get('ADMIN') == 'off' else ['/admin/']
     for rule in app.url_map.iter_rules():
         # Filter out rules we can't navigate to in a browser
         # and rules that require parameters
@@ -0,0 +1,91 @@
+import hashlib
+import functools
+from flask import request, current_app, make_response
+from sqlalchemy import event
+from compression import matching_etag
+from models import db, TableVersions
+from utils import dialect_insert
+
+# Strong ETags for the catalog reads (/all_planets, /planets/<id>, ...): a hash of the path,
+# the query string and the version of the table the response comes from. A client that sends
+# the ETag back in If-None-Match gets a 304 before any row is read or serialized.
+#
+# table_versions holds one counter per table of VERSIONED_TABLES. The session events below
+# bump it in the transaction of every write: the routes, the bulk loads and the admin alike,
+# including bulk statements (db.delete(...), Query.delete()). A version never names two
+# different contents. A reader takes the version before it reads the rows, so a write that
+# commits in between can only give the new rows the old tag: that client gets one full
+# response more than needed later, never a stale 304.
+
+VERSIONED_TABLES = {"user", "characters", "planets", "starships"}
+
+def written_tables(session):
+    return session.info.setdefault("written_tables", set())
+
+def record_flush(session, flush_context):
+    for instance in session.new | session.dirty | session.deleted:
+        table = getattr(instance, "__tablename__", None)
+        if table in VERSIONED_TABLES:
+            written_tables(session).add(table)
+
+def record_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None and table.name in VERSIONED_TABLES:
+            written_tables(orm_execute_state.session).add(table.name)
+
+def bump_versions(session):
+    # the objects still pending are flushed by the commit, after this event: flush them now
+    session.flush()
+    tables = session.info.pop("written_tables", None)
+    if not tables:
+        return
+    insert = dialect_insert(session)(TableVersions.__table__)
+    session.execute(
+        insert.on_conflict_do_update(
+            index_elements=["name"],
+            set_={"version": TableVersions.__table__.c.version + 1}
+        ),
+        [{"name": table, "version": 1} for table in sorted(tables)]
+    )
+
+def forget_writes(session, *args):
+    session.info.pop("written_tables", None)
+
+event.listen(db.session, "after_flush", record_flush)
+event.listen(db.session, "do_orm_execute", record_statement)
+event.listen(db.session, "before_commit", bump_versions)
+event.listen(db.session, "after_soft_rollback", forget_writes)
+
+def version_statement(model):
+    return db.select(TableVersions.version).where(TableVersions.name == model.__tablename__)
+
+def table_version(model):
+    return db.session.scalar(version_statement(model)) or 0
+
+def version_etag(version):
+    """ETag of the current request's response at this version of its table."""
+    tag = "%s?%s#%d" % (request.path, request.query_string.decode("latin-1"), version)
+    return hashlib.sha1(tag.encode("utf-8")).hexdigest()
+
+def not_modified(matched):
+    response = current_app.response_class(status=304)
+    response.set_etag(matched)
+    return response
+
+def versioned(model):
+    """Decorator of the read views of model: ETag on the 200 responses, 304 when the client
+    already has the current one."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = version_etag(table_version(model))
+            matched = matching_etag(etag)
+            if matched is not None:
+                return not_modified(matched)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,66 @@
+import os
+import sys
+import pytest
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+sys.path.insert(0, SRC_DIR)
+
+# read when the modules are imported: the caches use the in-memory stand-in for redis
+os.environ.setdefault("CACHE_URL", "local://")
+os.environ.setdefault("LOG_FILE", os.devnull)
+os.environ.setdefault("ADMIN", "off")
+os.environ.setdefault("METRICS", "false")
+os.environ.setdefault("RATE_LIMIT", "false")
+
+from app import create_app
+from models import db, User, Planets, Characters, Starships
+from entity_cache import entity_cache
+from identity import identity_cache
+
+def sqlite_url(path):
+    return "sqlite:///" + str(path)
+
+def make_app(database_path, **config):
+    """An app on its own SQLite file, with the tables created. Jobs are not run."""
+    app = create_app(dict({"SQLALCHEMY_DATABASE_URI": sqlite_url(database_path), "JOBS_THREADS": 0}, **config))
+    with app.app_context():
+        db.create_all()
+    return app
+
+def seed_catalog(app):
+    """One user, planet, character and starship, all with id 1."""
+    with app.app_context():
+        db.session.add_all([
+            User(first_name="Luke", last_name="Skywalker", email="luke@example.com", password="x"),
+            Planets(name="Tatooine", climate="arid", population=200000, orbital_period=304, rotation_period=23, diameter=10465),
+            Characters(name="Leia Organa", height=150, mass=49, hair_color="brown", eye_color="brown", gender="female", birth_year="19BBY"),
+            Starships(name="X-wing", manufacturer="Incom", crew=1, passengers=0, consumables="1 week", cost_in_credits=149999),
+        ])
+        db.session.commit()
+
+def add_planets(app, count, **fields):
+    """count planets named Planet 0..count-1 after the seeded ones, fields overriding the defaults."""
+    with app.app_context():
+        db.session.add_all([
+            Planets(**dict({"name": "Planet %d" % number, "climate": "temperate", "population": number * 1000,
+                            "orbital_period": 365, "rotation_period": 24, "diameter": 12000}, **fields))
+            for number in range(count)
+        ])
+        db.session.commit()
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    # the caches are module globals, shared by every app of the process
+    entity_cache.clear()
+    identity_cache.clear()
+    yield
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path / "api.db")
+    seed_catalog(app)
+    return app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
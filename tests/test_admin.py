@@ -0,0 +1,71 @@
+import pytest
+from models import db, User, Favorites, FavoriteCounts
+from favorites import add_favorites
+from popularity import rebuild_counts
+from conftest import make_app, seed_catalog
+
+# the admin writes through the ORM session (Flask-Admin's ModelViews), not through the API's
+# statements: what the API does on its writes has to hold for these too
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path / "api.db", ADMIN="lazy")
+    seed_catalog(app)
+    with app.app_context():
+        add_favorites(1, [("planet", 1), ("character", 1), ("starship", 1)])
+    return app
+
+def favorites(app):
+    with app.app_context():
+        return db.session.execute(
+            db.select(Favorites.user_id, Favorites.characters_id, Favorites.planets_id, Favorites.starships_id).order_by(Favorites.id)
+        ).all()
+
+def admin_delete(client, view, entity_id):
+    response = client.post("/admin/%s/delete/" % view, data={"id": str(entity_id)})
+    assert response.status_code == 302
+
+def test_deleting_a_catalog_row_deletes_its_favorites(app, client):
+    admin_delete(client, "planets", 1)
+    assert favorites(app) == [(1, 1, None, None), (1, None, None, 1)]
+
+def test_deleting_a_user_deletes_their_favorites(app, client):
+    admin_delete(client, "user", 1)
+    assert favorites(app) == []
+
+def counters(app):
+    with app.app_context():
+        return dict(((kind, entity_id), count) for kind, entity_id, count in db.session.execute(
+            db.select(FavoriteCounts.kind, FavoriteCounts.entity_id, FavoriteCounts.count).where(FavoriteCounts.count > 0)
+        ))
+
+def rebuilt_counters(app):
+    with app.app_context():
+        rebuild_counts()
+    return counters(app)
+
+def favorite_form(**ids):
+    return dict({"user_id": "1", "characters_id": "", "planets_id": "", "starships_id": ""}, **ids)
+
+def test_favorites_written_in_the_admin_are_counted(app, client):
+    with app.app_context():
+        db.session.add(User(first_name="Leia", last_name="Organa", email="leia@example.com", password="x"))
+        db.session.commit()
+    assert client.post("/admin/favorites/new/", data=favorite_form(user_id="2", planets_id="1")).status_code == 302
+    assert counters(app)[("planets", 1)] == 2
+    # the new favorite (id 4) moves from the planet to the starship
+    assert client.post("/admin/favorites/edit/?id=4", data=favorite_form(user_id="2", starships_id="1")).status_code == 302
+    assert counters(app)[("planets", 1)] == 1
+    assert counters(app)[("starships", 1)] == 2
+    admin_delete(client, "favorites", 1)
+    expected = {("characters", 1): 1, ("starships", 1): 2}
+    assert counters(app) == expected
+    assert rebuilt_counters(app) == expected
+
+@pytest.mark.parametrize("view", ["planets", "user"])
+def test_deletes_in_the_admin_keep_the_counters(app, client, view):
+    admin_delete(client, view, 1)
+    expected = counters(app)
+    assert expected == rebuilt_counters(app)
+    with app.app_context():
+        assert db.session.get(FavoriteCounts, ("planets", 1)) is None
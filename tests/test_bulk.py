@@ -0,0 +1,80 @@
+import json
+import pytest
+from models import db, Planets
+from conftest import make_app
+
+PLANET = {"name": "Hoth", "climate": "frozen", "population": 0, "orbital_period": 549, "rotation_period": 23, "diameter": 7200}
+
+def climates(app):
+    with app.app_context():
+        return dict(db.session.execute(db.select(Planets.name, Planets.climate)).all())
+
+def bulk(client, records, on_conflict):
+    response = client.post("/planets/bulk?on_conflict=" + on_conflict, json=records)
+    assert response.status_code == 200
+    results = response.json["results"]
+    accounted = sum(results[key] for key in ("inserted", "updated", "skipped", "collapsed", "failed", "invalid"))
+    assert accounted == results["received"]
+    return results
+
+# the same name three times in one chunk, and once more for a planet that exists
+RECORDS = [
+    dict(PLANET, climate="frozen"),
+    dict(PLANET, name="Tatooine", climate="dusty"),
+    dict(PLANET, climate="icy"),
+    dict(PLANET, climate="snowy"),
+]
+
+def test_duplicates_of_a_chunk_are_collapsed_into_the_last_for_updates(app, client):
+    results = bulk(client, RECORDS, "update")
+    assert (results["inserted"], results["updated"], results["skipped"], results["collapsed"]) == (1, 1, 0, 2)
+    assert results["chunks"][0]["duplicates"] == [{"index": 0, "written": 3}, {"index": 2, "written": 3}]
+    assert climates(app) == {"Tatooine": "dusty", "Hoth": "snowy"}
+
+def test_duplicates_of_a_chunk_are_collapsed_into_the_first_without_updates(app, client):
+    results = bulk(client, RECORDS, "nothing")
+    assert (results["inserted"], results["updated"], results["skipped"], results["collapsed"]) == (1, 0, 1, 2)
+    assert results["chunks"][0]["duplicates"] == [{"index": 2, "written": 0}, {"index": 3, "written": 0}]
+    assert climates(app) == {"Tatooine": "arid", "Hoth": "frozen"}
+
+@pytest.mark.parametrize("on_conflict", ["nothing", "update"])
+def test_names_of_different_chunks_are_not_collapsed(tmp_path, on_conflict):
+    app = make_app(tmp_path / "chunks.db", BULK_CHUNK_SIZE=1)
+    results = bulk(app.test_client(), [dict(PLANET, climate="frozen"), dict(PLANET, climate="icy")], on_conflict)
+    assert results["collapsed"] == 0
+    assert results["inserted"] == 1
+    assert results["updated" if on_conflict == "update" else "skipped"] == 1
+
+def test_existing_names_are_skipped_or_updated(app, client):
+    records = [dict(PLANET, name="Tatooine", climate="dusty"), PLANET]
+    results = bulk(client, records, "nothing")
+    assert (results["inserted"], results["skipped"]) == (1, 1)
+    results = bulk(client, records, "update")
+    assert (results["inserted"], results["updated"]) == (0, 2)
+    assert climates(app) == {"Tatooine": "dusty", "Hoth": "frozen"}
+
+def test_invalid_records_are_reported_by_index(app, client):
+    records = [PLANET, "Dagobah", dict(PLANET, name="Endor", population="many"), dict(PLANET, name=None)]
+    results = bulk(client, records, "nothing")
+    assert (results["inserted"], results["invalid"]) == (1, 3)
+    assert results["chunks"][0]["errors"] == [
+        {"index": 1, "error": "record is not a JSON object"},
+        {"index": 2, "error": "population must be an integer"},
+        {"index": 3, "error": "missing field: name"},
+    ]
+    assert climates(app) == {"Tatooine": "arid", "Hoth": "frozen"}
+
+def test_ndjson_body(app, client):
+    body = json.dumps(PLANET) + "\n\nnot json\n" + json.dumps(dict(PLANET, name="Endor")) + "\n"
+    response = client.post("/planets/bulk", data=body, content_type="application/x-ndjson")
+    assert response.status_code == 200
+    results = response.json["results"]
+    assert (results["received"], results["inserted"], results["invalid"]) == (3, 2, 1)
+    assert results["chunks"][0]["errors"] == [{"index": 1, "error": "record is not a JSON object"}]
+
+def test_body_that_is_not_an_array_is_rejected(client):
+    assert client.post("/planets/bulk", json=PLANET).status_code == 400
+
+def test_unknown_on_conflict_is_rejected(app, client):
+    assert client.post("/planets/bulk?on_conflict=replace", json=[PLANET]).status_code == 400
+    assert climates(app) == {"Tatooine": "arid"}
@@ -0,0 +1,41 @@
+import pytest
+from models import db, User, Planets, Favorites, FavoriteCounts
+from favorites import add_favorites
+
+# SQLite checks the foreign keys of the favorites (models.py): the deletes of users and
+# catalog rows have to take the favorites that reference them first
+
+@pytest.fixture
+def favorites(app):
+    with app.app_context():
+        db.session.add(User(first_name="Leia", last_name="Organa", email="leia@example.com", password="x"))
+        db.session.commit()
+        for user_id in (1, 2):
+            add_favorites(user_id, [("planet", 1), ("character", 1), ("starship", 1)])
+
+def planet_count(app):
+    with app.app_context():
+        return db.session.scalar(db.select(FavoriteCounts.count).where(FavoriteCounts.kind == "planets", FavoriteCounts.entity_id == 1))
+
+def test_delete_all_users_with_favorites(app, client, favorites):
+    response = client.delete("/users")
+    assert response.status_code == 200
+    assert response.json["msg"] == "ok, all users have been deleted"
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count()).select_from(User)) == 0
+        assert db.session.scalar(db.select(db.func.count()).select_from(Favorites)) == 0
+    assert planet_count(app) == 0
+
+def test_delete_user_with_favorites(app, client, favorites):
+    assert client.delete("/user", json={"email": "luke@example.com"}).status_code == 200
+    with app.app_context():
+        assert db.session.scalars(db.select(Favorites.user_id).distinct()).all() == [2]
+    assert planet_count(app) == 1
+
+def test_delete_planet_with_favorites(app, client, favorites):
+    assert client.delete("/planet", json={"name": "Tatooine"}).status_code == 200
+    with app.app_context():
+        assert db.session.get(Planets, 1) is None
+        assert db.session.scalar(db.select(db.func.count()).select_from(Favorites).where(Favorites.planets_id.is_not(None))) == 0
+        assert db.session.scalar(db.select(db.func.count()).select_from(Favorites)) == 4
+    assert planet_count(app) is None
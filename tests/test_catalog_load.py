@@ -0,0 +1,74 @@
+import json
+import pytest
+from models import db, Planets
+from catalog_load import parse_number
+
+SWAPI_PLANET = {"name": "Hoth", "climate": "frozen", "population": "unknown", "orbital_period": "549",
+                "rotation_period": "23", "diameter": "7,200", "terrain": "tundra", "url": "https://swapi.dev/api/planets/4/"}
+
+def planets(app):
+    with app.app_context():
+        return {planet.name: (planet.population, planet.diameter) for planet in db.session.scalars(db.select(Planets))}
+
+def load(app, *args):
+    return app.test_cli_runner().invoke(args=["catalog", "load", *map(str, args)])
+
+@pytest.mark.parametrize("value, number", [("1,358", 1358), ("78.2", 78), ("30-165", 165), ("unknown", None), ("n/a", None)])
+def test_parse_number(value, number):
+    assert parse_number(value) == number
+
+def test_load_a_swapi_page(app, tmp_path):
+    dump = tmp_path / "planets.json"
+    dump.write_text(json.dumps({"count": 2, "results": [SWAPI_PLANET, dict(SWAPI_PLANET, name="Tatooine", population="200000")]}))
+    result = load(app, dump, "--quiet")
+    assert result.exit_code == 0, result.output
+    assert "1 inserted, 0 updated, 1 skipped, 0 collapsed, 0 invalid, 0 failed" in result.output
+    assert planets(app) == {"Tatooine": (200000, 10465), "Hoth": (0, 7200)}
+
+def test_load_ndjson_with_updates(app, tmp_path):
+    dump = tmp_path / "dump.ndjson"
+    records = [SWAPI_PLANET, dict(SWAPI_PLANET, population="10"), "not an object", dict(SWAPI_PLANET, name="Tatooine", population="200,000", diameter="1")]
+    dump.write_text("".join(json.dumps(record) + "\n" for record in records))
+    result = load(app, dump, "--type", "planets", "--on-conflict", "update", "--quiet")
+    assert result.exit_code == 0, result.output
+    assert "1 inserted, 1 updated, 0 skipped, 1 collapsed, 1 invalid, 0 failed" in result.output
+    assert "record 2: record is not a JSON object" in result.output
+    assert planets(app) == {"Tatooine": (200000, 1), "Hoth": (10, 7200)}
+
+def test_unknown_numbers_can_skip_the_record(app, tmp_path):
+    dump = tmp_path / "planets.json"
+    dump.write_text(json.dumps([SWAPI_PLANET]))
+    result = load(app, dump, "--unknown", "skip", "--quiet")
+    assert "0 inserted" in result.output
+    assert "record 0: missing field: population" in result.output
+    assert planets(app) == {"Tatooine": (200000, 10465)}
+
+def test_rebuild_indexes(app, tmp_path):
+    dump = tmp_path / "planets.json"
+    dump.write_text(json.dumps([SWAPI_PLANET]))
+    result = load(app, dump, "--rebuild-indexes", "--quiet")
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        indexes = db.session.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'planets'")).scalars().all()
+    assert {index.name for index in Planets.__table__.indexes} <= set(indexes)
+
+def test_type_from_the_file_name_or_a_usage_error(app, tmp_path):
+    dump = tmp_path / "vehicles.json"
+    dump.write_text("[]")
+    result = load(app, dump)
+    assert result.exit_code == 2
+    assert "pass --type" in result.output
+
+def test_copy_needs_postgres(app, tmp_path):
+    dump = tmp_path / "planets.json"
+    dump.write_text("[]")
+    result = load(app, dump, "--method", "copy")
+    assert result.exit_code == 2
+    assert "COPY needs Postgres" in result.output
+
+def test_a_dump_that_is_not_a_list_is_an_error(app, tmp_path):
+    dump = tmp_path / "planets.json"
+    dump.write_text(json.dumps(SWAPI_PLANET))
+    result = load(app, dump)
+    assert result.exit_code == 1
+    assert "is not a JSON array nor a SWAPI page" in result.output
@@ -0,0 +1,129 @@
+import pytest
+import entity_cache as entity_cache_module
+from cache import LocalRedis, SharedCache
+from entity_cache import entity_cache, entity_key
+from models import User, Planets, Characters, Starships
+from conftest import make_app, seed_catalog
+
+PLANET = {"name": "Hoth", "climate": "frozen", "population": 0, "orbital_period": 549, "rotation_period": 23, "diameter": 7200}
+CHARACTER = {"name": "Han Solo", "height": 180, "mass": 80, "hair_color": "brown", "eye_color": "brown", "gender": "male", "birth_year": "29BBY"}
+STARSHIP = {"name": "Millennium Falcon", "manufacturer": "Corellian", "crew": 4, "passengers": 6, "consumables": "2 months", "cost_in_credits": 100000}
+USER = {"first_name": "Han", "last_name": "Solo", "email": "han@example.com", "password": "x"}
+
+DETAIL_PATHS = {User: "/user/%d", Planets: "/planets/%d", Characters: "/characters/%d", Starships: "/starships/%d"}
+LIST_PATHS = {User: "/all_users", Planets: "/all_planets", Characters: "/all_characters", Starships: "/all_starships"}
+
+def cached(model, entity_id):
+    return entity_cache.get(entity_key(model, entity_id))
+
+def warm(client, model, entity_id):
+    """Fills the detail entry of (model, entity_id) and returns the ETag of the model's list."""
+    assert client.get(DETAIL_PATHS[model] % entity_id).status_code == 200
+    assert cached(model, entity_id) is not None
+    return client.get(LIST_PATHS[model]).headers["ETag"]
+
+def assert_list_changed(client, model, etag):
+    # a client revalidating the list it had before the write gets the new one, not a 304
+    response = client.get(LIST_PATHS[model], headers={"If-None-Match": etag})
+    assert response.status_code in (200, 404)
+    assert response.headers.get("ETag") != etag
+
+# (model, route, request arguments, entity id the write changes, field checked afterwards)
+UPDATES = [
+    (Planets, "put", "/planet/1", {"name": "Tatooine", "climate": "desert", "population": 1}, "climate", "desert"),
+    (User, "put", "/user", {"name": "Anakin", "email": "luke@example.com", "password": "y"}, "first_name", "Anakin"),
+    (Planets, "post", "/planets/bulk?on_conflict=update", [dict(PLANET, name="Tatooine", climate="dusty")], "climate", "dusty"),
+    (Characters, "post", "/characters/bulk?on_conflict=update", [dict(CHARACTER, name="Leia Organa", mass=50)], "mass", 50),
+    (Starships, "post", "/starships/bulk?on_conflict=update", [dict(STARSHIP, name="X-wing", crew=2)], "crew", 2),
+]
+
+@pytest.mark.parametrize("model, method, path, body, field, value", UPDATES)
+def test_update_invalidates_detail_and_list(client, model, method, path, body, field, value):
+    etag = warm(client, model, 1)
+    assert getattr(client, method)(path, json=body).status_code == 200
+    assert cached(model, 1) is None
+    assert client.get(DETAIL_PATHS[model] % 1).json["results"][field] == value
+    assert_list_changed(client, model, etag)
+
+DELETES = [
+    (Planets, "/planet", {"name": "Tatooine"}),
+    (User, "/user", {"email": "luke@example.com"}),
+    (User, "/users", None),
+]
+
+@pytest.mark.parametrize("model, path, body", DELETES)
+def test_delete_invalidates_detail_and_list(client, model, path, body):
+    etag = warm(client, model, 1)
+    assert client.delete(path, json=body).status_code == 200
+    assert cached(model, 1) is None
+    assert client.get(DETAIL_PATHS[model] % 1).status_code == 404
+    assert_list_changed(client, model, etag)
+
+CREATES = [
+    (Planets, "/planet", PLANET, "name", "Hoth"),
+    (Characters, "/character", CHARACTER, "name", "Han Solo"),
+    (Starships, "/starship", STARSHIP, "name", "Millennium Falcon"),
+    (User, "/user", USER, "first_name", "Han"),
+]
+
+@pytest.mark.parametrize("model, path, body, field, value", CREATES)
+def test_create_invalidates_a_stale_entry_of_its_id(client, model, path, body, field, value):
+    # SQLite hands the id of a deleted last row out again: an entry cached for the old row
+    # must not be served for the new one
+    etag = client.get(LIST_PATHS[model]).headers["ETag"]
+    entity_cache.set(entity_key(model, 2), b'{"msg": "ok", "results": {"stale": true}}')
+    assert client.post(path, json=body).status_code == 200
+    assert cached(model, 2) is None
+    assert client.get(DETAIL_PATHS[model] % 2).json["results"][field] == value
+    assert_list_changed(client, model, etag)
+
+def test_workers_sharing_the_stand_in_see_each_others_invalidations(app, tmp_path, monkeypatch):
+    # two apps on the same database, each with its own SharedCache over one LocalRedis: the
+    # two gunicorn workers of a host with CACHE_URL pointing at the same redis
+    other_app = make_app(tmp_path / "api.db")
+    server = LocalRedis()
+    caches = {app: SharedCache(server, prefix="swapi:entity:"), other_app: SharedCache(server, prefix="swapi:entity:")}
+
+    def request(worker, method, path, **kwargs):
+        monkeypatch.setattr(entity_cache_module, "entity_cache", caches[worker])
+        return getattr(worker.test_client(), method)(path, **kwargs)
+
+    assert request(app, "get", "/planets/1").json["results"]["climate"] == "arid"
+    assert server.get("swapi:entity:planets:1") is not None
+    # the other worker reads the entry the first one cached
+    assert request(other_app, "get", "/planets/1").json["results"]["climate"] == "arid"
+    assert caches[other_app].hits == 1
+
+    assert request(other_app, "put", "/planet/1", json={"name": "Tatooine", "climate": "desert", "population": 1}).status_code == 200
+    assert server.get("swapi:entity:planets:1") is None
+    assert request(app, "get", "/planets/1").json["results"]["climate"] == "desert"
+
+# the admin writes through the ORM session too: the session events invalidate its writes
+ADMIN_EDITS = [
+    (Planets, "planets", dict(PLANET, name="Tatooine", climate="dusty"), "climate", "dusty"),
+    (Characters, "characters", dict(CHARACTER, name="Leia Organa", mass=50), "mass", 50),
+    (Starships, "starships", dict(STARSHIP, name="X-wing", crew=2), "crew", 2),
+    (User, "user", dict(USER, email="luke@example.com", first_name="Anakin"), "first_name", "Anakin"),
+]
+
+@pytest.fixture
+def admin_client(tmp_path):
+    app = make_app(tmp_path / "admin.db", ADMIN="lazy")
+    seed_catalog(app)
+    return app.test_client()
+
+@pytest.mark.parametrize("model, view, form, field, value", ADMIN_EDITS)
+def test_admin_edit_invalidates_detail_and_list(admin_client, model, view, form, field, value):
+    etag = warm(admin_client, model, 1)
+    assert admin_client.post("/admin/%s/edit/?id=1" % view, data=form).status_code == 302
+    assert cached(model, 1) is None
+    assert admin_client.get(DETAIL_PATHS[model] % 1).json["results"][field] == value
+    assert_list_changed(admin_client, model, etag)
+
+@pytest.mark.parametrize("model, view", [(Planets, "planets"), (Characters, "characters"), (Starships, "starships"), (User, "user")])
+def test_admin_delete_invalidates_detail_and_list(admin_client, model, view):
+    etag = warm(admin_client, model, 1)
+    assert admin_client.post("/admin/%s/delete/" % view, data={"id": "1"}).status_code == 302
+    assert cached(model, 1) is None
+    assert admin_client.get(DETAIL_PATHS[model] % 1).status_code == 404
+    assert_list_changed(admin_client, model, etag)
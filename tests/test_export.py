@@ -0,0 +1,51 @@
+import csv
+import json
+import pytest
+from conftest import make_app, seed_catalog, add_planets
+
+PLANET = {"name": "Hoth", "climate": "frozen", "population": 0, "orbital_period": 549, "rotation_period": 23, "diameter": 7200}
+
+@pytest.fixture
+def app(tmp_path):
+    # batches smaller than the table: the rows come from several fetches
+    app = make_app(tmp_path / "api.db", EXPORT_BATCH_SIZE=2)
+    seed_catalog(app)
+    add_planets(app, 4)
+    return app
+
+def test_ndjson_by_default(client):
+    response = client.get("/export/planets")
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    assert response.headers["Content-Disposition"] == "attachment; filename=planets.ndjson"
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row["id"] for row in rows] == [1, 2, 3, 4, 5]
+    assert rows[0] == {"id": 1, "name": "Tatooine", "climate": "arid", "population": 200000,
+                       "orbital_period": 304, "rotation_period": 23, "diameter": 10465}
+
+@pytest.mark.parametrize("headers, path", [({}, "/export/planets?format=csv"), ({"Accept": "text/csv"}, "/export/planets")])
+def test_csv(client, headers, path):
+    response = client.get(path, headers=headers)
+    assert response.mimetype == "text/csv"
+    rows = list(csv.reader(response.get_data(as_text=True).splitlines()))
+    assert rows[0] == ["id", "name", "climate", "population", "orbital_period", "rotation_period", "diameter"]
+    assert [row[1] for row in rows[1:]] == ["Tatooine", "Planet 0", "Planet 1", "Planet 2", "Planet 3"]
+
+def test_is_streamed(client):
+    response = client.get("/export/planets")
+    assert response.is_streamed
+    assert "Content-Encoding" not in response.headers
+
+def test_unknown_format_is_rejected(client):
+    assert client.get("/export/planets?format=xml").status_code == 400
+
+def test_etag_until_the_table_changes(client):
+    etag = client.get("/export/planets").headers["ETag"]
+    assert client.get("/export/planets", headers={"If-None-Match": etag}).status_code == 304
+    # the CSV of the same table is another representation
+    assert client.get("/export/planets?format=csv", headers={"If-None-Match": etag}).status_code == 200
+
+    assert client.post("/planet", json=PLANET).status_code == 200
+    response = client.get("/export/planets", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert json.loads(response.get_data(as_text=True).splitlines()[-1])["name"] == "Hoth"
@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import event
+from models import db
+from favorites import add_favorites
+from conftest import add_planets
+
+@pytest.fixture
+def token(client):
+    response = client.post("/login", json={"email": "luke@example.com", "password": "x"})
+    return {"Authorization": "Bearer " + response.json["access_token"]}
+
+def add(app, pairs):
+    with app.app_context():
+        add_favorites(1, pairs)
+
+def statements(app, client, path, headers):
+    """(response, number of SQL statements the request ran)"""
+    executed = []
+    with app.app_context():
+        engine = db.engine
+    listener = lambda *args: executed.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        response = client.get(path, headers=headers)
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return response, len(executed)
+
+def test_expand_returns_the_entities(app, client, token):
+    add(app, [("planet", 1), ("character", 1), ("starship", 1)])
+    results = client.get("/user/favorites?expand=true", headers=token).json["results"]
+    assert [result.get("planet", {}).get("name") for result in results] == ["Tatooine", None, None]
+    assert results[1]["character"]["name"] == "Leia Organa"
+    assert results[2]["starship"]["name"] == "X-wing"
+    assert results[0]["characters_id"] is None
+
+def test_without_expand_only_the_ids(app, client, token):
+    add(app, [("planet", 1)])
+    [result] = client.get("/user/favorites", headers=token).json["results"]
+    assert result["planets_id"] == 1
+    assert "planet" not in result
+
+def test_expand_runs_one_query_per_table_not_per_favorite(app, client, token):
+    add_planets(app, 10)
+    add(app, [("planet", 1), ("character", 1)])
+    # the first request of the token looks its user id up
+    client.get("/user/favorites", headers=token)
+    few, few_statements = statements(app, client, "/user/favorites?expand=true", token)
+    add(app, [("planet", planet_id) for planet_id in range(2, 12)])
+    many, many_statements = statements(app, client, "/user/favorites?expand=true", token)
+    assert len(many.json["results"]) == len(few.json["results"]) + 10
+    assert many_statements == few_statements
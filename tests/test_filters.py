@@ -0,0 +1,47 @@
+import pytest
+from conftest import add_planets
+
+def names(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    return [planet["name"] for planet in response.json["results"]]
+
+def error(client, path):
+    response = client.get(path)
+    assert response.status_code == 400
+    return response.json["message"]
+
+def test_equality(app, client):
+    add_planets(app, 2)
+    assert names(client, "/all_planets?climate=arid") == ["Tatooine"]
+    assert names(client, "/all_planets?climate=temperate&population=1000") == ["Planet 1"]
+
+def test_range(app, client):
+    add_planets(app, 4)
+    assert names(client, "/all_planets?population[gte]=1000&population[lt]=3000") == ["Planet 1", "Planet 2"]
+    assert names(client, "/all_planets?population[gt]=2000") == ["Tatooine", "Planet 3"]
+
+def test_order_by(app, client):
+    add_planets(app, 3)
+    assert names(client, "/all_planets?order_by=population:desc") == ["Tatooine", "Planet 2", "Planet 1", "Planet 0"]
+    assert names(client, "/all_planets?order_by=population&population[lte]=1000") == ["Planet 0", "Planet 1"]
+
+def test_arguments_that_are_not_fields_are_ignored(client):
+    assert names(client, "/all_planets?terrain=desert&utm_source=x") == ["Tatooine"]
+
+@pytest.mark.parametrize("path", [
+    "/all_planets?id=1",
+    "/all_characters?birth_year=19BBY",
+    "/all_planets?order_by=id_card",
+])
+def test_fields_without_an_index_are_rejected(client, path):
+    assert error(client, path).startswith("cannot filter or sort on")
+
+def test_unknown_operator_is_rejected(client):
+    assert error(client, "/all_planets?population[ne]=0").startswith("unknown operator ne")
+
+def test_value_of_the_wrong_type_is_rejected(client):
+    assert error(client, "/all_planets?population[gte]=many") == "population must be an integer"
+
+def test_unknown_direction_is_rejected(client):
+    assert error(client, "/all_planets?order_by=population:up") == "order_by direction must be asc or desc"
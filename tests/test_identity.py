@@ -0,0 +1,40 @@
+from models import db, Favorites
+from identity import identity_cache
+
+SIGNUP = {"first_name": "Han", "last_name": "Solo", "email": "han@example.com", "password": "x"}
+
+# SQLite hands the largest id out again once its row is deleted: a user signed up after Han
+# keeps the id of Han's second account new, like a Postgres sequence does
+
+def signup(client, **fields):
+    response = client.post("/signup", json=dict(SIGNUP, **fields))
+    assert response.status_code == 200
+    return {"Authorization": "Bearer " + response.json["access_token"]}
+
+def favorite_owners(app):
+    with app.app_context():
+        return db.session.scalars(db.select(Favorites.user_id)).all()
+
+def test_token_of_a_deleted_user_is_rejected_after_signing_up_again(app, client):
+    old_token = signup(client)
+    signup(client, email="leia@example.com")
+    assert client.get("/user/favorites", headers=old_token).status_code == 404
+    assert client.delete("/user", json={"email": SIGNUP["email"]}).status_code == 200
+    new_token = signup(client)
+
+    assert client.get("/user/favorites", headers=old_token).status_code == 401
+    assert client.post("/favorites/planet/1", headers=new_token).status_code == 200
+    assert favorite_owners(app) == [4]
+
+def test_stale_entry_of_another_worker_does_not_answer_for_the_new_user(app, client):
+    old_token = signup(client)
+    signup(client, email="leia@example.com")
+    assert client.get("/user/favorites", headers=old_token).status_code == 404
+    stale = dict(identity_cache._data)
+    assert client.delete("/user", json={"email": SIGNUP["email"]}).status_code == 200
+    # a worker that didn't handle the delete still has the deleted user's entry
+    identity_cache._data.update(stale)
+    new_token = signup(client)
+
+    assert client.post("/favorites/planet/1", headers=new_token).status_code == 200
+    assert favorite_owners(app) == [4]
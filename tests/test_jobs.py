@@ -0,0 +1,129 @@
+import json
+import pytest
+from datetime import timedelta
+from models import db, Jobs
+from jobs import submit_job, claim_job, fail_stale_jobs, utcnow
+from utils import APIException
+from conftest import make_app, seed_catalog
+
+PLANET = {"name": "Hoth", "climate": "frozen", "population": 0, "orbital_period": 549, "rotation_period": 23, "diameter": 7200}
+
+def planets(count):
+    return [dict(PLANET, name="Planet %d" % number) for number in range(count)]
+
+def queued_jobs(app):
+    with app.app_context():
+        return db.session.scalar(db.select(db.func.count()).select_from(Jobs))
+
+@pytest.fixture
+def app(tmp_path):
+    # no job threads: the jobs stay queued
+    app = make_app(tmp_path / "api.db", JOBS_MAX_RECORDS=3, JOBS_MAX_PARAMS_BYTES=2000)
+    seed_catalog(app)
+    return app
+
+def test_background_load_within_the_limits_is_queued(app, client):
+    response = client.post("/planets/bulk?background=true", json=planets(3))
+    assert response.status_code == 202
+    assert response.json["results"]["status"] == "queued"
+    assert queued_jobs(app) == 1
+
+@pytest.mark.parametrize("body, content_type", [
+    (json.dumps(planets(4)), "application/json"),
+    ("\n".join(json.dumps(planet) for planet in planets(4)), "application/x-ndjson"),
+])
+def test_background_load_over_the_record_limit_is_refused(app, client, body, content_type):
+    response = client.post("/planets/bulk?background=true", data=body, content_type=content_type)
+    assert response.status_code == 413
+    assert queued_jobs(app) == 0
+
+def test_background_load_over_the_size_limit_is_refused(app, client):
+    response = client.post("/planets/bulk?background=true", json=[dict(PLANET, climate="x" * 3000)])
+    assert response.status_code == 413
+    assert queued_jobs(app) == 0
+
+@pytest.mark.parametrize("params", [
+    {"table": "planets", "records": planets(4)},
+    {"table": "planets", "records": [], "padding": "x" * 3000},
+])
+def test_jobs_over_the_limits_are_refused(app, client, params):
+    assert client.post("/jobs", json={"kind": "bulk_load", "params": params}).status_code == 413
+    assert queued_jobs(app) == 0
+
+def test_params_over_the_size_limit_without_a_content_length(app):
+    # a chunked body has no Content-Length: the params are measured before they are stored
+    with app.test_request_context("/jobs", method="POST"):
+        with pytest.raises(APIException) as error:
+            submit_job("delete", {"table": "planets", "padding": "x" * 3000})
+    assert error.value.status_code == 413
+
+def submit(client, records):
+    response = client.post("/jobs", json={"kind": "bulk_load", "params": {"table": "planets", "records": records}})
+    assert response.status_code == 202
+    assert response.headers["Location"].endswith("/jobs/%d" % response.json["results"]["id"])
+    return response.json["results"]["id"]
+
+def claim(app):
+    with app.app_context(), db.engine.begin() as connection:
+        return claim_job(connection, "test:1")
+
+def run(app, job):
+    with app.app_context():
+        app.extensions["jobs"].run(*job)
+
+def job_status(client, job_id):
+    response = client.get("/jobs/%d" % job_id)
+    assert response.status_code == 200
+    return response.json["results"]
+
+def test_jobs_are_claimed_oldest_first(app, client):
+    first, second = submit(client, planets(1)), submit(client, planets(2))
+    assert claim(app).id == first
+    assert job_status(client, first)["status"] == "running"
+    assert claim(app).id == second
+    assert claim(app) is None
+
+def test_claimed_job_runs_to_its_result(app, client):
+    job_id = submit(client, planets(3))
+    run(app, claim(app))
+    job = job_status(client, job_id)
+    assert job["status"] == "succeeded"
+    assert (job["result"]["received"], job["result"]["inserted"]) == (3, 3)
+    assert job["progress"]["inserted"] == 3
+    assert job["finished_at"] is not None
+
+def test_cancelled_queued_job_is_never_claimed(app, client):
+    job_id = submit(client, planets(1))
+    response = client.delete("/jobs/%d" % job_id)
+    assert response.status_code == 200
+    assert response.json["results"]["status"] == "cancelled"
+    assert claim(app) is None
+
+def test_cancelled_running_job_stops_at_its_next_progress_report(app, client):
+    app.config["BULK_CHUNK_SIZE"] = 1
+    job_id = submit(client, planets(3))
+    job = claim(app)
+    response = client.delete("/jobs/%d" % job_id)
+    assert response.status_code == 202
+    assert response.json["results"]["cancel_requested"] is True
+    run(app, job)
+    assert job_status(client, job_id)["status"] == "cancelled"
+    # the first chunk was committed before the cancel was seen
+    assert job_status(client, job_id)["progress"]["inserted"] == 1
+
+def test_finished_job_cannot_be_cancelled(app, client):
+    job_id = submit(client, planets(1))
+    run(app, claim(app))
+    assert client.delete("/jobs/%d" % job_id).status_code == 409
+    assert client.delete("/jobs/%d" % (job_id + 1)).status_code == 404
+
+def test_running_job_without_heartbeats_is_failed(app, client):
+    stale_id, live_id = submit(client, planets(1)), submit(client, planets(1))
+    for job_id in (stale_id, live_id):
+        assert claim(app).id == job_id
+    with app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(db.update(Jobs).where(Jobs.id == stale_id).values(heartbeat_at=utcnow() - timedelta(seconds=120)))
+            assert fail_stale_jobs(connection, 60) == 1
+    assert job_status(client, stale_id)["status"] == "failed"
+    assert job_status(client, live_id)["status"] == "running"
@@ -0,0 +1,38 @@
+import json
+import logging
+import pytest
+from logs import JSONFormatter, event_logger
+
+class Lines(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.setFormatter(JSONFormatter())
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(json.loads(self.format(record)))
+
+@pytest.fixture
+def events(monkeypatch):
+    handler = Lines()
+    monkeypatch.setattr(event_logger, "level", logging.DEBUG)
+    event_logger.addHandler(handler)
+    yield handler.lines
+    event_logger.removeHandler(handler)
+
+@pytest.mark.parametrize("email, password, found, user_id", [
+    ("luke@example.com", "x", True, 1),
+    ("luke@example.com", "wrong", True, 1),
+    ("nobody@example.com", "x", False, None),
+])
+def test_login_logs_no_email(client, events, email, password, found, user_id):
+    client.post("/login", json={"email": email, "password": password})
+    [login] = [line for line in events if line["message"] == "login"]
+    assert (login["found"], login["user_id"]) == (found, user_id)
+    assert email not in json.dumps(events)
+
+def test_emails_are_redacted_at_any_depth():
+    record = logging.LogRecord("api.events", logging.INFO, __file__, 1, "user_added", None, None)
+    record.fields = {"body": {"email": "luke@example.com", "first_name": "Luke"}}
+    line = json.loads(JSONFormatter().format(record))
+    assert line["body"] == {"email": "[redacted]", "first_name": "Luke"}
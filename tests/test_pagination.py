@@ -0,0 +1,65 @@
+import pytest
+from pagination import encode_cursor
+from conftest import make_app, add_planets
+
+def walk(client, path):
+    """[(ids of the page), ...] following next_cursor from path to the last page."""
+    pages = []
+    separator = "&" if "?" in path else "?"
+    url = path
+    while True:
+        response = client.get(url)
+        assert response.status_code == 200
+        pages.append([planet["id"] for planet in response.json["results"]])
+        cursor = response.json["next_cursor"]
+        if cursor is None:
+            return pages
+        url = path + separator + "after=" + cursor
+
+def test_pages_follow_the_id_order_without_gaps(app, client):
+    add_planets(app, 6)
+    assert walk(client, "/all_planets?limit=3") == [[1, 2, 3], [4, 5, 6], [7]]
+
+def test_descending_id_order(app, client):
+    add_planets(app, 4)
+    assert walk(client, "/all_planets?limit=2&order_by=id:desc") == [[5, 4], [3, 2], [1]]
+
+def test_ties_of_the_sort_column_are_broken_by_id(app, client):
+    # every population is the same: only the id tells the rows apart across pages
+    add_planets(app, 5, population=10)
+    pages = walk(client, "/all_planets?limit=2&order_by=population")
+    assert pages == [[2, 3], [4, 5], [6, 1]]
+
+def test_last_page_has_no_cursor(client):
+    response = client.get("/all_planets?limit=1")
+    assert response.json["next_cursor"] is None
+    assert "total" not in response.json
+
+def test_total_is_counted_on_request(app, client):
+    add_planets(app, 3)
+    response = client.get("/all_planets?limit=2&total=true")
+    assert response.json["total"] == 4
+    assert len(response.json["results"]) == 2
+
+def test_page_size_is_capped(app, tmp_path):
+    app = make_app(tmp_path / "capped.db", PAGE_SIZE_MAX=2)
+    add_planets(app, 3)
+    assert len(app.test_client().get("/all_planets?limit=50").json["results"]) == 2
+
+@pytest.mark.parametrize("query", [
+    "after=not-a-cursor!",
+    "after=" + encode_cursor({"id": 1}),
+    "after=" + encode_cursor([1, 2]),
+    "order_by=population&after=" + encode_cursor([1]),
+    "limit=0",
+    "limit=ten",
+])
+def test_invalid_paging_arguments_are_rejected(client, query):
+    assert client.get("/all_planets?" + query).status_code == 400
+
+@pytest.mark.parametrize("path", ["/all_users", "/all_characters", "/all_starships"])
+def test_every_list_is_paginated(client, path):
+    response = client.get(path + "?limit=1")
+    assert response.status_code == 200
+    assert len(response.json["results"]) == 1
+    assert response.json["next_cursor"] is None
@@ -0,0 +1,47 @@
+import pytest
+from conftest import make_app, seed_catalog
+
+# 3 reads a minute: the 4th read from the same bucket is refused
+LIMITS = {"RATE_LIMIT": True, "RATE_LIMITS": "read=3/minute", "RATE_LIMIT_STORAGE": "memory://"}
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path / "api.db", **LIMITS)
+    seed_catalog(app)
+    return app
+
+def client_from(app, address):
+    client = app.test_client()
+    client.environ_base["REMOTE_ADDR"] = address
+    return client
+
+def token(client, email):
+    response = client.post("/signup", json={"first_name": "A", "last_name": "B", "email": email, "password": "x"})
+    assert response.status_code == 200
+    return {"Authorization": "Bearer " + response.json["access_token"]}
+
+def read(client, headers=None):
+    return client.get("/all_planets", headers=headers).status_code
+
+def test_tokens_used_from_one_address_share_its_limit(app):
+    client = client_from(app, "10.0.0.1")
+    first, second = token(client, "one@example.com"), token(client, "two@example.com")
+    assert [read(client, first), read(client, second), read(client, first)] == [200, 200, 200]
+    assert read(client, second) == 429
+    assert read(client) == 429
+    # another address has a bucket of its own
+    assert read(client_from(app, "10.0.0.2")) == 200
+
+def test_a_token_used_from_several_addresses_shares_its_limit(app):
+    headers = token(client_from(app, "10.0.0.1"), "one@example.com")
+    statuses = [read(client_from(app, "10.0.0.%d" % number), headers) for number in range(1, 5)]
+    assert statuses == [200, 200, 200, 429]
+    assert read(client_from(app, "10.0.0.4")) == 200
+
+def test_429_has_retry_after(app):
+    client = client_from(app, "10.0.0.1")
+    for _ in range(3):
+        assert read(client) == 200
+    response = client.get("/all_planets")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
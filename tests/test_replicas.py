@@ -0,0 +1,51 @@
+import sqlite3
+import pytest
+from models import db, Planets
+from conftest import make_app, seed_catalog, sqlite_url
+
+PLANET = {"name": "Hoth", "climate": "frozen", "population": 0, "orbital_period": 549, "rotation_period": 23, "diameter": 7200}
+
+# the replica is a file of its own that never receives the primary's writes: what a
+# response lists tells which database answered it
+
+def planet_names(response):
+    assert response.status_code == 200
+    return [planet["name"] for planet in response.json["results"]]
+
+def stored_names(path):
+    with sqlite3.connect(path) as connection:
+        return [name for name, in connection.execute("SELECT name FROM planets ORDER BY id")]
+
+@pytest.fixture
+def databases(tmp_path):
+    primary, replica = tmp_path / "primary.db", tmp_path / "replica.db"
+    replica_app = make_app(replica)
+    with replica_app.app_context():
+        db.session.add(Planets(**dict(PLANET, name="Dagobah", climate="murky")))
+        db.session.commit()
+    app = make_app(primary, DATABASE_REPLICA_URLS=sqlite_url(replica))
+    seed_catalog(app)
+    return app, primary, replica
+
+def test_reads_go_to_the_replica(databases):
+    app, primary, replica = databases
+    assert planet_names(app.test_client().get("/all_planets")) == ["Dagobah"]
+
+def test_writes_go_to_the_primary(databases):
+    app, primary, replica = databases
+    assert app.test_client().post("/planet", json=PLANET).status_code == 200
+    assert stored_names(primary) == ["Tatooine", "Hoth"]
+    assert stored_names(replica) == ["Dagobah"]
+
+def test_a_client_reads_its_writes_from_the_primary(databases):
+    app, primary, replica = databases
+    writer = app.test_client()
+    writer.environ_base["REMOTE_ADDR"] = "10.0.0.1"
+    reader = app.test_client()
+    reader.environ_base["REMOTE_ADDR"] = "10.0.0.2"
+    assert planet_names(writer.get("/all_planets")) == ["Dagobah"]
+
+    assert writer.post("/planet", json=PLANET).status_code == 200
+    assert planet_names(writer.get("/all_planets")) == ["Tatooine", "Hoth"]
+    # the other clients keep reading the replica
+    assert planet_names(reader.get("/all_planets")) == ["Dagobah"]
@@ -0,0 +1,54 @@
+import pytest
+from models import db, Characters, Planets
+
+CHARACTER = {"height": 172, "mass": 77, "hair_color": "blond", "eye_color": "blue", "gender": "male", "birth_year": "19BBY"}
+
+@pytest.fixture
+def catalog(app):
+    with app.app_context():
+        db.session.add_all([
+            Characters(name="Luke Skywalker", **CHARACTER),
+            Characters(name="Anakin Skywalker", **CHARACTER),
+            Characters(name="Padmé Amidala", **dict(CHARACTER, gender="female")),
+        ])
+        db.session.commit()
+
+def found(client, path):
+    response = client.get(path)
+    assert response.status_code == 200
+    return [(result["type"], result["id"], result["name"]) for result in response.json["results"]]
+
+def test_every_word_is_a_prefix(client, catalog):
+    assert found(client, "/search?q=sky") == [("characters", 2, "Luke Skywalker"), ("characters", 3, "Anakin Skywalker")]
+    assert found(client, "/search?q=ana sky") == [("characters", 3, "Anakin Skywalker")]
+    # on SQLite a word is only matched from its start
+    assert found(client, "/search?q=walker") == []
+
+def test_diacritics_are_ignored(client, catalog):
+    assert found(client, "/search?q=padme") == [("characters", 4, "Padmé Amidala")]
+
+def test_searches_every_table_or_the_requested_ones(client, catalog):
+    assert [kind for kind, _, _ in found(client, "/search?q=ta")] == ["planets"]
+    assert found(client, "/search?q=x-wing") == [("starships", 1, "X-wing")]
+    assert found(client, "/search?q=tatooine&type=characters,starships") == []
+
+def test_limit(client, catalog):
+    assert len(found(client, "/search?q=skywalker&limit=1")) == 1
+
+def test_index_follows_the_writes(app, client, catalog):
+    with app.app_context():
+        db.session.get(Planets, 1).name = "Jakku"
+        db.session.delete(db.session.get(Characters, 2))
+        db.session.commit()
+    assert found(client, "/search?q=tatooine") == []
+    assert found(client, "/search?q=jakku") == [("planets", 1, "Jakku")]
+    assert found(client, "/search?q=skywalker") == [("characters", 3, "Anakin Skywalker")]
+
+def test_bulk_loads_are_indexed(client):
+    planet = {"name": "Hoth", "climate": "frozen", "population": 0, "orbital_period": 549, "rotation_period": 23, "diameter": 7200}
+    assert client.post("/planets/bulk", json=[planet]).status_code == 200
+    assert found(client, "/search?q=hoth") == [("planets", 2, "Hoth")]
+
+@pytest.mark.parametrize("path", ["/search", "/search?q=a", "/search?q=--", "/search?q=luke&type=vehicles"])
+def test_bad_queries_are_rejected(client, path):
+    assert client.get(path).status_code == 400